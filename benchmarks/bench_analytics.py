@@ -0,0 +1,67 @@
+# benchmarks/bench_analytics.py
+"""
+Time the vectorized analytics engine on synthetic incident columns: daily
+bucketing (overall and per dimension), seasonal decomposition, trend
+forecast and z-score/MAD/EWMA anomaly scoring.
+
+    python -m benchmarks.bench_analytics --sizes 10000 1000000 10000000 --days 730
+
+The synthetic data has a weekly pattern, a slow upward trend and a few
+injected spike days; priority, category and assignment_group are drawn with
+skewed distributions.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from server import analytics, timeseries
+
+
+def synthetic_columns(rows: int, days: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    weekday = np.array([1.2, 1.3, 1.2, 1.1, 1.0, 0.5, 0.4])
+    weights = weekday[np.arange(days) % 7] * np.linspace(1.0, 1.5, days)
+    weights[rng.choice(days, size=max(1, days // 100), replace=False)] *= 4  # spikes
+    day = rng.choice(days, size=rows, p=weights / weights.sum()).astype(np.int64) + 19000
+    dimensions = {}
+    for name, groups in (("priority", 4), ("category", 20), ("assignment_group", 200)):
+        p = 1.0 / np.arange(1, groups + 1)
+        dimensions[name] = (rng.choice(groups, size=rows, p=p / p.sum()).astype(np.int32), [str(i) for i in range(groups)])
+    return {"day": day, "dimensions": dimensions}
+
+
+def _timed(label: str, fn, results: dict):
+    start = time.perf_counter()
+    value = fn()
+    results[label] = (time.perf_counter() - start) * 1000
+    return value
+
+
+def run(rows: int, days: int) -> dict:
+    columns = synthetic_columns(rows, days)
+    results = {}
+    _, _, counts = _timed("bucket", lambda: analytics.daily_series(columns), results)
+    _, _, grouped = _timed("bucket/group", lambda: analytics.daily_series(columns, "assignment_group"), results)
+    series = np.vstack([counts, grouped]).astype(np.float64)
+    _timed("decompose", lambda: timeseries.seasonal_decompose(series, 7), results)
+    _timed("forecast", lambda: analytics.forecast(series, 14, 7), results)
+    for method, scorer in timeseries.SCORERS.items():
+        _timed(method, lambda: scorer(series), results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--days", type=int, default=730)
+    args = parser.parse_args()
+
+    for rows in args.sizes:
+        results = run(rows, args.days)
+        timings = "  ".join(f"{label}={ms:8.2f}ms" for label, ms in results.items())
+        print(f"{rows:>10,} rows  total={sum(results.values()):9.2f}ms  {timings}")
+
+
+if __name__ == "__main__":
+    main()
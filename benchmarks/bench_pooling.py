@@ -0,0 +1,92 @@
+# benchmarks/bench_pooling.py
+"""
+Compare per-call latency of one-shot requests (a fresh connection per call)
+against the pooled keep-alive session in sn_client, using a local stub
+ServiceNow Table API.
+
+    python -m benchmarks.bench_pooling --calls 500 --handshake-ms 20
+
+--handshake-ms delays the first request on every new connection to stand in
+for the TCP+TLS setup cost of a real instance.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from config import SN_DEFAULT_INSTANCE
+from servicenow_client import instances, sn_client
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    handshake_delay = 0.0
+
+    def setup(self):
+        super().setup()
+        if self.handshake_delay:
+            time.sleep(self.handshake_delay)
+
+    def do_GET(self):
+        body = json.dumps({"result": {"sys_id": self.path.rsplit("/", 1)[-1], "name": "stub"}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _timed(fn, calls: int) -> list:
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _summary(label: str, samples: list) -> str:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"{label:<10} mean={statistics.mean(samples):7.3f}ms  p50={statistics.median(samples):7.3f}ms  p99={p99:7.3f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--handshake-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    _StubHandler.handshake_delay = args.handshake_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    instances.register(SN_DEFAULT_INSTANCE, base_url, username="bench", password="bench")
+
+    def unpooled(i):
+        response = requests.get(f"{base_url}/api/now/table/incident/{i}", auth=("bench", "bench"))
+        response.raise_for_status()
+        response.json()
+
+    def pooled(i):
+        sn_client.read_record("incident", str(i))
+
+    try:
+        print(_summary("unpooled", _timed(unpooled, args.calls)))
+        print(_summary("pooled", _timed(pooled, args.calls)))
+    finally:
+        sn_client.close_session()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# benchmarks/bench_tools.py
+"""
+Drive MCP tools (main.call_tool) and portal endpoints against the local
+ServiceNow emulator (benchmarks/emulator.py) at a fixed concurrency and
+report throughput and p50/p99 latency per tool.
+
+    python -m benchmarks.bench_tools --incidents 50000 --cis 10000 --calls 200 --concurrency 16 \\
+        --latency-ms 20 --output after.json --compare before.json
+
+Every tool runs `--calls` calls (after `--warmup` unmeasured ones) with
+arguments drawn from the seeded data, and starts with empty record caches.
+The data, the arguments, the emulator's delays and its 429s all derive from
+--seed, so runs with the same options are comparable; --output saves the
+results with the options used and --compare prints the change against a
+saved run. --rate-limit overrides SN_RATE_LIMIT for the run (the client's
+limiter otherwise caps throughput at SN_RATE_LIMIT requests/s), --no-cache
+turns the record cache off and --oauth authenticates with OAuth tokens
+issued by the emulator. Portal endpoints (--portal) are called in process
+through the ASGI app, without the background refresh task.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import subprocess
+import time
+
+import httpx
+
+from benchmarks import emulator as sn_emulator
+from config import SN_DEFAULT_INSTANCE
+from servicenow_client import instances, resilience, sn_client, sn_async
+
+
+def workloads(store: sn_emulator.Store, rng: random.Random) -> dict:
+    """
+    {tool name: arguments(rng)} for the benchmarked tools.
+    """
+    incidents = store.sample("incident", 1000, rng)
+    cis = store.sample("cmdb_ci", 1000, rng)
+    return {
+        "itsm_read_incident": lambda r: {"sys_id": r.choice(incidents)},
+        "itsm_create_incident": lambda r: {"short_description": f"bench {r.randrange(10 ** 6)}", "caller_id": "bench",
+                                           "priority": str(r.randint(1, 5))},
+        "cmdb_read_ci": lambda r: {"sys_id": r.choice(cis)},
+        "cmdb_query_ci": lambda r: {"query": f"sys_class_name={r.choice(['cmdb_ci_linux_server', 'cmdb_ci_win_server'])}"
+                                             f"^operational_status=1", "limit": 50},
+        "cmdb_traverse": lambda r: {"ci_sys_id": r.choice(cis), "max_depth": 3, "max_nodes": 200},
+        "report_generate_incident": lambda r: {"query": r.choice(["active=true", "priority=1", "category=network"]),
+                                               "trend_interval": "week", "trend_buckets": 12},
+        "analytics_predict_trends": lambda r: {"query": r.choice(["active=true", "priority<=2"]), "horizon": 7},
+    }
+
+
+PORTAL_ENDPOINTS = {
+    "GET /dashboard/incidents": lambda r: {"query": r.choice(["active=true", "priority=1"])},
+    "GET /dashboard/changes": lambda r: {"query": "active=true"},
+    "GET /metrics": lambda r: {},
+}
+
+
+def _percentile(samples: list, q: float) -> float:
+    # Nearest-rank percentile of sorted samples.
+    return samples[min(len(samples) - 1, max(0, int(round(q * len(samples))) - 1))]
+
+
+def summarize(samples: list, errors: int, elapsed: float) -> dict:
+    samples = sorted(samples)
+    calls = len(samples) + errors
+    return {
+        "calls": calls,
+        "errors": errors,
+        "throughput": round(calls / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(samples) / len(samples), 3) if samples else None,
+        "p50_ms": round(_percentile(samples, 0.5), 3) if samples else None,
+        "p99_ms": round(_percentile(samples, 0.99), 3) if samples else None,
+        "max_ms": round(samples[-1], 3) if samples else None,
+    }
+
+
+async def drive(call, arguments: list, concurrency: int) -> dict:
+    """
+    Run `await call(args)` for every entry of `arguments` with at most
+    `concurrency` in flight; returns summarize() of the latencies.
+    """
+    pending = iter(arguments)
+    samples, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for args in pending:
+            start = time.perf_counter()
+            try:
+                await call(args)
+            except Exception:
+                errors += 1
+            else:
+                samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, errors, time.perf_counter() - start)
+
+
+def _reset_caches() -> None:
+    for instance in instances.loaded():
+        for cache in instance.caches().values():
+            cache.clear()
+
+
+async def run(args: argparse.Namespace, store: sn_emulator.Store) -> dict:
+    import main  # registers every tool
+    try:
+        return await _run(args, store, main)
+    finally:
+        await sn_async.aclose()
+
+
+async def _run(args: argparse.Namespace, store: sn_emulator.Store, main) -> dict:
+    rng = random.Random(args.seed)
+    tools = workloads(store, rng)
+    selected = args.tools or list(tools)
+    results = {}
+    for name in selected:
+        make = tools[name]
+        _reset_caches()
+        await drive(lambda a: main.call_tool(name, a), [make(rng) for _ in range(args.warmup)], args.concurrency)
+        _reset_caches()
+        results[name] = await drive(lambda a: main.call_tool(name, a), [make(rng) for _ in range(args.calls)], args.concurrency)
+    if args.portal:
+        import portal
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=portal.app), base_url="http://portal") as client:
+            async def get(path: str, params: dict):
+                response = await client.get(path, params=params)
+                response.raise_for_status()
+            for name, make in PORTAL_ENDPOINTS.items():
+                path = name.split(" ", 1)[1]
+                await drive(lambda p: get(path, p), [make(rng) for _ in range(args.warmup)], args.concurrency)
+                results[name] = await drive(lambda p: get(path, p), [make(rng) for _ in range(args.calls)], args.concurrency)
+    return results
+
+
+def _environment() -> dict:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "revision": revision or None}
+
+
+def _report(results: dict, baseline: dict = None) -> None:
+    print(f"{'tool':<34}{'calls':>7}{'errors':>7}{'calls/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, figures in results.items():
+        line = (f"{name:<34}{figures['calls']:>7}{figures['errors']:>7}{figures['throughput']:>10.1f}"
+                f"{figures['p50_ms'] or 0:>10.2f}{figures['p99_ms'] or 0:>10.2f}")
+        before = (baseline or {}).get(name)
+        if before:
+            changes = [f"{label} {_change(before[key], figures[key])}" for label, key in
+                       (("calls/s", "throughput"), ("p50", "p50_ms"), ("p99", "p99_ms"))]
+            line += "   vs baseline: " + ", ".join(changes)
+        print(line)
+
+
+def _change(before: float, after: float) -> str:
+    if not before or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sn_emulator.add_arguments(parser)
+    parser.add_argument("--calls", type=int, default=100, help="measured calls per tool")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tools", nargs="+", help="tools to run (default: all)")
+    parser.add_argument("--portal", action="store_true", help="also benchmark the portal endpoints")
+    parser.add_argument("--rate-limit", type=float, help="client requests/s per instance (default: SN_RATE_LIMIT)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the record cache")
+    parser.add_argument("--oauth", action="store_true", help="authenticate with emulator-issued OAuth tokens")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per request otherwise
+    emulator, counts = sn_emulator.from_arguments(args)
+    base_url = emulator.start()
+    credentials = ({"auth_method": "oauth", "client_id": "bench", "client_secret": "bench"} if args.oauth
+                   else {"username": "bench", "password": "bench"})
+    instance = instances.register(SN_DEFAULT_INSTANCE, base_url, **credentials)
+    if args.rate_limit:
+        resilience.guard_for(instance.url, instance.principal).limiter = resilience.TokenBucket(
+            args.rate_limit, max(1, int(args.rate_limit * 2)))
+    if args.no_cache:
+        instance.cache.enabled = False
+    print(f"emulator {base_url}: {counts}")
+
+    try:
+        results = asyncio.run(run(args, emulator.store))
+    finally:
+        sn_client.close_session()
+        emulator.stop()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    _report(results, baseline)
+    print(f"emulator: {emulator.stats()}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"options": vars(args), "environment": _environment(), "data": counts,
+                       "emulator": emulator.stats(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+# benchmarks/emulator.py
+"""
+Local emulator of the ServiceNow REST endpoints sn_client and sn_async use:
+the Table API (/api/now/table), the Aggregate API (/api/now/stats), the
+Batch API (/api/now/v1/batch) and the OAuth token endpoint (/oauth_token.do).
+Records live in an in-memory SQLite database seeded with synthetic
+incident, change_request, cmdb_ci and cmdb_rel_ci rows; encoded queries are
+evaluated with the replica's query compiler, so the emulator supports the
+same operators as the local replica.
+
+    python -m benchmarks.emulator --port 8080 --incidents 100000 --cis 20000 --latency-ms 30 --throttle 0.02
+
+Point SN_INSTANCE_URL (or an SN_INSTANCES entry) at the printed URL. Basic
+auth with any credentials is accepted, and so is a Bearer token issued by
+the emulator's /oauth_token.do for any client; a missing or expired token
+gets 401. --latency-ms/--jitter-ms delay every response and --throttle
+answers that fraction of requests with 429 and a Retry-After header. Latency,
+throttling and the seeded data all come from --seed, so two runs with the
+same arguments see the same data and the same sequence of delays and 429s.
+display_value is not emulated: values are always returned raw.
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from servicenow_client.replica import compile_query
+
+
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_NAME = re.compile(r"^[a-z0-9_]+$")
+_ROUTE = re.compile(r"^/api/now/(?:v\d+/)?(table|stats)/([a-z0-9_]+)(?:/([A-Za-z0-9_]+))?$")
+
+# Reference fields per table, returned as {"link", "value"} unless
+# sysparm_exclude_reference_link=true, as the instance does.
+REFERENCES = {
+    "incident": {"assignment_group": "sys_user_group", "caller_id": "sys_user", "cmdb_ci": "cmdb_ci"},
+    "change_request": {"assignment_group": "sys_user_group", "cmdb_ci": "cmdb_ci"},
+    "cmdb_rel_ci": {"parent": "cmdb_ci", "child": "cmdb_ci", "type": "cmdb_rel_type"},
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime(_TIME_FORMAT)
+
+
+class Store:
+    """
+    Records keyed by table and sys_id in one in-memory SQLite database.
+    """
+    def __init__(self):
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    def _table(self, table: str) -> str:
+        if not _NAME.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+        if table not in self._tables:
+            self._db.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (sys_id TEXT PRIMARY KEY, data TEXT)')
+            self._tables.add(table)
+        return f'"{table}"'
+
+    def insert_many(self, table: str, records: list) -> None:
+        with self._lock:
+            self._db.executemany(f"INSERT OR REPLACE INTO {self._table(table)} VALUES (?, ?)",
+                                 [(record["sys_id"], json.dumps(record)) for record in records])
+
+    def get(self, table: str, sys_id: str) -> dict:
+        with self._lock:
+            row = self._db.execute(f"SELECT data FROM {self._table(table)} WHERE sys_id = ?", (sys_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def select(self, table: str, query: str = "", limit: int = None, offset: int = 0) -> list:
+        where, params, order = compile_query(query)
+        sql = f"SELECT data FROM {self._table(table)} WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._db.execute(sql, [*params, -1 if limit is None else limit, offset]).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def count(self, table: str) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self._table(table)}").fetchone()[0]
+
+    def sample(self, table: str, size: int, rng: random.Random) -> list:
+        """
+        `size` sys_ids of the table, drawn with `rng` (with replacement).
+        """
+        with self._lock:
+            ids = [sys_id for (sys_id,) in self._db.execute(f"SELECT sys_id FROM {self._table(table)} ORDER BY sys_id")]
+        return [rng.choice(ids) for _ in range(size)] if ids else []
+
+    def create(self, table: str, data: dict, sys_id: str) -> dict:
+        now = _now()
+        record = {**data, "sys_id": sys_id, "sys_created_on": now, "sys_updated_on": now}
+        self.insert_many(table, [record])
+        return record
+
+    def update(self, table: str, sys_id: str, data: dict) -> dict:
+        with self._lock:
+            row = self._db.execute(f"SELECT data FROM {self._table(table)} WHERE sys_id = ?", (sys_id,)).fetchone()
+            if row is None:
+                return None
+            record = {**json.loads(row[0]), **data, "sys_id": sys_id, "sys_updated_on": _now()}
+            self._db.execute(f"UPDATE {self._table(table)} SET data = ? WHERE sys_id = ?", (json.dumps(record), sys_id))
+        return record
+
+    def delete(self, table: str, sys_id: str) -> bool:
+        with self._lock:
+            return self._db.execute(f"DELETE FROM {self._table(table)} WHERE sys_id = ?", (sys_id,)).rowcount > 0
+
+    def aggregate(self, table: str, query: str = "", group_by: list = (), count: bool = True,
+                  functions: dict = None) -> list:
+        """
+        Aggregate API rows: [{"stats": {...}, "groupby_fields": [...]}], one per group.
+        functions: {"avg": [field, ...], "min": [...], "max": [...], "sum": [...]}.
+        """
+        where, params, _ = compile_query(query)
+        for field in [*group_by, *(field for fields in (functions or {}).values() for field in fields)]:
+            if not _NAME.match(field):
+                raise ValueError(f"Invalid field name: {field}")
+        columns = [f"COALESCE(json_extract(data, '$.{field}'), '')" for field in group_by]
+        measures = [("count", None, "COUNT(*)")] if count else []
+        for function, fields in (functions or {}).items():
+            measures += [(function, field, f"{function.upper()}(CAST(json_extract(data, '$.{field}') AS REAL))")
+                         for field in fields]
+        sql = f"SELECT {', '.join(columns + [sql for _, _, sql in measures]) or 'COUNT(*)'} FROM {self._table(table)} WHERE {where}"
+        if columns:
+            sql += f" GROUP BY {', '.join(str(i + 1) for i in range(len(columns)))}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        result = []
+        for row in rows:
+            stats = {}
+            for (function, field, _), value in zip(measures, row[len(columns):]):
+                if field is None:
+                    stats["count"] = str(value)
+                else:
+                    stats.setdefault(function, {})[field] = "" if value is None else str(value)
+            groups = [{"field": field, "value": value} for field, value in zip(group_by, row[:len(columns)])]
+            result.append({"stats": stats, "groupby_fields": groups} if group_by else {"stats": stats})
+        return result
+
+
+def seed(store: Store, incidents: int = 10000, cis: int = 2000, relationships_per_ci: int = 2,
+         changes: int = 1000, groups: int = 50, days: int = 365, seed: int = 0) -> dict:
+    """
+    Fill the store with synthetic data. The same arguments produce the same
+    records; timestamps are spread over the `days` before today (UTC). Returns
+    the row count per table.
+    """
+    rng = random.Random(seed)
+    def sys_id() -> str:
+        return f"{rng.getrandbits(128):032x}"
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    def timestamp() -> str:
+        age = rng.random() ** 1.5 * days  # skewed towards recent dates
+        return (today - timedelta(days=age)).strftime(_TIME_FORMAT)
+
+    group_ids = [sys_id() for _ in range(groups)]
+    users = [sys_id() for _ in range(groups * 20)]
+    classes = ["cmdb_ci_linux_server", "cmdb_ci_win_server", "cmdb_ci_app_server", "cmdb_ci_db_instance", "cmdb_ci_service"]
+    ci_rows = []
+    for index in range(cis):
+        name = f"ci-{index:06d}" if rng.random() > 0.03 else f"CI-{rng.randrange(max(index, 1)):06d}"  # a few duplicates
+        updated = timestamp()
+        ci_rows.append({
+            "sys_id": sys_id(), "name": name, "sys_class_name": rng.choice(classes), "ci_type": "server",
+            "fqdn": f"{name.lower()}.example.com", "serial_number": f"SN{rng.randrange(cis * 10):08d}",
+            "mac_address": ":".join(f"{rng.randrange(256):02x}" for _ in range(6)),
+            "operational_status": rng.choice(["1", "1", "1", "2", "6"]),
+            "sys_created_on": updated, "sys_updated_on": updated,
+        })
+    # Relationships point from lower to higher CI indexes, so the graph is a DAG a few levels deep.
+    rel_rows = []
+    for index in range(cis - 1):
+        for _ in range(rng.randint(0, relationships_per_ci * 2)):
+            child = rng.randrange(index + 1, min(cis, index + 1 + max(cis // 10, 2)))
+            updated = timestamp()
+            rel_rows.append({"sys_id": sys_id(), "parent": ci_rows[index]["sys_id"], "child": ci_rows[child]["sys_id"],
+                             "type": "1a9cb166f1571100a92eb60da2bce5c5", "sys_created_on": updated, "sys_updated_on": updated})
+
+    def task(number: str) -> dict:
+        opened = timestamp()
+        active = rng.random() < 0.3
+        return {
+            "sys_id": sys_id(), "number": number, "short_description": f"Synthetic {number}",
+            "priority": str(rng.choices("12345", weights=[1, 4, 10, 20, 5])[0]),
+            "state": rng.choice(["1", "2", "3"]) if active else rng.choice(["6", "7"]),
+            "active": "true" if active else "false", "category": rng.choice(["software", "hardware", "network", "inquiry", "database"]),
+            "assignment_group": rng.choice(group_ids), "cmdb_ci": rng.choice(ci_rows)["sys_id"] if ci_rows else "",
+            "opened_at": opened, "sys_created_on": opened, "sys_updated_on": opened,
+        }
+    incident_rows = [{**task(f"INC{index:07d}"), "caller_id": rng.choice(users)} for index in range(incidents)]
+    change_rows = [{**task(f"CHG{index:07d}"), "type": rng.choice(["normal", "standard", "emergency"])} for index in range(changes)]
+    tables = {"cmdb_ci": ci_rows, "cmdb_rel_ci": rel_rows, "incident": incident_rows, "change_request": change_rows}
+    for table, rows in tables.items():
+        store.insert_many(table, rows)
+    return {table: len(rows) for table, rows in tables.items()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method: str) -> None:
+        emulator = self.server.emulator
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {}
+        delay, throttled = emulator.admit()
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            status, payload = 429, _error("Rate limit exceeded")
+            headers["Retry-After"] = str(emulator.retry_after)
+        elif self.path.split("?")[0] == "/oauth_token.do":
+            status, payload = emulator.token(method, parse_qs(body.decode()))
+        elif not emulator.authorized(self.headers.get("Authorization")):
+            status, payload = 401, _error("User Not Authenticated")
+        else:
+            status, payload = emulator.route(method, self.path, body, f"http://{self.headers.get('Host')}")
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _error(message: str, detail: str = "") -> dict:
+    return {"error": {"message": message, "detail": detail}, "status": "failure"}
+
+
+def _param(params: dict, name: str, default: str = None) -> str:
+    return params.get(name, [default])[0]
+
+
+class Emulator:
+    def __init__(self, store: Store, latency_ms: float = 0.0, jitter_ms: float = 0.0, throttle: float = 0.0,
+                 retry_after: int = 1, token_ttl: int = 1800, seed: int = 0):
+        self.store = store
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self._rng = random.Random(seed)
+        self._tokens = {}         # access token -> expires_at
+        self._refresh_tokens = set()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(("requests", "throttled", "unauthorized", "tokens_issued", "batch_operations"), 0)
+        self._server = None
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def admit(self) -> tuple:
+        # (delay in seconds, whether to answer 429), from the seeded sequence.
+        with self._lock:
+            self._counters["requests"] += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            throttled = self.throttle > 0 and self._rng.random() < self.throttle
+            self._counters["throttled"] += throttled
+        return delay, throttled
+
+    def authorized(self, header: str) -> bool:
+        if header and header.startswith("Basic "):
+            return True
+        if header and header.startswith("Bearer "):
+            with self._lock:
+                expires = self._tokens.get(header[len("Bearer "):])
+            if expires is not None and expires > time.time():
+                return True
+        self._count("unauthorized")
+        return False
+
+    def token(self, method: str, form: dict) -> tuple:
+        grant = _param(form, "grant_type")
+        if method != "POST" or grant not in ("client_credentials", "password", "refresh_token"):
+            return 400, {"error": "unsupported_grant_type"}
+        with self._lock:
+            if grant == "refresh_token":
+                refresh = _param(form, "refresh_token")
+                if refresh not in self._refresh_tokens:
+                    return 401, {"error": "invalid_grant", "error_description": "refresh token is not valid"}
+                self._refresh_tokens.discard(refresh)
+            access, refresh = secrets.token_urlsafe(24), secrets.token_urlsafe(24)
+            self._tokens[access] = time.time() + self.token_ttl
+            self._refresh_tokens.add(refresh)
+            self._counters["tokens_issued"] += 1
+        return 200, {"access_token": access, "refresh_token": refresh, "scope": "useraccount",
+                     "token_type": "Bearer", "expires_in": self.token_ttl}
+
+    def route(self, method: str, url: str, body: bytes, base_url: str) -> tuple:
+        """
+        (status, JSON payload or None) for one Table/Aggregate/Batch API call.
+        """
+        parts = urlsplit(url)
+        params = parse_qs(parts.query)
+        try:
+            data = json.loads(body) if body else {}
+            if parts.path == "/api/now/v1/batch" and method == "POST":
+                return 200, self._batch(data, base_url)
+            match = _ROUTE.match(parts.path)
+            if match is None:
+                return 400, _error("Requested URI does not represent any resource", parts.path)
+            api, table, sys_id = match.groups()
+            if api == "stats":
+                return self._stats(table, params) if method == "GET" else (405, _error("Method not allowed"))
+            return self._table(method, table, sys_id, params, data, base_url)
+        except ValueError as e:  # unsupported query, invalid JSON
+            return 400, _error("Invalid request", str(e))
+
+    def _table(self, method: str, table: str, sys_id: str, params: dict, data: dict, base_url: str) -> tuple:
+        if method == "GET" and sys_id is None:
+            limit = int(_param(params, "sysparm_limit", "10000"))
+            offset = int(_param(params, "sysparm_offset", "0"))
+            records = self.store.select(table, _param(params, "sysparm_query", ""), limit, offset)
+            return 200, {"result": [self._project(table, record, params, base_url) for record in records]}
+        if method == "POST" and sys_id is None:
+            record = self.store.create(table, data, f"{secrets.randbits(128):032x}")
+            return 201, {"result": self._project(table, record, params, base_url)}
+        if sys_id is None:
+            return 405, _error("Method not allowed")
+        if method == "GET":
+            record = self.store.get(table, sys_id)
+        elif method in ("PUT", "PATCH"):
+            record = self.store.update(table, sys_id, data)
+        elif method == "DELETE":
+            return (204, None) if self.store.delete(table, sys_id) else (404, _error("No Record found"))
+        else:
+            return 405, _error("Method not allowed")
+        if record is None:
+            return 404, _error("No Record found", "Record doesn't exist or ACL restricts the record retrieval")
+        return 200, {"result": self._project(table, record, params, base_url)}
+
+    def _project(self, table: str, record: dict, params: dict, base_url: str) -> dict:
+        fields = _param(params, "sysparm_fields")
+        if fields:
+            record = {field: record.get(field, "") for field in fields.split(",")}
+        if _param(params, "sysparm_exclude_reference_link") == "true":
+            return record
+        references = REFERENCES.get(table, {})
+        return {field: {"link": f"{base_url}/api/now/table/{references[field]}/{value}", "value": value}
+                if field in references and value else value for field, value in record.items()}
+
+    def _stats(self, table: str, params: dict) -> tuple:
+        group_by = [field for field in (_param(params, "sysparm_group_by") or "").split(",") if field]
+        functions = {function: (_param(params, f"sysparm_{function}_fields") or "").split(",")
+                     for function in ("avg", "min", "max", "sum") if _param(params, f"sysparm_{function}_fields")}
+        rows = self.store.aggregate(table, _param(params, "sysparm_query", ""), group_by,
+                                    _param(params, "sysparm_count", "false") == "true", functions)
+        return 200, {"result": rows if group_by else (rows[0] if rows else {"stats": {}})}
+
+    def _batch(self, payload: dict, base_url: str) -> dict:
+        serviced = []
+        for request in payload.get("rest_requests", []):
+            body = base64.b64decode(request["body"]) if request.get("body") else b""
+            status, result = self.route(request["method"], request["url"], body, base_url)
+            serviced.append({
+                "id": request["id"], "status_code": status, "status_text": "OK" if status < 300 else "Error",
+                "headers": [{"name": "Content-Type", "value": "application/json"}],
+                "body": base64.b64encode(json.dumps(result).encode()).decode() if result is not None else "",
+                "execution_time": 0,
+            })
+        self._count("batch_operations", len(serviced))
+        return {"batch_request_id": payload.get("batch_request_id"), "serviced_requests": serviced, "unserviced_requests": []}
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Serve in a background thread; returns the base URL.
+        """
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.emulator = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Data and fault injection options shared with the benchmark harness.
+    """
+    parser.add_argument("--incidents", type=int, default=10000)
+    parser.add_argument("--changes", type=int, default=1000)
+    parser.add_argument("--cis", type=int, default=2000)
+    parser.add_argument("--relationships-per-ci", type=int, default=2)
+    parser.add_argument("--days", type=int, default=365, help="span of the synthetic timestamps")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra uniform random delay")
+    parser.add_argument("--throttle", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def from_arguments(args: argparse.Namespace) -> tuple:
+    """
+    Build and seed an Emulator from add_arguments() options; returns (emulator, row counts).
+    """
+    store = Store()
+    counts = seed(store, args.incidents, args.cis, args.relationships_per_ci, args.changes, days=args.days, seed=args.seed)
+    return Emulator(store, args.latency_ms, args.jitter_ms, args.throttle, args.retry_after, seed=args.seed), counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    emulator, counts = from_arguments(args)
+    url = emulator.start(args.host, args.port)
+    print(f"ServiceNow emulator at {url}: {counts}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,3 +10,102 @@ SN_PASSWORD = "your_password"
 SN_OAUTH_URL = "https://your-instance.service-now.com/oauth_token.do"
 SN_CLIENT_ID = "your_client_id"
 SN_CLIENT_SECRET = "your_client_secret"
+SN_OAUTH_GRANT_TYPE = "client_credentials"  # or "password" (sends SN_USERNAME/SN_PASSWORD)
+SN_OAUTH_REFRESH_MARGIN = 60  # seconds before expiry to refresh the token in the background
+
+# Further instances served by the same process, selected per tool call with the
+# optional `instance` argument (servicenow_client/instances.py). The settings
+# above form the instance named SN_DEFAULT_INSTANCE. Keys: instance_url,
+# auth_method, username, password, oauth_url, client_id, client_secret,
+# oauth_grant_type; nothing is inherited from the default instance.
+SN_DEFAULT_INSTANCE = "default"
+SN_INSTANCES = {
+    # "dev": {"instance_url": "https://your-dev.service-now.com", "username": "...", "password": "..."},
+}
+
+# HTTP connection pooling for sn_client (one keep-alive session per instance)
+SN_POOL_CONNECTIONS = 10   # number of per-host connection pools to keep
+SN_POOL_MAXSIZE = 20       # keep-alive connections per host
+SN_CONNECT_TIMEOUT = 5     # seconds to establish a connection
+SN_READ_TIMEOUT = 30       # seconds to wait for a response
+
+# Async client (sn_async) used by the MCP tools
+SN_HTTP2 = True            # negotiate HTTP/2 when the optional `h2` package is installed
+SN_MAX_CONCURRENCY = 16    # max in-flight requests per instance
+
+# Paging for streamed and cursor-paged queries (iter_records / aiter_records / query_page)
+SN_PAGE_SIZE = 1000        # rows per request when walking a full result set
+SN_STREAM_CHUNK_BYTES = 64 * 1024   # read size when decoding a response body incrementally
+SN_STREAM_CHUNK_ROWS = 200          # rows per progress notification of a streamed tool result
+SN_CURSOR_SECRET = None    # HMAC key signing query cursors (cursors.py); None: random per process
+SN_CURSOR_TTL = 3600       # seconds a query cursor stays valid
+
+# Batch API (/api/now/v1/batch) for bulk create/update/delete
+SN_BATCH_SIZE = 100        # operations per batch request
+SN_BATCH_CONCURRENCY = 4   # batch requests in flight at once (async client)
+
+# Micro-batching of concurrent read_record calls into one sys_idIN query (servicenow_client/readbatch.py)
+SN_READ_BATCH_ENABLED = True
+SN_READ_BATCH_WINDOW = 0.002   # seconds a batch waits for others to join while one of its table is being fetched
+SN_READ_BATCH_MAX_SIZE = 100   # reads per sys_idIN query; a full batch is sent without waiting
+
+# Read-through record cache under read_record/query_records
+SN_CACHE_ENABLED = True
+SN_CACHE_TTL = 30                      # seconds a cached read/query stays fresh
+SN_CACHE_MAX_ENTRIES = 10000
+SN_CACHE_MAX_BYTES = 64 * 1024 * 1024  # approximate JSON size of all entries
+
+# CMDB relationship traversal (server/cmdb_graph.py)
+SN_REL_CACHE_TTL = 300                 # seconds a CI's cached adjacency list stays fresh
+SN_REL_CACHE_MAX_ENTRIES = 50000       # cached adjacency lists (one per CI and direction)
+
+# Local SQLite replica for reporting and analytics (servicenow_client/replica.py)
+SN_REPLICA_ENABLED = False
+SN_REPLICA_PATH = "sn_replica.sqlite"
+SN_REPLICA_TABLES = ["incident", "change_request"]
+SN_REPLICA_SYNC_INTERVAL = 300         # seconds between incremental pulls
+SN_REPLICA_MAX_LAG = 900               # older replicas are bypassed and reads go to the instance
+SN_REPLICA_OVERLAP = 60                # seconds re-read before each watermark (clock skew, late commits)
+
+# Reports (server/reporting.py)
+SN_REPORT_MAX_TREND_BUCKETS = 60       # trend intervals per report; each one is an Aggregate API count
+SN_REPORT_AGGREGATE_CONCURRENCY = 4    # Aggregate API requests in flight per report
+
+# Portal dashboard snapshots (portal.py, server/snapshots.py)
+SN_PORTAL_SNAPSHOT_TTL = 60              # seconds a dashboard snapshot is served as fresh
+SN_PORTAL_STALE_WHILE_REVALIDATE = 300   # seconds past the TTL a snapshot is still served while it refreshes
+SN_PORTAL_REFRESH_INTERVAL = 15          # background refresh tick; snapshots due before the next tick are rebuilt
+SN_PORTAL_SNAPSHOT_IDLE = 3600           # snapshots nobody requested for this long are dropped
+SN_PORTAL_MAX_SNAPSHOTS = 256
+SN_PORTAL_WORKERS = 1                    # uvicorn worker processes for `python portal.py`
+SN_PORTAL_SHARED_STORE = "sn_portal_snapshots.sqlite"  # snapshots shared by the workers when SN_PORTAL_WORKERS > 1
+SN_PORTAL_SHARED_LEASE = 120             # seconds a worker may hold a snapshot's refresh before another one takes over
+
+# Process pool for CPU-bound work: analytics scoring, CMDB deduplication clustering (server/cpupool.py)
+SN_PROCESS_POOL_ENABLED = True
+SN_PROCESS_POOL_WORKERS = None           # worker processes; None: one per CPU core
+SN_PROCESS_POOL_TIMEOUT = 600            # seconds a job may run before its worker is killed
+SN_PROCESS_POOL_MAX_RESULT_BYTES = 32 * 1024 * 1024  # pickled result size limit per job
+
+# Rate limiting, retries and circuit breaker (servicenow_client/resilience.py)
+SN_RATE_LIMIT = 20.0               # requests per second per instance and user (token bucket refill)
+SN_RATE_BURST = 40                 # token bucket size
+SN_RATE_MIN = 1.0                  # floor for the rate after repeated HTTP 429s
+SN_RETRY_MAX_ATTEMPTS = 4          # retries for idempotent calls and for any call answered 429
+SN_RETRY_BASE_DELAY = 0.5          # seconds; retry n waits uniform(0, base * 2**n)
+SN_RETRY_MAX_DELAY = 30            # cap for a single backoff
+SN_BREAKER_FAILURE_THRESHOLD = 5   # consecutive 5xx/transport failures that open the breaker
+SN_BREAKER_RESET_TIMEOUT = 30      # seconds the breaker stays open before a trial request
+
+# Workflow engine checkpoints (server/workflow.py)
+SN_WORKFLOW_CHECKPOINT_PATH = "sn_workflows.sqlite"
+SN_WORKFLOW_CHECKPOINT_TTL = 7 * 24 * 3600   # seconds completed steps are kept for resuming a retried run
+
+# Metrics, tracing and audit logging (servicenow_client/telemetry.py, server/metrics.py, server/audit.py)
+SN_METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]  # seconds
+SN_METRICS_SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]        # bytes
+SN_METRICS_BATCH_BUCKETS = [1, 2, 5, 10, 20, 50, 100]                                      # reads per batched query
+SN_TRACE_BUFFER = 1000        # finished spans kept in memory for the server_stats tool
+SN_TRACE_PROPAGATE = True     # send a W3C traceparent header with every ServiceNow request
+SN_METRICS_PORT = None        # serve the portal app (dashboards and /metrics) from the MCP server process on this port
+SN_AUDIT_LOG_PATH = None      # JSON-lines audit log file; None writes audit events to stderr
@@ -1,19 +1,73 @@
 # portal.py
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from email.utils import formatdate
+from typing import Optional
+from fastapi import FastAPI, Request, Response
+from servicenow_client.encodedquery import canonical
 from server.reporting import generate_incident_report, generate_change_report
+from server.snapshots import SnapshotStore
+from server import metrics
+from config import SN_PORTAL_WORKERS, SN_PORTAL_SHARED_STORE
 
-app = FastAPI(title="ServiceNow Dashboard")
+# Dashboards are served from precomputed snapshots (server/snapshots.py),
+# keyed by report and parameters and kept warm by a background refresh task.
+# With several worker processes the snapshots are shared through SN_PORTAL_SHARED_STORE.
+snapshots = SnapshotStore(shared_path=SN_PORTAL_SHARED_STORE if SN_PORTAL_WORKERS > 1 else None)
+
+REPORTS = {"incidents": generate_incident_report, "changes": generate_change_report}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Precompute the default dashboards, then keep every requested one fresh.
+    for name in REPORTS:
+        snapshots.register(*_report(name, "active=true", None, "day", 0))
+    refresher = asyncio.create_task(snapshots.run())
+    try:
+        yield
+    finally:
+        refresher.cancel()
+
+app = FastAPI(title="ServiceNow Dashboard", lifespan=lifespan)
+
+def _report(name: str, query: str, limit: Optional[int], trend_interval: str, trend_buckets: int) -> tuple:
+    key = (name, canonical(query), limit, trend_interval, trend_buckets)
+    async def producer():
+        return await REPORTS[name](query=query, limit=limit, trend_interval=trend_interval, trend_buckets=trend_buckets)
+    return key, producer
+
+async def _serve(request: Request, name: str, query: str, limit: Optional[int], trend_interval: str,
+                 trend_buckets: int) -> Response:
+    snapshot = await snapshots.get(*_report(name, query, limit, trend_interval, trend_buckets))
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": snapshots.cache_control(snapshot),
+        "Age": str(int(snapshot.age())),
+        "Last-Modified": formatdate(snapshot.created_at, usegmt=True),
+    }
+    if snapshots.not_modified(snapshot, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 @app.get("/dashboard/incidents")
-def incidents_dashboard(query: str = "active=true", limit: int = 100):
-    report = generate_incident_report(query=query, limit=limit)
-    return report
+async def incidents_dashboard(request: Request, query: str = "active=true", limit: Optional[int] = None,
+                              trend_interval: str = "day", trend_buckets: int = 0):
+    return await _serve(request, "incidents", query, limit, trend_interval, trend_buckets)
 
 @app.get("/dashboard/changes")
-def changes_dashboard(query: str = "active=true", limit: int = 100):
-    report = generate_change_report(query=query, limit=limit)
-    return report
+async def changes_dashboard(request: Request, query: str = "active=true", limit: Optional[int] = None,
+                            trend_interval: str = "day", trend_buckets: int = 0):
+    return await _serve(request, "changes", query, limit, trend_interval, trend_buckets)
+
+@app.get("/dashboard/snapshots")
+async def snapshot_stats():
+    return snapshots.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render_prometheus(), media_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Several workers need the app as an import string, so each process builds its own.
+    uvicorn.run("portal:app" if SN_PORTAL_WORKERS > 1 else app, host="0.0.0.0", port=8000, workers=SN_PORTAL_WORKERS)
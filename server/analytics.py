@@ -1 +1,226 @@
+# server/analytics.py
+from datetime import date, timedelta
+import numpy as np
+from servicenow_client import replica
+from server import timeseries, cpupool
+from server.registry import tool
 
+# Incidents are loaded once into columnar NumPy arrays (day number of
+# opened_at plus an integer code per dimension value), then bucketed and
+# scored with the vectorized helpers in server/timeseries.py. Per-dimension
+# results come from the same arrays, one row per dimension value. Loading
+# happens on the event loop; the scoring functions take only the columns and
+# run in the worker process pool (server/cpupool.py).
+
+DIMENSIONS = ("priority", "category", "assignment_group")
+ANOMALY_METHODS = tuple(timeseries.SCORERS)
+_EPOCH = date(1970, 1, 1)
+_CHUNK = 50000  # rows converted to arrays at a time while streaming
+
+async def load_incidents(query: str = "active=true", limit: int = None, dimensions: tuple = DIMENSIONS) -> dict:
+    """
+    Stream matching incidents into columns:
+    {"day": int64 days since 1970-01-01, "dimensions": {name: (codes, labels)}}.
+    Rows without opened_at are skipped.
+    """
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown analytics dimensions: {sorted(unknown)}")
+    day_chunks, dates = [], []
+    labels = {name: {} for name in dimensions}
+    code_chunks = {name: [] for name in dimensions}
+    codes = {name: [] for name in dimensions}
+
+    def flush():
+        if dates:
+            day_chunks.append(np.array(dates, dtype="datetime64[D]").astype(np.int64))
+            dates.clear()
+            for name in dimensions:
+                code_chunks[name].append(np.array(codes[name], dtype=np.int32))
+                codes[name].clear()
+
+    fields = ["opened_at", *dimensions]
+    async for record in replica.aiter_records("incident", query, max_records=limit, fields=fields, exclude_reference_link=True):
+        opened_at = record.get("opened_at")
+        if not opened_at:
+            continue
+        dates.append(opened_at[:10])
+        for name in dimensions:
+            mapping = labels[name]
+            codes[name].append(mapping.setdefault(record.get(name) or "unknown", len(mapping)))
+        if len(dates) >= _CHUNK:
+            flush()
+    flush()
+    return {
+        "day": np.concatenate(day_chunks) if day_chunks else np.zeros(0, dtype=np.int64),
+        "dimensions": {
+            name: (np.concatenate(code_chunks[name]) if code_chunks[name] else np.zeros(0, dtype=np.int32), list(labels[name]))
+            for name in dimensions
+        },
+    }
+
+def _day(number: int) -> date:
+    return _EPOCH + timedelta(days=int(number))
+
+def daily_series(columns: dict, dimension: str = None) -> tuple:
+    """
+    Return (first_day, labels, counts) with counts shaped (groups, days);
+    a single "all" row without a dimension.
+    """
+    if dimension is None:
+        first, counts = timeseries.bucket_counts(columns["day"])
+        return first, ["all"], counts
+    codes, labels = columns["dimensions"][dimension]
+    first, counts = timeseries.bucket_counts(columns["day"], codes, len(labels))
+    return first, labels, counts
+
+def forecast(counts: np.ndarray, horizon: int = 7, period: int = 7) -> dict:
+    """
+    Fit a line through the deseasonalized series of every row and project it
+    `horizon` days ahead, adding the seasonal profile back.
+    """
+    parts = timeseries.seasonal_decompose(counts, period)
+    slope, intercept = timeseries.linear_fit(counts - parts["seasonal"])
+    length = counts.shape[-1]
+    future = np.arange(length, length + horizon)
+    seasonal = parts["seasonal"][:, future % period] if length >= period else 0.0
+    projected = np.maximum(intercept[:, None] + slope[:, None] * future + seasonal, 0.0)
+    return {"slope": slope, "projected": projected, "seasonal": parts["seasonal"]}
+
+def _trend_label(slope: float) -> str:
+    return "increasing" if slope > 0 else "decreasing" if slope < 0 else "flat"
+
+def _anomalies(first: int, counts: np.ndarray, scores: np.ndarray, threshold: float) -> list:
+    days = np.flatnonzero(np.abs(scores) > threshold)
+    return [{"date": str(_day(first + day)), "count": int(counts[day]), "z_score": round(float(scores[day]), 2)} for day in days]
+
+def project_trends(columns: dict, horizon: int = 7, dimension: str = None, period: int = 7) -> dict:
+    """
+    The predict_incident_trends result for columns from load_incidents().
+    """
+    first, _, counts = daily_series(columns)
+    if counts.shape[-1] < 2:
+        return {"daily_counts": {str(_day(first + i)): int(c) for i, c in enumerate(counts[0])}, "slope": 0.0, "forecast": {}}
+    overall = forecast(counts, horizon, period)
+    last_day = _day(first + counts.shape[-1] - 1)
+    result = {
+        "daily_counts": {str(_day(first + i)): int(c) for i, c in enumerate(counts[0])},
+        "slope": round(float(overall["slope"][0]), 4),
+        "trend": _trend_label(overall["slope"][0]),
+        "forecast": {str(last_day + timedelta(days=step + 1)): round(float(value), 2)
+                     for step, value in enumerate(overall["projected"][0])},
+    }
+    if dimension:
+        _, labels, grouped = daily_series(columns, dimension)
+        per_value = forecast(grouped, horizon, period)
+        result["by_dimension"] = {
+            "dimension": dimension,
+            "values": {
+                label: {
+                    "total": int(grouped[row].sum()),
+                    "slope": round(float(per_value["slope"][row]), 4),
+                    "trend": _trend_label(per_value["slope"][row]),
+                    "forecast_total": round(float(per_value["projected"][row].sum()), 2),
+                }
+                for row, label in enumerate(labels)
+            },
+        }
+    return result
+
+async def predict_incident_trends(query: str = "active=true", limit: int = None, horizon: int = 7,
+                                  dimension: str = None, period: int = 7) -> dict:
+    """
+    Project daily incident counts `horizon` days ahead from a linear trend plus
+    a weekly (`period`) seasonal profile; per dimension value when `dimension`
+    is set.
+    """
+    columns = await load_incidents(query, limit, (dimension,) if dimension else ())
+    return await cpupool.run(project_trends, columns, horizon, dimension, period)
+
+def score_anomalies(columns: dict, threshold: float = 2.0, method: str = "zscore", dimension: str = None,
+                    period: int = 7) -> dict:
+    """
+    The anomaly_detection result for columns from load_incidents().
+    """
+    scorer = timeseries.SCORERS[method]
+    first, _, counts = daily_series(columns)
+    series = counts.astype(np.float64)
+    if counts.shape[-1] < 2 or series.std() == 0:
+        return {"method": method, "mean": round(float(series.mean()), 2) if series.size else 0.0, "stdev": 0.0, "anomalies": []}
+    deseasonalized = series - timeseries.seasonal_decompose(series, period)["seasonal"]
+    scores = scorer(deseasonalized)
+    result = {
+        "method": method,
+        "mean": round(float(series.mean()), 2),
+        "stdev": round(float(series.std()), 2),
+        "anomalies": _anomalies(first, counts[0], scores[0], threshold),
+    }
+    if dimension:
+        _, labels, grouped = daily_series(columns, dimension)
+        grouped_series = grouped.astype(np.float64)
+        grouped_scores = scorer(grouped_series - timeseries.seasonal_decompose(grouped_series, period)["seasonal"])
+        result["by_dimension"] = {
+            "dimension": dimension,
+            "values": {
+                label: _anomalies(first, grouped[row], grouped_scores[row], threshold)
+                for row, label in enumerate(labels)
+                if np.any(np.abs(grouped_scores[row]) > threshold)
+            },
+        }
+    return result
+
+async def anomaly_detection(query: str = "active=true", limit: int = None, threshold: float = 2.0,
+                            method: str = "zscore", dimension: str = None, period: int = 7) -> dict:
+    """
+    Flag days whose incident count is anomalous. The weekly (`period`)
+    seasonal profile is removed first when there are at least two periods of
+    data, then the remainder is scored with a z-score, MAD (robust z-score) or
+    EWMA deviation and compared with `threshold`. Scores are computed for every
+    dimension value at once when `dimension` is set.
+    """
+    if method not in timeseries.SCORERS:
+        raise ValueError(f"Unknown anomaly method: {method}")
+    columns = await load_incidents(query, limit, (dimension,) if dimension else ())
+    return await cpupool.run(score_anomalies, columns, threshold, method, dimension, period)
+
+# MCP tools
+ANALYTICS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "limit": {"type": "number", "description": "Analyze only the first N matching incidents (default: all)"},
+        "dimension": {"type": "string", "enum": list(DIMENSIONS), "description": "Also report results per value of this field"},
+        "period": {"type": "integer", "minimum": 2, "description": "Seasonal period in days (default: 7)"}
+    }
+}
+
+@tool("analytics_predict_trends", "Predict incident trends", {
+    **ANALYTICS_SCHEMA,
+    "properties": {**ANALYTICS_SCHEMA["properties"], "horizon": {"type": "integer", "minimum": 1, "maximum": 365}}
+}, coalesce=True)
+async def _predict_trends_tool(arguments: dict):
+    return await predict_incident_trends(
+        query=arguments.get("query", "active=true"),
+        limit=arguments.get("limit"),
+        horizon=arguments.get("horizon", 7),
+        dimension=arguments.get("dimension"),
+        period=arguments.get("period", 7)
+    )
+
+@tool("analytics_anomaly_detection", "Detect anomalies in incident data", {
+    **ANALYTICS_SCHEMA,
+    "properties": {
+        **ANALYTICS_SCHEMA["properties"],
+        "method": {"type": "string", "enum": list(ANOMALY_METHODS)},
+        "threshold": {"type": "number", "exclusiveMinimum": 0}
+    }
+}, coalesce=True)
+async def _anomaly_detection_tool(arguments: dict):
+    return await anomaly_detection(
+        query=arguments.get("query", "active=true"),
+        limit=arguments.get("limit"),
+        threshold=arguments.get("threshold", 2.0),
+        method=arguments.get("method", "zscore"),
+        dimension=arguments.get("dimension"),
+        period=arguments.get("period", 7)
+    )
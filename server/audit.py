@@ -0,0 +1,87 @@
+# server/audit.py
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from servicenow_client import instances, telemetry
+from config import SN_AUDIT_LOG_PATH
+
+# Structured audit log of the changes made through the tools. Events are put
+# on a queue by the calling coroutine as they are, without being formatted
+# (QueueHandler.prepare would format every record on the caller), and a
+# listener thread serializes them as JSON lines to SN_AUDIT_LOG_PATH (stderr
+# when unset; stdout carries the MCP stdio transport). An event holds the
+# action, table, sys_id, the names of the fields written and the trace id,
+# never the field values, so the log neither copies record data nor grows
+# with record size.
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            **getattr(record, "audit", {}),
+        }
+        return json.dumps(event, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # formatted on the listener thread
+
+_logger = logging.getLogger("servicenow.audit")
+_listener = None
+_lock = threading.Lock()
+
+def _start() -> None:
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        target = logging.FileHandler(SN_AUDIT_LOG_PATH, delay=True) if SN_AUDIT_LOG_PATH else logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        events = queue.SimpleQueue()
+        _logger.addHandler(_QueueHandler(events))
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        _listener = logging.handlers.QueueListener(events, target)
+        _listener.start()
+        atexit.register(stop)
+
+def stop() -> None:
+    """
+    Flush queued events and stop the listener thread.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def record(action: str, table: str, data: dict = None, sys_id: str = None) -> None:
+    """
+    Queue an audit event for a change to `table`. `data` is the changed
+    record or the API response wrapping it; only its sys_id and field names
+    are logged.
+    """
+    if _listener is None:
+        _start()
+    if not _logger.isEnabledFor(logging.INFO):
+        return
+    data = data or {}
+    if isinstance(data.get("result"), dict):
+        data = data["result"]
+    span = telemetry.current_span()
+    event = {
+        "action": action,
+        "table": table,
+        "sys_id": sys_id or data.get("sys_id"),
+        "fields": sorted(data),
+        "instance": instances.current().name,
+        "trace_id": span.trace_id if span is not None else None,
+    }
+    _logger.info(f"{table} {action}", extra={"audit": event})
@@ -1,10 +1,55 @@
 # server/base.py
+from servicenow_client import sn_async
+
 def validate_data(data: dict, required_fields: list) -> bool:
     for field in required_fields:
         if field not in data:
             return False
     return True
 
-def update_comments(ritm_id: str, comment: str) -> None:
-    # In production, update the record using sn_client.update_record.
-    print(f"RITM {ritm_id} updated with comment: {comment}")
+async def update_comments(ritm_id: str, comment: str, **fields) -> dict:
+    # Adds a journal entry to the RITM; `fields` are updated in the same call (e.g. state="3").
+    return await sn_async.update_record("sc_req_item", ritm_id, {"comments": comment, **fields})
+
+def summarize_bulk_results(results: list) -> dict:
+    # Shape returned by every bulk tool: counts plus the per-record outcomes in input order.
+    succeeded = sum(1 for result in results if result["ok"])
+    return {"total": len(results), "succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+# JSON-schema fragments shared by tool definitions
+PROJECTION_PROPERTIES = {
+    "fields": {"type": "array", "items": {"type": "string"}},
+    "display_value": {"type": "string", "enum": ["true", "false", "all"]},
+    "exclude_reference_link": {"type": "boolean"}
+}
+
+CURSOR_PROPERTIES = {
+    "cursor": {"type": "string", "description": "next_cursor of the previous page; the query and its order "
+                                                "are taken from the cursor and offset is ignored"}
+}
+
+BULK_CREATE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "records": {"type": "array", "items": {"type": "object"}}
+    },
+    "required": ["records"]
+}
+
+BULK_UPDATE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "updates": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "sys_id": {"type": "string"},
+                    "data": {"type": "object"}
+                },
+                "required": ["sys_id", "data"]
+            }
+        }
+    },
+    "required": ["updates"]
+}
@@ -1,52 +1,119 @@
 # server/cmdb.py
 import logging
-from servicenow_client import sn_client
-from server.base import validate_data
+from servicenow_client import sn_async
+from servicenow_client.encodedquery import Query
+from server.base import (
+    validate_data, summarize_bulk_results,
+    PROJECTION_PROPERTIES, CURSOR_PROPERTIES, BULK_CREATE_SCHEMA, BULK_UPDATE_SCHEMA
+)
+from server.registry import tool
+from server import dedup, cmdb_graph, audit, streaming
+from server.streaming import STREAM_PROPERTIES
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-def create_ci(data: dict) -> dict:
+async def create_ci(data: dict) -> dict:
     """
     Create a new CI record after validating the data.
     Logs the creation for audit trails.
+    A list of records is created in bulk through bulk_create_ci().
     """
+    if isinstance(data, list):
+        return await bulk_create_ci(data)
     if not validate_ci(data):
         raise ValueError("CI data validation failed. Required fields missing.")
-    result = sn_client.create_record("cmdb_ci", data)
-    log_audit("create", result)
+    result = await sn_async.create_record("cmdb_ci", data)
+    audit.record("create", "cmdb_ci", result)
     return result
 
-def read_ci(sys_id: str) -> dict:
+async def read_ci(sys_id: str, fields: list = None, display_value: str = None,
+                  exclude_reference_link: bool = False) -> dict:
     """
     Retrieve a CI record by its system ID.
+    Pass `fields` to return only those columns.
     """
-    return sn_client.read_record("cmdb_ci", sys_id)
+    return await sn_async.read_record("cmdb_ci", sys_id, fields, display_value, exclude_reference_link)
 
-def update_ci(sys_id: str, data: dict) -> dict:
+async def update_ci(sys_id: str, data: dict) -> dict:
     """
     Update a CI record after validating the provided data.
     Logs the update for audit trails.
+    A list of sys_ids is updated in bulk, with either one data dict per
+    sys_id or the same data for all of them.
     """
+    if isinstance(sys_id, list):
+        if isinstance(data, list):
+            if len(data) != len(sys_id):
+                raise ValueError("sys_id and data lists must have the same length.")
+            return await bulk_update_ci([{"sys_id": s, "data": d} for s, d in zip(sys_id, data)])
+        return await bulk_update_ci([{"sys_id": s, "data": data} for s in sys_id])
     if not validate_ci(data):
         raise ValueError("CI data validation failed. Required fields missing.")
-    result = sn_client.update_record("cmdb_ci", sys_id, data)
-    log_audit("update", result)
+    result = await sn_async.update_record("cmdb_ci", sys_id, data)
+    audit.record("update", "cmdb_ci", result)
     return result
 
-def delete_ci(sys_id: str) -> dict:
+async def bulk_create_ci(records: list) -> dict:
+    """
+    Create many CI records through the Batch API.
+    Each record is validated first; invalid records are reported as failed
+    and not sent. Every successful creation is logged for audit trails.
+    """
+    results = [None] * len(records)
+    valid = []
+    for index, record in enumerate(records):
+        if validate_ci(record):
+            valid.append(index)
+        else:
+            results[index] = {"index": index, "ok": False, "status_code": None,
+                              "error": "CI data validation failed. Required fields missing."}
+    outcomes = await sn_async.bulk_create_records("cmdb_ci", [records[index] for index in valid])
+    for index, outcome in zip(valid, outcomes):
+        results[index] = {**outcome, "index": index}
+        if outcome["ok"]:
+            audit.record("create", "cmdb_ci", outcome["result"])
+    return summarize_bulk_results(results)
+
+async def bulk_update_ci(updates: list) -> dict:
+    """
+    Update many CI records through the Batch API.
+    updates: [{"sys_id": ..., "data": {...}}, ...]. Validation and audit
+    logging run per record, as in update_ci().
+    """
+    results = [None] * len(updates)
+    valid = []
+    for index, update in enumerate(updates):
+        if update.get("sys_id") and validate_ci(update.get("data") or {}):
+            valid.append(index)
+        else:
+            results[index] = {"index": index, "ok": False, "status_code": None,
+                              "error": "CI data validation failed. Required fields missing."}
+    outcomes = await sn_async.bulk_update_records(
+        "cmdb_ci", [(updates[index]["sys_id"], updates[index]["data"]) for index in valid]
+    )
+    for index, outcome in zip(valid, outcomes):
+        results[index] = {**outcome, "index": index}
+        if outcome["ok"]:
+            audit.record("update", "cmdb_ci", outcome["result"])
+    return summarize_bulk_results(results)
+
+async def delete_ci(sys_id: str) -> dict:
     """
     Delete a CI record.
     Logs the deletion.
     """
-    result = sn_client.delete_record("cmdb_ci", sys_id)
-    log_audit("delete", {"sys_id": sys_id})
+    result = await sn_async.delete_record("cmdb_ci", sys_id)
+    audit.record("delete", "cmdb_ci", sys_id=sys_id)
     return result
 
-def query_ci(query: str, limit: int = 100, offset: int = 0) -> dict:
+async def query_ci(query: str, limit: int = 100, offset: int = 0, fields: list = None,
+                   display_value: str = None, exclude_reference_link: bool = False, cursor: str = None) -> dict:
     """
     Perform an advanced query on the CMDB CI table.
+    Pass `fields` to return only those columns, and the returned
+    next_cursor as `cursor` for the next page.
     """
-    return sn_client.query_records("cmdb_ci", query, limit, offset)
+    return await sn_async.query_page("cmdb_ci", query, limit, cursor, offset, fields, display_value, exclude_reference_link)
 
 def validate_ci(data: dict) -> bool:
     """
@@ -56,24 +123,24 @@ def validate_ci(data: dict) -> bool:
     required_fields = ["name", "ci_type"]
     return validate_data(data, required_fields)
 
-def deduplicate_ci() -> list:
+async def deduplicate_ci(query: str = "", keys: list = None, fuzzy: bool = False,
+                         similarity: float = 0.8, max_clusters: int = 1000) -> dict:
     """
-    Scan existing CI records to identify possible duplicates
-    based on a combination of fields (e.g., name and ci_type).
-    Returns a list of duplicate records.
+    Stream the CI table and group likely duplicates into clusters.
+    Records match on normalized name + ci_type (case, whitespace, FQDN vs short
+    name), serial number or MAC address, and optionally on fuzzy name
+    similarity. Memory stays bounded; progress is logged for long runs.
     """
-    all_cis = query_ci("", limit=1000).get("result", [])
-    duplicates = []
-    seen = {}
-    for ci in all_cis:
-        key = (ci.get("name"), ci.get("ci_type"))
-        if key in seen:
-            duplicates.append(ci)
-        else:
-            seen[key] = ci
-    return duplicates
+    records = sn_async.aiter_records("cmdb_ci", query, fields=dedup.DEDUP_FIELDS, exclude_reference_link=True)
+    return await dedup.find_duplicate_clusters(
+        records,
+        keys=tuple(keys or dedup.EXACT_KEYS),
+        fuzzy=fuzzy,
+        similarity=similarity,
+        max_clusters=max_clusters,
+    )
 
-def add_relationship(ci_sys_id: str, related_ci_sys_id: str, relationship_type: str = "Depends on") -> dict:
+async def add_relationship(ci_sys_id: str, related_ci_sys_id: str, relationship_type: str = "Depends on") -> dict:
     """
     Create a relationship record between two CIs.
     In ServiceNow, relationships are managed in the cmdb_rel_ci table.
@@ -83,30 +150,192 @@ def add_relationship(ci_sys_id: str, related_ci_sys_id: str, relationship_type:
         "child": related_ci_sys_id,
         "relationship_type": relationship_type
     }
-    result = sn_client.create_record("cmdb_rel_ci", relationship_data)
-    log_audit("add_relationship", result)
+    result = await sn_async.create_record("cmdb_rel_ci", relationship_data)
+    cmdb_graph.invalidate(ci_sys_id, related_ci_sys_id)
+    audit.record("add_relationship", "cmdb_rel_ci", result)
     return result
 
-def get_relationships(ci_sys_id: str) -> dict:
+async def get_relationships(ci_sys_id: str) -> dict:
     """
     Retrieve all relationship records where the specified CI is a parent.
     """
-    query = f"parent={ci_sys_id}"
-    return sn_client.query_records("cmdb_rel_ci", query)
+    query = Query().where("parent", "=", ci_sys_id)
+    return await sn_async.query_records("cmdb_rel_ci", query.encode())
 
-def enrich_ci(sys_id: str, enrichment_data: dict) -> dict:
+async def traverse_ci(ci_sys_id: str, direction: str = "downstream", max_depth: int = 3, max_nodes: int = 500,
+                      strategy: str = "bfs", include_nodes: bool = True) -> dict:
+    """
+    Walk the CI relationship graph (impact analysis, dependency maps).
+    See cmdb_graph.traverse for the returned subgraph.
+    """
+    return await cmdb_graph.traverse(ci_sys_id, direction, max_depth, max_nodes, strategy, include_nodes)
+
+async def enrich_ci(sys_id: str, enrichment_data: dict) -> dict:
     """
     Update a CI record with additional contextual data (e.g., warranty or vendor info).
     """
-    current_ci = read_ci(sys_id).get("result", [{}])[0]
+    current_ci = (await read_ci(sys_id)).get("result", [{}])[0]
     updated_data = {**current_ci, **enrichment_data}
-    result = update_ci(sys_id, updated_data)
-    log_audit("enrich", result)
+    result = await update_ci(sys_id, updated_data)
+    audit.record("enrich", "cmdb_ci", result)
     return result
 
-def log_audit(action: str, data: dict) -> None:
-    """
-    Log an audit entry for any CMDB changes.
-    This can later be extended to write to an external audit log.
-    """
-    logging.info(f"CMDB {action} audit: {data}")
+# MCP tools
+@tool("cmdb_create_ci", "Create a CMDB CI record", {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "ci_type": {"type": "string"},
+        # Additional fields as needed
+    },
+    "required": ["name", "ci_type"]
+})
+async def _create_ci_tool(arguments: dict):
+    return await create_ci(arguments)
+
+@tool("cmdb_read_ci", "Read a CMDB CI record by sys_id", {
+    "type": "object",
+    "properties": {"sys_id": {"type": "string"}, **PROJECTION_PROPERTIES},
+    "required": ["sys_id"]
+}, coalesce=True)
+async def _read_ci_tool(arguments: dict):
+    return await read_ci(
+        arguments["sys_id"],
+        fields=arguments.get("fields"),
+        display_value=arguments.get("display_value"),
+        exclude_reference_link=arguments.get("exclude_reference_link", False)
+    )
+
+@tool("cmdb_update_ci", "Update a CMDB CI record", {
+    "type": "object",
+    "properties": {
+        "sys_id": {"type": "string"},
+        "data": {"type": "object"}
+    },
+    "required": ["sys_id", "data"]
+})
+async def _update_ci_tool(arguments: dict):
+    return await update_ci(arguments["sys_id"], arguments["data"])
+
+@tool("cmdb_delete_ci", "Delete a CMDB CI record", {
+    "type": "object",
+    "properties": {"sys_id": {"type": "string"}},
+    "required": ["sys_id"]
+})
+async def _delete_ci_tool(arguments: dict):
+    return await delete_ci(arguments["sys_id"])
+
+@tool("cmdb_bulk_create_ci", "Create many CMDB CI records in one call via the Batch API", BULK_CREATE_SCHEMA)
+async def _bulk_create_ci_tool(arguments: dict):
+    return await bulk_create_ci(arguments["records"])
+
+@tool("cmdb_bulk_update_ci", "Update many CMDB CI records in one call via the Batch API", BULK_UPDATE_SCHEMA)
+async def _bulk_update_ci_tool(arguments: dict):
+    return await bulk_update_ci(arguments["updates"])
+
+@tool("cmdb_query_ci", "Query CMDB CI records with a custom query", {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "limit": {"type": "number"},
+        "offset": {"type": "number"},
+        **CURSOR_PROPERTIES,
+        **PROJECTION_PROPERTIES,
+        **STREAM_PROPERTIES
+    }
+}, coalesce=True)
+async def _query_ci_tool(arguments: dict):
+    if streaming.requested(arguments):
+        page = {}
+        summary = await streaming.send_rows(sn_async.astream_page(
+            "cmdb_ci", arguments.get("query", ""), arguments.get("limit", 100), arguments.get("cursor"),
+            arguments.get("offset", 0), fields=arguments.get("fields"), display_value=arguments.get("display_value"),
+            exclude_reference_link=arguments.get("exclude_reference_link", False), page=page
+        ), table="cmdb_ci")
+        return {**summary, **page}
+    return await query_ci(
+        arguments.get("query", ""),
+        arguments.get("limit", 100),
+        arguments.get("offset", 0),
+        fields=arguments.get("fields"),
+        display_value=arguments.get("display_value"),
+        exclude_reference_link=arguments.get("exclude_reference_link", False),
+        cursor=arguments.get("cursor")
+    )
+
+@tool("cmdb_deduplicate", "Find clusters of duplicate CI records by normalized name, serial number, MAC address or fuzzy name", {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "keys": {
+            "type": "array",
+            "items": {"type": "string", "enum": ["name", "serial_number", "mac_address"]}
+        },
+        "fuzzy": {"type": "boolean"},
+        "similarity": {"type": "number"},
+        "max_clusters": {"type": "number"}
+    }
+}, coalesce=True)
+async def _deduplicate_tool(arguments: dict):
+    return await deduplicate_ci(
+        query=arguments.get("query", ""),
+        keys=arguments.get("keys"),
+        fuzzy=arguments.get("fuzzy", False),
+        similarity=arguments.get("similarity", 0.8),
+        max_clusters=arguments.get("max_clusters", 1000)
+    )
+
+@tool("cmdb_add_relationship", "Add a relationship between two CIs", {
+    "type": "object",
+    "properties": {
+        "ci_sys_id": {"type": "string"},
+        "related_ci_sys_id": {"type": "string"},
+        "relationship_type": {"type": "string"}
+    },
+    "required": ["ci_sys_id", "related_ci_sys_id"]
+})
+async def _add_relationship_tool(arguments: dict):
+    return await add_relationship(
+        arguments["ci_sys_id"], arguments["related_ci_sys_id"], arguments.get("relationship_type", "Depends on")
+    )
+
+@tool("cmdb_get_relationships", "Retrieve relationships for a given CI", {
+    "type": "object",
+    "properties": {"ci_sys_id": {"type": "string"}},
+    "required": ["ci_sys_id"]
+}, coalesce=True)
+async def _get_relationships_tool(arguments: dict):
+    return await get_relationships(arguments["ci_sys_id"])
+
+@tool("cmdb_traverse", "Traverse the CI relationship graph and return the reachable subgraph", {
+    "type": "object",
+    "properties": {
+        "ci_sys_id": {"type": "string"},
+        "direction": {"type": "string", "enum": ["downstream", "upstream", "both"]},
+        "max_depth": {"type": "integer", "minimum": 0, "maximum": cmdb_graph.MAX_DEPTH},
+        "max_nodes": {"type": "integer", "minimum": 1, "maximum": cmdb_graph.MAX_NODES},
+        "strategy": {"type": "string", "enum": ["bfs", "dfs"]},
+        "include_nodes": {"type": "boolean", "description": "Fetch name and class of every visited CI"}
+    },
+    "required": ["ci_sys_id"]
+}, coalesce=True)
+async def _traverse_tool(arguments: dict):
+    return await traverse_ci(
+        arguments["ci_sys_id"],
+        direction=arguments.get("direction", "downstream"),
+        max_depth=arguments.get("max_depth", 3),
+        max_nodes=arguments.get("max_nodes", 500),
+        strategy=arguments.get("strategy", "bfs"),
+        include_nodes=arguments.get("include_nodes", True),
+    )
+
+@tool("cmdb_enrich_ci", "Enrich a CI record with additional data", {
+    "type": "object",
+    "properties": {
+        "sys_id": {"type": "string"},
+        "enrichment_data": {"type": "object"}
+    },
+    "required": ["sys_id", "enrichment_data"]
+})
+async def _enrich_ci_tool(arguments: dict):
+    return await enrich_ci(arguments["sys_id"], arguments["enrichment_data"])
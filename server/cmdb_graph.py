@@ -0,0 +1,188 @@
+# server/cmdb_graph.py
+import asyncio
+from servicenow_client import sn_async, instances
+from servicenow_client.encodedquery import ids_in
+from servicenow_client.cache import RecordCache
+from config import SN_REL_CACHE_TTL, SN_REL_CACHE_MAX_ENTRIES
+
+# Relationship graph traversal over cmdb_rel_ci. Each BFS level (or each group of
+# DFS stack entries) is fetched with one parentIN/childIN query per chunk of ids,
+# and the adjacency list of every visited CI is cached for SN_REL_CACHE_TTL, per instance.
+
+REL_FIELDS = ["sys_id", "parent", "child", "type"]
+NODE_FIELDS = ["sys_id", "name", "sys_class_name"]
+DIRECTIONS = {"downstream": ("parent", "child"), "upstream": ("child", "parent")}
+
+MAX_DEPTH = 10
+MAX_NODES = 5000
+_IN_CHUNK = 100  # sys_ids per IN query, keeps the URL well under instance limits
+
+def adjacency_cache() -> RecordCache:
+    return instances.current().named_cache("cmdb_adjacency", ttl=SN_REL_CACHE_TTL, max_entries=SN_REL_CACHE_MAX_ENTRIES)
+
+def _cache_key(sys_id: str, direction: str) -> tuple:
+    return ("adjacency", "cmdb_rel_ci", sys_id, direction)
+
+def invalidate(*sys_ids: str) -> None:
+    """
+    Forget the cached adjacency of the given CIs (after a relationship change).
+    """
+    cache = adjacency_cache()
+    for sys_id in sys_ids:
+        cache.invalidate("cmdb_rel_ci", sys_id)
+
+async def _fetch_chunk(ids: list, direction: str) -> dict:
+    source, _ = DIRECTIONS[direction]
+    edges = {sys_id: [] for sys_id in ids}
+    query = ids_in(ids, source)
+    async for rel in sn_async.aiter_records("cmdb_rel_ci", query, fields=REL_FIELDS, exclude_reference_link=True):
+        edges.setdefault(rel.get(source), []).append(rel)
+    return edges
+
+async def fetch_adjacency(ids: list, direction: str, stats: dict) -> dict:
+    """
+    Return {sys_id: [relationship, ...]} for the given CIs in one direction,
+    serving cached adjacency lists and fetching the rest in batched IN queries.
+    """
+    cache = adjacency_cache()
+    generation = cache.generation()  # a relationship added during the fetch keeps it out of the cache
+    result, missing = {}, []
+    for sys_id in dict.fromkeys(ids):
+        cached = cache.get(_cache_key(sys_id, direction))
+        if cached is not None:
+            result[sys_id] = cached["edges"]
+            stats["cache_hits"] += 1
+        else:
+            missing.append(sys_id)
+    chunks = [missing[i:i + _IN_CHUNK] for i in range(0, len(missing), _IN_CHUNK)]
+    stats["queries"] += len(chunks)
+    for fetched in await asyncio.gather(*(_fetch_chunk(chunk, direction) for chunk in chunks)):
+        for sys_id, edges in fetched.items():
+            cache.put(_cache_key(sys_id, direction), {"edges": edges}, generation)
+            result[sys_id] = edges
+    return result
+
+async def _neighbours(ids: list, directions: list, stats: dict) -> dict:
+    # {sys_id: [(neighbour, relationship), ...]} across the requested directions
+    neighbours = {sys_id: [] for sys_id in ids}
+    for direction in directions:
+        _, target = DIRECTIONS[direction]
+        for sys_id, edges in (await fetch_adjacency(ids, direction, stats)).items():
+            neighbours[sys_id].extend((edge.get(target), edge) for edge in edges if edge.get(target))
+    return neighbours
+
+def find_cycles(edges: dict) -> list:
+    """
+    Return the (parent, child) edges that close a directed cycle in the subgraph.
+    """
+    graph = {}
+    for edge in edges.values():
+        graph.setdefault(edge["parent"], []).append(edge["child"])
+    WHITE, GREY, BLACK = 0, 1, 2
+    color, back_edges = {}, []
+    for start in graph:
+        if color.get(start, WHITE) != WHITE:
+            continue
+        color[start] = GREY
+        stack = [(start, iter(graph.get(start, ())))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                color[node] = BLACK
+                stack.pop()
+            elif color.get(child, WHITE) == GREY:
+                back_edges.append([node, child])
+            elif color.get(child, WHITE) == WHITE:
+                color[child] = GREY
+                stack.append((child, iter(graph.get(child, ()))))
+    return back_edges
+
+async def traverse(root: str, direction: str = "downstream", max_depth: int = 3, max_nodes: int = 500,
+                   strategy: str = "bfs", include_nodes: bool = True) -> dict:
+    """
+    Walk the relationship graph from `root` and return the reachable subgraph.
+
+    direction is "downstream" (parent -> child), "upstream" (child -> parent)
+    or "both"; strategy is "bfs" or "dfs". Visiting stops at max_depth hops or
+    max_nodes CIs: `truncated` is set when the node limit cut the walk short and
+    `depth_limit_reached` when CIs at max_depth were left unexpanded. Edges
+    that close a cycle are reported in `cycles`.
+    """
+    directions = list(DIRECTIONS) if direction == "both" else [direction]
+    if any(d not in DIRECTIONS for d in directions):
+        raise ValueError(f"Unknown direction: {direction}")
+    if strategy not in ("bfs", "dfs"):
+        raise ValueError(f"Unknown strategy: {strategy}")
+    max_depth = max(0, min(int(max_depth), MAX_DEPTH))
+    max_nodes = max(1, min(int(max_nodes), MAX_NODES))
+    stats = {"queries": 0, "cache_hits": 0}
+    depth_of = {root: 0}
+    edges = {}
+    truncated = False
+
+    def visit(node: str, depth: int, links: list) -> list:
+        # Record the edges out of `node`; return newly discovered neighbours.
+        nonlocal truncated
+        discovered = []
+        for neighbour, edge in links:
+            if neighbour in depth_of or len(depth_of) < max_nodes:
+                edges[edge["sys_id"]] = edge
+            if neighbour in depth_of:
+                continue
+            if len(depth_of) >= max_nodes:
+                truncated = True
+                continue
+            depth_of[neighbour] = depth + 1
+            discovered.append(neighbour)
+        return discovered
+
+    if strategy == "bfs":
+        frontier = [root]
+        for depth in range(max_depth):
+            if not frontier:
+                break
+            links = await _neighbours(frontier, directions, stats)
+            frontier = [found for node in frontier for found in visit(node, depth, links[node])]
+    else:
+        stack, expanded, prefetched = [root], set(), {}
+        while stack:
+            node = stack.pop()
+            if node in expanded or depth_of[node] >= max_depth:
+                continue
+            if node not in prefetched:
+                # Fetch this node together with the next stack entries, keeping DFS order.
+                upcoming = [n for n in reversed(stack[-(_IN_CHUNK - 1):])
+                            if n not in expanded and n not in prefetched and depth_of[n] < max_depth]
+                prefetched.update(await _neighbours([node] + upcoming, directions, stats))
+            expanded.add(node)
+            stack.extend(reversed(visit(node, depth_of[node], prefetched.pop(node))))
+
+    nodes = [{"sys_id": sys_id, "depth": depth} for sys_id, depth in depth_of.items()]
+    if include_nodes:
+        details = await _node_details(list(depth_of), stats)
+        for node in nodes:
+            node.update(details.get(node["sys_id"], {}))
+    return {
+        "root": root,
+        "direction": direction,
+        "strategy": strategy,
+        "nodes": nodes,
+        "edges": list(edges.values()),
+        "cycles": find_cycles(edges),
+        "truncated": truncated,
+        "depth_limit_reached": max_depth in depth_of.values(),
+        "stats": {**stats, "node_count": len(nodes), "edge_count": len(edges)},
+    }
+
+async def _node_details(ids: list, stats: dict) -> dict:
+    async def fetch(chunk: list) -> list:
+        query = ids_in(chunk)
+        return [ci async for ci in sn_async.aiter_records("cmdb_ci", query, fields=NODE_FIELDS, exclude_reference_link=True)]
+    chunks = [ids[i:i + _IN_CHUNK] for i in range(0, len(ids), _IN_CHUNK)]
+    stats["queries"] += len(chunks)
+    details = {}
+    for rows in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+        for row in rows:
+            details[row["sys_id"]] = {key: value for key, value in row.items() if key != "sys_id"}
+    return details
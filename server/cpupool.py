@@ -0,0 +1,185 @@
+# server/cpupool.py
+import asyncio
+import atexit
+import inspect
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import weakref
+from config import (
+    SN_PROCESS_POOL_ENABLED, SN_PROCESS_POOL_WORKERS, SN_PROCESS_POOL_TIMEOUT, SN_PROCESS_POOL_MAX_RESULT_BYTES
+)
+
+# A managed pool of worker processes for CPU-bound tool work (analytics
+# scoring, CMDB deduplication keys and clustering), which would otherwise hold
+# the GIL and stall every other request on the event loop. Workers only
+# compute: the tool fetches its data in the parent, through the instance's
+# rate limiter, breaker, cache and metrics, and run(fn, ...) ships a
+# module-level function with compact arguments (NumPy columns, a chunk of
+# rows, a local file path) to an idle worker, which calls it and sends back
+# the pickled result. Workers never open a ServiceNow connection and get no
+# instance settings or credentials; coroutine functions are refused. Results
+# larger than SN_PROCESS_POOL_MAX_RESULT_BYTES are refused in the worker. A
+# job that is cancelled (e.g. the MCP client cancelled the call) or runs past
+# its timeout has its worker killed, and a new worker is started for the next
+# job. Workers are spawned, not forked, so they never inherit the parent's
+# threads, sockets or locks, and are kept for reuse. With
+# SN_PROCESS_POOL_ENABLED off, run() calls the function in a thread.
+
+_OK, _ERROR = b"\x00", b"\x01"
+
+class ResultTooLarge(ValueError):
+    pass
+
+def _picklable(error: BaseException) -> BaseException:
+    # Exceptions that cannot be rebuilt from their pickle (e.g. httpx errors) travel as RuntimeError.
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+def _serve(connection) -> None:
+    # Worker process main loop: one job at a time until the parent closes the pipe.
+    sys.stdout = sys.stderr  # stdout may be the MCP stdio transport of the parent
+    try:
+        while True:
+            try:
+                fn, args, kwargs, max_bytes = connection.recv()
+            except EOFError:
+                return
+            try:
+                result = fn(*args, **kwargs)
+                payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+                if len(payload) > max_bytes:
+                    raise ResultTooLarge(f"Result of {fn.__qualname__} is {len(payload)} bytes, over the "
+                                         f"{max_bytes} byte limit; narrow the query or set a limit")
+                connection.send_bytes(_OK + payload)
+            except Exception as e:
+                connection.send_bytes(_ERROR + pickle.dumps(_picklable(e)))
+    except KeyboardInterrupt:
+        pass
+
+class _Worker:
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True, name="sn-cpu-worker")
+        self.process.start()
+        child.close()
+
+    def call(self, job: tuple) -> bytes:
+        # Blocking round trip, run in a thread; fails with EOFError/OSError once the worker is killed.
+        self.connection.send(job)
+        return self.connection.recv_bytes()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(5)
+        self.connection.close()
+
+class ProcessPool:
+    def __init__(self, workers: int = SN_PROCESS_POOL_WORKERS, timeout: float = SN_PROCESS_POOL_TIMEOUT,
+                 max_result_bytes: int = SN_PROCESS_POOL_MAX_RESULT_BYTES, enabled: bool = SN_PROCESS_POOL_ENABLED):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_result_bytes = max_result_bytes
+        self.enabled = enabled
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._busy = set()
+        self._slots = weakref.WeakKeyDictionary()  # event loop -> Semaphore(workers)
+        self._counters = dict.fromkeys(("jobs", "failed", "cancelled", "timeouts", "too_large", "started", "killed"), 0)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._slots:
+            self._slots[loop] = asyncio.Semaphore(self.workers)
+        return self._slots[loop]
+
+    def _acquire(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.process.is_alive():
+                return worker
+            worker.connection.close()
+        self._counters["started"] += 1
+        return _Worker(self._context)
+
+    def _discard(self, worker: _Worker) -> None:
+        self._busy.discard(worker)
+        self._counters["killed"] += 1
+        worker.kill()
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        Call `fn(*args, **kwargs)` in a worker process and return its result.
+        `fn` is a plain module-level function of its arguments; it must not
+        reach ServiceNow. Raises TimeoutError past `timeout` (default: the
+        pool's), ResultTooLarge for an oversized result and the function's
+        own exception otherwise.
+        """
+        if inspect.iscoroutinefunction(fn):
+            raise ValueError(f"{fn.__qualname__} is a coroutine function; fetch its data first and pass it to a plain function")
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        job = (fn, args, kwargs, self.max_result_bytes)
+        timeout = timeout or self.timeout
+        async with self._semaphore():
+            self._counters["jobs"] += 1
+            worker = self._acquire()
+            self._busy.add(worker)
+            try:
+                message = await asyncio.wait_for(asyncio.to_thread(worker.call, job), timeout)
+            except asyncio.TimeoutError:
+                self._counters["timeouts"] += 1
+                self._discard(worker)
+                raise TimeoutError(f"{fn.__qualname__} did not finish within {timeout}s; its worker was stopped")
+            except asyncio.CancelledError:
+                self._counters["cancelled"] += 1
+                self._discard(worker)
+                raise
+            except (EOFError, OSError) as e:
+                self._counters["failed"] += 1
+                self._discard(worker)
+                raise RuntimeError(f"Worker process for {fn.__qualname__} exited unexpectedly ({type(e).__name__})")
+            self._busy.discard(worker)
+            self._idle.append(worker)
+        if message[:1] == _OK:
+            return pickle.loads(message[1:])
+        error = pickle.loads(message[1:])
+        self._counters["too_large" if isinstance(error, ResultTooLarge) else "failed"] += 1
+        raise error
+
+    def shutdown(self) -> None:
+        """
+        Stop every worker (idle and busy).
+        """
+        for worker in self._idle + list(self._busy):
+            try:
+                worker.kill()
+            except Exception as e:
+                logging.debug(f"Stopping worker process failed: {str(e)}")
+        self._idle.clear()
+        self._busy.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "idle": len(self._idle),
+            "busy": len(self._busy),
+            "timeout": self.timeout,
+            "max_result_bytes": self.max_result_bytes,
+        }
+
+pool = ProcessPool()
+atexit.register(pool.shutdown)
+
+async def run(fn, *args, **kwargs):
+    """
+    Run `fn` in the shared pool (see ProcessPool.run).
+    """
+    return await pool.run(fn, *args, **kwargs)
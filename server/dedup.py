@@ -0,0 +1,265 @@
+# server/dedup.py
+import asyncio
+import hashlib
+import ipaddress
+import itertools
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zlib
+from server import cpupool
+
+# Streaming CI deduplication. Records are read once; every record emits a few
+# blocking keys (normalized name, serial number, MAC address and, when fuzzy
+# matching is on, MinHash LSH bands of the name). Keys are spilled to an
+# on-disk SQLite index so memory stays flat, and only records that share a key
+# are ever compared, so the run is never O(n^2). Records are fetched on the
+# event loop and each chunk is keyed and inserted in a worker thread: keying
+# costs less than pickling the chunk to another process would. Only the final
+# clustering, which reads nothing but the local SQLite file, runs in the
+# worker process pool (server/cpupool.py).
+
+EXACT_KEYS = ("name", "serial_number", "mac_address")
+
+DEDUP_FIELDS = ["sys_id", "name", "ci_type", "fqdn", "serial_number", "mac_address"]
+
+_JUNK_SERIALS = {"", "none", "null", "n/a", "na", "unknown", "0", "default", "tobefilledbyoem", "systemserialnumber"}
+_JUNK_MACS = {"000000000000", "ffffffffffff"}
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+
+_CHUNK = 5000  # records keyed and inserted at a time
+
+_MINHASH_BANDS = 8
+_MINHASH_ROWS = 4
+_MERSENNE = (1 << 61) - 1
+_MINHASH_SEEDS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE)
+    for i in range(_MINHASH_BANDS * _MINHASH_ROWS)
+]
+
+def normalize_name(value: str) -> str:
+    """
+    Case-fold, collapse whitespace and reduce a host FQDN to its short name
+    ("Web01.corp.example.com " -> "web01"). IP addresses are left intact.
+    """
+    value = _WHITESPACE.sub(" ", (value or "").strip().lower())
+    if "." in value and " " not in value:
+        try:
+            ipaddress.ip_address(value)
+        except ValueError:
+            value = value.split(".", 1)[0]
+    return value
+
+def normalize_serial(value: str) -> str:
+    value = re.sub(r"[\s\-_.:]", "", (value or "").lower())
+    return "" if value in _JUNK_SERIALS else value
+
+def normalize_mac(value: str) -> str:
+    value = re.sub(r"[^0-9a-f]", "", (value or "").lower())
+    return value if len(value) == 12 and value not in _JUNK_MACS else ""
+
+def _shingles(name: str, size: int = 3) -> set:
+    padded = f" {name} "
+    return {padded[i:i + size] for i in range(max(1, len(padded) - size + 1))}
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _lsh_bands(name: str) -> list:
+    hashes = [zlib.crc32(shingle.encode()) for shingle in _shingles(name)]
+    signature = [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _MINHASH_SEEDS]
+    return [
+        f"{band}:{hash(tuple(signature[band * _MINHASH_ROWS:(band + 1) * _MINHASH_ROWS]))}"
+        for band in range(_MINHASH_BANDS)
+    ]
+
+def blocking_keys(ci: dict, keys: tuple, fuzzy: bool) -> list:
+    """
+    Return [(kind, key), ...] for a CI. Records sharing any key are duplicate
+    candidates; exact kinds link them directly, "fuzzy_name" needs verification.
+    """
+    result = []
+    ci_type = normalize_name(ci.get("ci_type") or "")
+    names = {normalize_name(ci.get("name")), normalize_name(ci.get("fqdn"))} - {""}
+    if "name" in keys:
+        result.extend(("name", f"{name}|{ci_type}") for name in names)
+    if "serial_number" in keys:
+        serial = normalize_serial(ci.get("serial_number"))
+        if serial:
+            result.append(("serial_number", serial))
+    if "mac_address" in keys:
+        mac = normalize_mac(ci.get("mac_address"))
+        if mac:
+            result.append(("mac_address", mac))
+    if fuzzy:
+        for name in names:
+            result.extend(("fuzzy_name", f"{ci_type}|{band}") for band in _lsh_bands(name))
+    return result
+
+def _key_hash(kind: str, key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{kind}\0{key}".encode(), digest_size=8).digest(), "big", signed=True)
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+        self.kinds = {}
+
+    def find(self, item: int) -> int:
+        parent = self.parent.setdefault(item, item)
+        while parent != self.parent[parent]:
+            self.parent[parent] = self.parent[self.parent[parent]]
+            parent = self.parent[parent]
+        self.parent[item] = parent
+        return parent
+
+    def union(self, a: int, b: int, kind: str) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        kinds = self.kinds.pop(root_a, set()) | self.kinds.pop(root_b, set()) | {kind}
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+        self.kinds[root_a] = kinds
+
+async def find_duplicate_clusters(records, keys: tuple = EXACT_KEYS,
+                                  fuzzy: bool = False, similarity: float = 0.8, max_bucket: int = 500,
+                                  max_clusters: int = 1000, progress_every: int = 50000,
+                                  on_progress=None, workdir: str = None) -> dict:
+    """
+    Consume an async iterator of CI dicts and return duplicate clusters.
+
+    Each cluster lists its members and the key kinds that linked them. Fuzzy
+    name candidates (MinHash LSH on name trigrams) are confirmed with a Jaccard
+    similarity of at least `similarity`. Keys shared by more than `max_bucket`
+    records (LSH bands, but also exact values such as a "localhost" name or a
+    placeholder serial) are skipped as too generic and counted in
+    `stats["skipped_keys"]`. At most `max_clusters` clusters (largest first)
+    are returned, the total is always reported in `stats`. Keying and
+    inserts run in a worker thread and clustering in the worker process
+    pool, off the event loop.
+    """
+    unknown = set(keys) - set(EXACT_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown dedup keys: {sorted(unknown)}")
+    fd, path = tempfile.mkstemp(prefix="cmdb_dedup_", suffix=".sqlite", dir=workdir)
+    os.close(fd)
+    db = sqlite3.connect(path, check_same_thread=False)  # used by one worker thread at a time
+    try:
+        db.executescript("""
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            PRAGMA cache_size=-16384;
+            CREATE TABLE ci (id INTEGER PRIMARY KEY, sys_id TEXT, name TEXT, ci_type TEXT);
+            CREATE TABLE ci_key (key INTEGER, kind TEXT, ci INTEGER);
+        """)
+        started = time.monotonic()
+        scanned = 0
+        chunk = []
+        async for ci in records:
+            scanned += 1
+            chunk.append(ci)
+            if len(chunk) >= _CHUNK:
+                await _add(db, chunk, scanned - len(chunk) + 1, keys, fuzzy)
+                chunk = []
+            if progress_every and scanned % progress_every == 0:
+                rate = scanned / max(time.monotonic() - started, 1e-9)
+                logging.info("CMDB dedup: %d CIs scanned (%.0f CIs/s)", scanned, rate)
+                if on_progress:
+                    on_progress(scanned, rate)
+        await _add(db, chunk, scanned - len(chunk) + 1, keys, fuzzy)
+        scan_seconds = time.monotonic() - started
+        db.close()
+
+        clusters, stats = await cpupool.run(_cluster, path, similarity, max_bucket, max_clusters)
+        elapsed = time.monotonic() - started
+        return {
+            "clusters": clusters,
+            "stats": {
+                "scanned": scanned,
+                **stats,
+                "scan_seconds": round(scan_seconds, 3),
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(scanned / max(elapsed, 1e-9), 1),
+            },
+        }
+    finally:
+        db.close()
+        os.unlink(path)
+
+async def _add(db: sqlite3.Connection, chunk: list, first: int, keys: tuple, fuzzy: bool) -> None:
+    # Number the chunk's records from `first`, key them and spill both to the index, in a worker thread.
+    if chunk:
+        await asyncio.to_thread(_insert, db, chunk, first, keys, fuzzy)
+
+def _insert(db: sqlite3.Connection, chunk: list, first: int, keys: tuple, fuzzy: bool) -> None:
+    ci_rows = [(first + offset, ci.get("sys_id"), ci.get("name"), ci.get("ci_type")) for offset, ci in enumerate(chunk)]
+    key_rows = [(_key_hash(kind, key), kind, first + offset)
+                for offset, ci in enumerate(chunk) for kind, key in blocking_keys(ci, keys, fuzzy)]
+    with db:
+        db.executemany("INSERT INTO ci VALUES (?, ?, ?, ?)", ci_rows)
+        db.executemany("INSERT INTO ci_key VALUES (?, ?, ?)", key_rows)
+
+def _cluster(path: str, similarity: float, max_bucket: int, max_clusters: int) -> tuple:
+    # Link records that share a key and return (clusters, stats); blocking, reads the scan's SQLite file.
+    db = sqlite3.connect(path)
+    try:
+        db.execute("PRAGMA cache_size=-16384")
+        db.execute("CREATE INDEX ci_key_key ON ci_key (key)")
+        skipped = db.execute("""
+            SELECT COUNT(*) FROM (SELECT key FROM ci_key GROUP BY key HAVING COUNT(DISTINCT ci) > ?)
+        """, (max_bucket,)).fetchone()[0]
+        shared = db.execute("""
+            SELECT k.key, k.kind, k.ci FROM ci_key k
+            JOIN (SELECT key FROM ci_key GROUP BY key HAVING COUNT(DISTINCT ci) BETWEEN 2 AND ?) d ON d.key = k.key
+            ORDER BY k.key
+        """, (max_bucket,))
+        clusters = _UnionFind()
+        for (_, kind), group in itertools.groupby(shared, key=lambda row: (row[0], row[1])):
+            members = sorted({row[2] for row in group})
+            if kind != "fuzzy_name":
+                for other in members[1:]:
+                    clusters.union(members[0], other, kind)
+            else:
+                _link_similar(db, clusters, members, similarity)
+
+        roots = {}
+        for member in list(clusters.parent):
+            roots.setdefault(clusters.find(member), []).append(member)
+        roots = {root: members for root, members in roots.items() if len(members) > 1}
+        ranked = sorted(roots.items(), key=lambda item: len(item[1]), reverse=True)
+        result = [{
+            "matched_on": sorted(clusters.kinds.get(root, ())),
+            "members": [{"sys_id": sys_id, "name": name, "ci_type": ci_type}
+                        for _, sys_id, name, ci_type in _rows(db, "id, sys_id, name, ci_type", members)],
+        } for root, members in ranked[:max_clusters]]
+        return result, {
+            "clusters": len(roots),
+            "duplicate_records": sum(len(members) - 1 for members in roots.values()),
+            "truncated": len(roots) > max_clusters,
+            "skipped_keys": skipped,
+        }
+    finally:
+        db.close()
+
+def _rows(db: sqlite3.Connection, columns: str, ids: list, chunk: int = 500) -> list:
+    # Rows of `ids` in id order, looked up `chunk` ids at a time (clusters can chain many buckets).
+    rows = []
+    ids = sorted(ids)
+    for offset in range(0, len(ids), chunk):
+        part = ids[offset:offset + chunk]
+        rows.extend(db.execute(f"SELECT {columns} FROM ci WHERE id IN ({','.join('?' * len(part))}) ORDER BY id", part))
+    return rows
+
+def _link_similar(db: sqlite3.Connection, clusters: _UnionFind, members: list, similarity: float) -> None:
+    # Confirm LSH candidates within one bucket; only these few rows are compared pairwise.
+    names = {ci_id: normalize_name(name) for ci_id, name in _rows(db, "id, name", members)}
+    shingles = {ci_id: _shingles(name) for ci_id, name in names.items()}
+    for a, b in itertools.combinations(members, 2):
+        # Sequential host names ("web101" / "web102") are distinct machines, so numbers must agree.
+        if _DIGITS.findall(names[a]) != _DIGITS.findall(names[b]):
+            continue
+        if clusters.find(a) != clusters.find(b) and _jaccard(shingles[a], shingles[b]) >= similarity:
+            clusters.union(a, b, "fuzzy_name")
@@ -0,0 +1,55 @@
+# server/diagnostics.py
+import asyncio
+from servicenow_client import resilience, instances, sn_client, sn_async
+from servicenow_client.replica import replica_store
+from server import registry, metrics, cpupool
+from server.registry import tool
+
+# MCP tools
+@tool("cache_stats", "Show record cache hit/miss/eviction counters and size for an instance")
+def _cache_stats_tool(arguments: dict):
+    return instances.current().cache.stats()
+
+@tool("client_stats", "Show rate limiter, retry and circuit breaker metrics per instance and user, and an instance's OAuth token refreshes")
+def _client_stats_tool(arguments: dict):
+    return {"guards": resilience.stats(), "oauth": instances.current().tokens.stats()}
+
+@tool("coalescing_stats", "Show how many identical concurrent tool calls and ServiceNow reads shared one upstream call")
+def _coalescing_stats_tool(arguments: dict):
+    return {
+        "tools": registry.tool_flights.stats(),
+        "requests": {"async": sn_async.request_flights.stats(), "sync": sn_client.request_flights.stats()},
+    }
+
+@tool("server_stats", "Show tool and ServiceNow request latency percentiles, payload sizes and status codes, cache, retry and coalescing counters, and recent trace spans", {
+    "type": "object",
+    "properties": {
+        "spans": {"type": "integer", "minimum": 0, "description": "Number of recent spans to include (default 20)"},
+        "trace_id": {"type": "string", "description": "Only include spans of this trace"}
+    }
+})
+def _server_stats_tool(arguments: dict):
+    return metrics.snapshot(arguments.get("spans", 20), arguments.get("trace_id"))
+
+@tool("process_pool_stats", "Show the worker process pool used by CPU-bound tools: size, busy workers, jobs, timeouts, cancellations and oversized results")
+def _process_pool_stats_tool(arguments: dict):
+    return cpupool.pool.stats()
+
+@tool("list_instances", "List the ServiceNow instances this server can route to")
+def _list_instances_tool(arguments: dict):
+    loaded = {instance.name: instance for instance in instances.loaded()}
+    return [loaded[name].describe() if name in loaded else {"name": name, "loaded": False} for name in instances.names()]
+
+@tool("replica_status", "Show local replica lag, row counts and last sync figures per table")
+def _replica_status_tool(arguments: dict):
+    return replica_store.stats()
+
+@tool("replica_sync", "Sync replicated tables from the instance now", {
+    "type": "object",
+    "properties": {
+        "tables": {"type": "array", "items": {"type": "string"}},
+        "full": {"type": "boolean", "description": "Reload the tables instead of pulling changes since the watermark"}
+    }
+})
+async def _replica_sync_tool(arguments: dict):
+    return await asyncio.to_thread(replica_store.sync, arguments.get("tables"), arguments.get("full", False))
@@ -1 +1,118 @@
+# server/dynamic_tools.py
+from servicenow_client import sn_async
+from server import registry
+from server.base import PROJECTION_PROPERTIES
 
+# Tools registered at runtime. Each one maps onto a single Table API operation
+# on a table and is added to the same registry as the built-in tools, so it is
+# dispatched and listed exactly like them without a restart.
+
+_DEFAULT_SCHEMAS = {
+    "create": {"type": "object"},
+    "read": {
+        "type": "object",
+        "properties": {"sys_id": {"type": "string"}, **PROJECTION_PROPERTIES},
+        "required": ["sys_id"]
+    },
+    "update": {
+        "type": "object",
+        "properties": {
+            "sys_id": {"type": "string"},
+            "data": {"type": "object"}
+        },
+        "required": ["sys_id", "data"]
+    },
+    "delete": {
+        "type": "object",
+        "properties": {"sys_id": {"type": "string"}},
+        "required": ["sys_id"]
+    },
+    "query": {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string"},
+            "limit": {"type": "number"},
+            "offset": {"type": "number"},
+            **PROJECTION_PROPERTIES
+        }
+    }
+}
+
+_definitions = {}
+
+def _make_handler(table: str, operation: str):
+    async def handler(arguments: dict):
+        if operation == "create":
+            return await sn_async.create_record(table, arguments)
+        if operation == "read":
+            return await sn_async.read_record(
+                table, arguments["sys_id"], arguments.get("fields"),
+                arguments.get("display_value"), arguments.get("exclude_reference_link", False)
+            )
+        if operation == "update":
+            return await sn_async.update_record(table, arguments["sys_id"], arguments["data"])
+        if operation == "delete":
+            return await sn_async.delete_record(table, arguments["sys_id"])
+        return await sn_async.query_records(
+            table, arguments.get("query", ""), arguments.get("limit", 100), arguments.get("offset", 0),
+            arguments.get("fields"), arguments.get("display_value"), arguments.get("exclude_reference_link", False)
+        )
+    return handler
+
+def register_tool(definition: dict) -> dict:
+    """
+    Register a new tool at runtime.
+    definition: {"name", "table", "operation" (create/read/update/delete/query),
+    optional "description" and "input_schema"}.
+    """
+    name = definition["name"]
+    operation = definition["operation"]
+    if operation not in _DEFAULT_SCHEMAS:
+        raise ValueError(f"Unsupported operation: {operation}")
+    if name in registry.names(dynamic=False):
+        raise ValueError(f"Cannot replace built-in tool: {name}")
+    description = definition.get("description") or f"{operation.capitalize()} {definition['table']} records"
+    schema = definition.get("input_schema") or _DEFAULT_SCHEMAS[operation]
+    registry.register(name, description, schema, _make_handler(definition["table"], operation), dynamic=True, replace=True,
+                      coalesce=operation in ("read", "query"))
+    _definitions[name] = {"name": name, "description": description, "table": definition["table"], "operation": operation}
+    return _definitions[name]
+
+def deregister_tool(name: str) -> dict:
+    """
+    Remove a tool that was registered at runtime.
+    """
+    if name not in _definitions:
+        raise ValueError(f"Dynamic tool not found: {name}")
+    registry.unregister(name)
+    return {"deregistered": _definitions.pop(name)["name"]}
+
+def list_registered_tools() -> list:
+    return list(_definitions.values())
+
+# MCP tools
+@registry.tool("register_tool", "Register a new dynamic tool", {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "table": {"type": "string"},
+        "operation": {"type": "string", "enum": sorted(_DEFAULT_SCHEMAS)},
+        "input_schema": {"type": "object"}
+    },
+    "required": ["name", "table", "operation"]
+})
+def _register_tool_tool(arguments: dict):
+    return register_tool(arguments)
+
+@registry.tool("deregister_tool", "Deregister a tool by name", {
+    "type": "object",
+    "properties": {"name": {"type": "string"}},
+    "required": ["name"]
+})
+def _deregister_tool_tool(arguments: dict):
+    return deregister_tool(arguments["name"])
+
+@registry.tool("list_registered_tools", "List all dynamically registered tools")
+def _list_registered_tools_tool(arguments: dict):
+    return list_registered_tools()
@@ -1 +1,60 @@
+# server/employee_experience.py
+from servicenow_client import sn_async
+from server.base import CURSOR_PROPERTIES
+from server.registry import tool
+from server import streaming
+from server.streaming import STREAM_PROPERTIES
 
+# Custom table holding employee feedback records
+FEEDBACK_TABLE = "u_employee_feedback"
+
+async def get_employee_feedback(query: str = "active=true", limit: int = 100, offset: int = 0, cursor: str = None) -> dict:
+    """
+    Retrieve employee feedback records matching the query, a page at a time
+    (pass the returned next_cursor as `cursor`).
+    """
+    return await sn_async.query_page(FEEDBACK_TABLE, query, limit, cursor, offset)
+
+async def create_employee_feedback(data: dict) -> dict:
+    """
+    Record a new piece of employee feedback.
+    """
+    return await sn_async.create_record(FEEDBACK_TABLE, data)
+
+# MCP tools
+@tool("ee_get_feedback", "Get employee feedback records", {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "limit": {"type": "number"},
+        "offset": {"type": "number"},
+        **CURSOR_PROPERTIES,
+        **STREAM_PROPERTIES
+    }
+}, coalesce=True)
+async def _get_feedback_tool(arguments: dict):
+    if streaming.requested(arguments):
+        page = {}
+        summary = await streaming.send_rows(sn_async.astream_page(
+            FEEDBACK_TABLE, arguments.get("query", "active=true"), arguments.get("limit", 100), arguments.get("cursor"),
+            arguments.get("offset", 0), page=page
+        ), table=FEEDBACK_TABLE)
+        return {**summary, **page}
+    return await get_employee_feedback(
+        query=arguments.get("query", "active=true"),
+        limit=arguments.get("limit", 100),
+        offset=arguments.get("offset", 0),
+        cursor=arguments.get("cursor")
+    )
+
+@tool("ee_create_feedback", "Create a new employee feedback record", {
+    "type": "object",
+    "properties": {
+        "employee_id": {"type": "string"},
+        "feedback": {"type": "string"},
+        "rating": {"type": "number"}
+    },
+    "required": ["employee_id", "feedback"]
+})
+async def _create_feedback_tool(arguments: dict):
+    return await create_employee_feedback(arguments)
@@ -1 +1,21 @@
+# server/ham.py
+from servicenow_client import sn_async
+from server.registry import tool
 
+async def create_asset(data: dict) -> dict:
+    """
+    Create a hardware asset record (alm_hardware).
+    """
+    return await sn_async.create_record("alm_hardware", data)
+
+# MCP tools
+@tool("ham_create_asset", "Create a HAM asset", {
+    "type": "object",
+    "properties": {
+        "asset_tag": {"type": "string"},
+        "model": {"type": "string"}
+    },
+    "required": ["asset_tag", "model"]
+})
+async def _create_asset_tool(arguments: dict):
+    return await create_asset(arguments)
@@ -1 +1,21 @@
+# server/itom.py
+from servicenow_client import sn_async
+from server.registry import tool
 
+async def create_event(data: dict) -> dict:
+    """
+    Create an event in the Event Management table (em_event).
+    `event_description` is stored as the event's description.
+    """
+    record = {key: value for key, value in data.items() if key != "event_description"}
+    record["description"] = data["event_description"]
+    return await sn_async.create_record("em_event", record)
+
+# MCP tools
+@tool("itom_create_event", "Create an ITOM event", {
+    "type": "object",
+    "properties": {"event_description": {"type": "string"}},
+    "required": ["event_description"]
+})
+async def _create_event_tool(arguments: dict):
+    return await create_event(arguments)
@@ -1,15 +1,81 @@
 
 # server/itsm.py
-from servicenow_client import sn_client
+from servicenow_client import sn_async
+from server.base import summarize_bulk_results, PROJECTION_PROPERTIES, BULK_CREATE_SCHEMA, BULK_UPDATE_SCHEMA
+from server.registry import tool
 
-def create_incident(data: dict) -> dict:
-    return sn_client.create_record("incident", data)
+async def create_incident(data: dict) -> dict:
+    return await sn_async.create_record("incident", data)
 
-def read_incident(sys_id: str) -> dict:
-    return sn_client.read_record("incident", sys_id)
+async def read_incident(sys_id: str, fields: list = None, display_value: str = None,
+                        exclude_reference_link: bool = False) -> dict:
+    return await sn_async.read_record("incident", sys_id, fields, display_value, exclude_reference_link)
 
-def update_incident(sys_id: str, data: dict) -> dict:
-    return sn_client.update_record("incident", sys_id, data)
+async def update_incident(sys_id: str, data: dict) -> dict:
+    return await sn_async.update_record("incident", sys_id, data)
 
-def delete_incident(sys_id: str) -> dict:
-    return sn_client.delete_record("incident", sys_id)
+async def delete_incident(sys_id: str) -> dict:
+    return await sn_async.delete_record("incident", sys_id)
+
+async def bulk_create_incident(records: list) -> dict:
+    return summarize_bulk_results(await sn_async.bulk_create_records("incident", records))
+
+async def bulk_update_incident(updates: list) -> dict:
+    """
+    updates: [{"sys_id": ..., "data": {...}}, ...]
+    """
+    pairs = [(update["sys_id"], update["data"]) for update in updates]
+    return summarize_bulk_results(await sn_async.bulk_update_records("incident", pairs))
+
+# MCP tools
+@tool("itsm_create_incident", "Create a new ITSM incident", {
+    "type": "object",
+    "properties": {
+        "short_description": {"type": "string"},
+        "caller_id": {"type": "string"},
+        "priority": {"type": "string"}
+    },
+    "required": ["short_description", "caller_id"]
+})
+async def _create_incident_tool(arguments: dict):
+    return await create_incident(arguments)
+
+@tool("itsm_read_incident", "Read an ITSM incident by sys_id", {
+    "type": "object",
+    "properties": {"sys_id": {"type": "string"}, **PROJECTION_PROPERTIES},
+    "required": ["sys_id"]
+}, coalesce=True)
+async def _read_incident_tool(arguments: dict):
+    return await read_incident(
+        arguments["sys_id"],
+        fields=arguments.get("fields"),
+        display_value=arguments.get("display_value"),
+        exclude_reference_link=arguments.get("exclude_reference_link", False)
+    )
+
+@tool("itsm_update_incident", "Update an ITSM incident", {
+    "type": "object",
+    "properties": {
+        "sys_id": {"type": "string"},
+        "data": {"type": "object"}
+    },
+    "required": ["sys_id", "data"]
+})
+async def _update_incident_tool(arguments: dict):
+    return await update_incident(arguments["sys_id"], arguments["data"])
+
+@tool("itsm_delete_incident", "Delete an ITSM incident", {
+    "type": "object",
+    "properties": {"sys_id": {"type": "string"}},
+    "required": ["sys_id"]
+})
+async def _delete_incident_tool(arguments: dict):
+    return await delete_incident(arguments["sys_id"])
+
+@tool("itsm_bulk_create_incident", "Create many ITSM incidents in one call via the Batch API", BULK_CREATE_SCHEMA)
+async def _bulk_create_incident_tool(arguments: dict):
+    return await bulk_create_incident(arguments["records"])
+
+@tool("itsm_bulk_update_incident", "Update many ITSM incidents in one call via the Batch API", BULK_UPDATE_SCHEMA)
+async def _bulk_update_incident_tool(arguments: dict):
+    return await bulk_update_incident(arguments["updates"])
@@ -0,0 +1,107 @@
+# server/metrics.py
+from servicenow_client import telemetry, resilience, instances, sn_client, sn_async
+from server import registry
+
+# Prometheus text exposition (format 0.0.4) of the telemetry histograms and of
+# the counters the other components already keep: record caches, rate
+# limiter / retry / circuit breaker guards, OAuth tokens and request
+# coalescing. Served at /metrics by portal.py; snapshot() backs the
+# server_stats tool with the same figures as JSON plus recent spans.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+def _family(name: str, kind: str, description: str, samples: list) -> list:
+    # samples: [(labels dict, value)]
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples]
+    return lines
+
+def _histogram(histogram: telemetry.Histogram) -> list:
+    lines = [f"# HELP {histogram.name} {histogram.description}", f"# TYPE {histogram.name} histogram"]
+    for labels, counts, total, count, _ in histogram.series():
+        cumulative = 0
+        for bound, bucket in zip([*histogram.buckets, float("inf")], counts):
+            cumulative += bucket
+            lines.append(f"{histogram.name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+        lines.append(f"{histogram.name}_sum{_labels(labels)} {_number(float(total))}")
+        lines.append(f"{histogram.name}_count{_labels(labels)} {count}")
+    return lines
+
+def _counters(prefix: str, description: str, stats: list, counters: tuple) -> list:
+    # stats: [(labels dict, stats dict)]; one counter family per name in `counters`.
+    lines = []
+    for counter in counters:
+        samples = [(labels, values[counter]) for labels, values in stats if counter in values]
+        if samples:
+            lines += _family(f"{prefix}_{counter}_total", "counter", f"{description}: {counter}", samples)
+    return lines
+
+def _cache_stats() -> list:
+    return [({"instance": instance.name, "cache": name}, cache.stats())
+            for instance in instances.loaded() for name, cache in instance.caches().items()]
+
+def _flight_stats() -> list:
+    flights = {"tools": registry.tool_flights, "async_requests": sn_async.request_flights,
+               "sync_requests": sn_client.request_flights}
+    return [({"group": group, "label": label}, counts)
+            for group, flight in flights.items() for label, counts in flight.stats()["by_label"].items()]
+
+def render_prometheus() -> str:
+    lines = []
+    for histogram in telemetry.HISTOGRAMS:
+        lines += _histogram(histogram)
+    caches = _cache_stats()
+    lines += _counters("servicenow_cache", "Record cache events", caches,
+                       ("hits", "misses", "evictions", "expirations", "invalidations"))
+    lines += _family("servicenow_cache_entries", "gauge", "Entries held in the record cache",
+                     [(labels, stats["entries"]) for labels, stats in caches])
+    lines += _family("servicenow_cache_bytes", "gauge", "Approximate size of the record cache",
+                     [(labels, stats["bytes"]) for labels, stats in caches])
+    guards = [({"guard": name}, stats) for name, stats in resilience.stats().items()]
+    lines += _counters("servicenow_guard", "Rate limiter, retry and circuit breaker events", guards,
+                       ("requests", "rejected", "throttled", "retries", "retries_exhausted"))
+    lines += _family("servicenow_guard_throttle_wait_seconds_total", "counter", "Time spent waiting on Retry-After",
+                     [(labels, stats["throttle_wait_seconds"]) for labels, stats in guards])
+    lines += _family("servicenow_guard_rate", "gauge", "Current adaptive request rate (requests/s)",
+                     [(labels, stats["rate"]) for labels, stats in guards])
+    lines += _family("servicenow_breaker_open", "gauge", "1 while the circuit breaker is not closed",
+                     [(labels, int(stats["breaker"]["state"] != "closed")) for labels, stats in guards])
+    tokens = [({"instance": instance.name}, instance.tokens.stats()) for instance in instances.loaded()]
+    lines += _counters("servicenow_oauth", "OAuth token manager events", tokens,
+                       ("refreshes", "proactive_refreshes", "waits", "refresh_token_grants", "failures", "invalidations"))
+    flights = _flight_stats()
+    lines += _counters("servicenow_coalescing", "Single-flight calls", flights, ("calls", "coalesced"))
+    return "\n".join(lines) + "\n"
+
+def snapshot(spans: int = 20, trace_id: str = None) -> dict:
+    """
+    Latency and size percentiles per tool and table, cache, guard, OAuth and
+    coalescing counters, and the most recent spans.
+    """
+    return {
+        "tools": {"latency_seconds": telemetry.TOOL_LATENCY.summary(),
+                  "result_bytes": telemetry.TOOL_RESULT_BYTES.summary()},
+        "http": {"latency_seconds": telemetry.HTTP_LATENCY.summary(),
+                 "response_bytes": telemetry.HTTP_RESPONSE_BYTES.summary()},
+        "caches": {f"{labels['instance']}/{labels['cache']}": stats for labels, stats in _cache_stats()},
+        "guards": resilience.stats(),
+        "oauth": {instance.name: instance.tokens.stats() for instance in instances.loaded()},
+        "coalescing": {
+            "tools": registry.tool_flights.stats(),
+            "requests": {"async": sn_async.request_flights.stats(), "sync": sn_client.request_flights.stats()},
+        },
+        "spans": telemetry.recent_spans(spans, trace_id),
+    }
@@ -1 +1,25 @@
+# server/ppm.py
+from servicenow_client import sn_async
+from server.registry import tool
 
+async def create_project(data: dict) -> dict:
+    """
+    Create a project record (pm_project).
+    `project_name` and `owner` map to short_description and project_manager.
+    """
+    record = {key: value for key, value in data.items() if key not in ("project_name", "owner")}
+    record["short_description"] = data["project_name"]
+    record["project_manager"] = data["owner"]
+    return await sn_async.create_record("pm_project", record)
+
+# MCP tools
+@tool("ppm_create_project", "Create a PPM project", {
+    "type": "object",
+    "properties": {
+        "project_name": {"type": "string"},
+        "owner": {"type": "string"}
+    },
+    "required": ["project_name", "owner"]
+})
+async def _create_project_tool(arguments: dict):
+    return await create_project(arguments)
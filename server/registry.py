@@ -0,0 +1,156 @@
+# server/registry.py
+import inspect
+import json
+import logging
+import time
+import jsonschema
+import mcp.types as types
+from servicenow_client import instances, telemetry
+from servicenow_client.coalesce import AsyncSingleFlight
+from servicenow_client.encodedquery import canonical
+from server import streaming
+
+# Tool registry shared by main.py and the server/* modules. Modules register
+# their handlers with the @tool decorator at import time; call_tool dispatches
+# with a dict lookup and list_tools returns a list that is only rebuilt when
+# the registry changes (e.g. a dynamic tool is added or removed).
+# Every tool accepts an optional `instance` argument naming the ServiceNow
+# instance to run against (servicenow_client/instances.py). Identical calls of
+# a read-only tool (coalesce=True) that overlap in time share one handler run;
+# a write to a table the run has read detaches it (coalesce.forget), so later
+# calls start a new run.
+# Each call is a SERVER span (the parent of its ServiceNow request spans) and
+# is recorded in the tool latency histogram; main.call_tool records the size
+# of the result as it serializes it for the client.
+
+INSTANCE_PROPERTY = {"type": "string", "description": "ServiceNow instance to run against (default instance if omitted)"}
+
+def _with_instance(schema: dict) -> dict:
+    properties = schema.get("properties", {})
+    if schema.get("type") != "object":
+        return schema
+    return {**schema, "properties": {**properties, "instance": INSTANCE_PROPERTY}}
+
+class RegisteredTool:
+    def __init__(self, name: str, description: str, schema: dict, handler, dynamic: bool = False, coalesce: bool = False):
+        self.name = name
+        self.description = description
+        self.schema = _with_instance(schema)
+        self.handler = handler
+        self.dynamic = dynamic
+        self.coalesce = coalesce
+        # Validators are compiled once; jsonschema picks the draft from "$schema" (default: latest).
+        self.validator = jsonschema.validators.validator_for(schema)(self.schema)
+
+    def as_mcp_tool(self) -> types.Tool:
+        return types.Tool(name=self.name, description=self.description, inputSchema=self.schema)
+
+_tools = {}
+_tool_list = None
+_version = 0
+tool_flights = AsyncSingleFlight()
+
+def register(name: str, description: str, schema: dict, handler, dynamic: bool = False, replace: bool = False,
+             coalesce: bool = False) -> RegisteredTool:
+    """
+    Add a tool. `handler(arguments)` may be sync or async and returns the
+    value placed under "result" in the tool response. Set coalesce=True only
+    for tools that do not write.
+    """
+    global _tool_list, _version
+    if name in _tools and not replace:
+        raise ValueError(f"Tool already registered: {name}")
+    jsonschema.validators.validator_for(schema).check_schema(schema)
+    entry = RegisteredTool(name, description, schema, handler, dynamic, coalesce)
+    _tools[name] = entry
+    _tool_list = None
+    _version += 1
+    return entry
+
+def unregister(name: str) -> RegisteredTool:
+    global _tool_list, _version
+    if name not in _tools:
+        raise ValueError(f"Tool not found: {name}")
+    _tool_list = None
+    _version += 1
+    return _tools.pop(name)
+
+def tool(name: str, description: str, schema: dict = None, coalesce: bool = False):
+    """
+    Decorator form of register():
+
+        @tool("itsm_read_incident", "Read an ITSM incident by sys_id", {...}, coalesce=True)
+        async def _read_incident_tool(arguments): ...
+    """
+    def decorator(handler):
+        register(name, description, schema or {"type": "object"}, handler, coalesce=coalesce)
+        return handler
+    return decorator
+
+def get(name: str) -> RegisteredTool:
+    entry = _tools.get(name)
+    if entry is None:
+        raise ValueError("Tool not found")
+    return entry
+
+def list_tools() -> list:
+    global _tool_list
+    if _tool_list is None:
+        _tool_list = [entry.as_mcp_tool() for entry in _tools.values()]
+    return _tool_list
+
+def version() -> int:
+    """
+    Counter bumped on every register/unregister, so callers can tell the tool list changed.
+    """
+    return _version
+
+def names(dynamic: bool = None) -> list:
+    return [name for name, entry in _tools.items() if dynamic is None or entry.dynamic == dynamic]
+
+async def dispatch(name: str, arguments: dict) -> dict:
+    """
+    Validate the arguments against the tool's schema and run its handler
+    against the instance named by the `instance` argument.
+    """
+    entry = get(name)
+    arguments = arguments or {}
+    started = time.perf_counter()
+    status = "error"
+    with telemetry.span(f"tools/call {name}", "SERVER", **{"mcp.tool.name": name,
+                                                            "servicenow.instance": arguments.get("instance")}) as current:
+        try:
+            result = await _dispatch(entry, arguments)
+            status = "ok"
+        finally:
+            elapsed = time.perf_counter() - started
+            telemetry.TOOL_LATENCY.observe(elapsed, name, status)
+            logging.debug(f"Tool {name} {status} in {elapsed * 1000:.1f} ms (trace {current.trace_id})")
+    return {"result": result}
+
+async def _dispatch(entry: RegisteredTool, arguments: dict):
+    error = jsonschema.exceptions.best_match(entry.validator.iter_errors(arguments))
+    if error is not None:
+        location = "/".join(str(part) for part in error.absolute_path) or "arguments"
+        raise ValueError(f"Invalid arguments for {entry.name} ({location}): {error.message}")
+    instance = None
+    if "instance" in arguments:
+        arguments = dict(arguments)
+        instance = arguments.pop("instance")
+    with instances.use(instance) as target:
+        if entry.coalesce and not streaming.requested(arguments):
+            key = (target.name, entry.name, json.dumps(_flight_arguments(arguments), sort_keys=True, default=str))
+            return await tool_flights.do(key, lambda: _run(entry, arguments), entry.name, track=True)
+        return await _run(entry, arguments)
+
+def _flight_arguments(arguments: dict) -> dict:
+    # Equivalent encoded queries (clause order, whitespace) join the same flight.
+    if isinstance(arguments.get("query"), str):
+        return {**arguments, "query": canonical(arguments["query"])}
+    return arguments
+
+async def _run(entry: RegisteredTool, arguments: dict):
+    result = entry.handler(arguments)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
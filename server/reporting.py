@@ -1 +1,178 @@
+# server/reporting.py
+import asyncio
+import bisect
+import contextlib
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import httpx
+from servicenow_client import replica, sn_async
+from servicenow_client.encodedquery import Query, and_
+from server.registry import tool
+from config import SN_REPORT_MAX_TREND_BUCKETS, SN_REPORT_AGGREGATE_CONCURRENCY
 
+# Reports are computed where the data lives: group-by counts come from the
+# local replica when it is fresh, otherwise from the Aggregate API, so a
+# report costs one small request per grouped field whatever the table size.
+# The Aggregate API cannot group by a truncated date, so a trend costs one
+# count per interval: intervals are capped at SN_REPORT_MAX_TREND_BUCKETS and
+# a report keeps at most SN_REPORT_AGGREGATE_CONCURRENCY requests in flight.
+# Rows are only streamed when `limit` asks for a sample or the Aggregate API
+# refuses the query.
+
+TREND_INTERVALS = ("day", "week", "month")
+MAX_TREND_BUCKETS = SN_REPORT_MAX_TREND_BUCKETS
+
+def trend_buckets(interval: str, buckets: int, today=None) -> list:
+    """
+    Return [(label, start, end), ...] for the last `buckets` intervals up to and
+    including the current one, as "YYYY-MM-DD HH:MM:SS" UTC bounds.
+    """
+    if interval not in TREND_INTERVALS:
+        raise ValueError(f"Unknown trend interval: {interval}")
+    if not 0 < buckets <= MAX_TREND_BUCKETS:
+        raise ValueError(f"Trend buckets must be between 1 and {MAX_TREND_BUCKETS}")
+    today = today or datetime.now(timezone.utc).date()
+    if interval == "day":
+        starts = [today - timedelta(days=i) for i in range(buckets)]
+        end = today + timedelta(days=1)
+    elif interval == "week":
+        monday = today - timedelta(days=today.weekday())
+        starts = [monday - timedelta(weeks=i) for i in range(buckets)]
+        end = monday + timedelta(weeks=1)
+    else:
+        first = today.replace(day=1)
+        starts = []
+        for _ in range(buckets):
+            starts.append(first)
+            first = (first - timedelta(days=1)).replace(day=1)
+        end = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+    starts.reverse()
+    edges = starts + [end]
+    return [(str(start), f"{start} 00:00:00", f"{stop} 00:00:00") for start, stop in zip(edges, edges[1:])]
+
+async def _count(table: str, query: str, group_by: str = None, slots: asyncio.Semaphore = None) -> tuple:
+    # ({group value: count}, source) from the replica when it can answer, else the Aggregate API.
+    if await replica.covers(table):
+        try:
+            return await replica.count(table, query, group_by), "replica"
+        except ValueError as e:
+            logging.debug(f"Replica cannot aggregate {table}: {str(e)}")
+    async with slots or contextlib.nullcontext():
+        response = await sn_async.aggregate_records(table, query, group_by=[group_by] if group_by else None)
+    return {row["group"].get(group_by, "") if group_by else "": row["count"]
+            for row in sn_async.stats_rows(response)}, "aggregate"
+
+async def _aggregate(table: str, query: str, fields: list, trend: dict) -> dict:
+    """
+    Group-by counts per field (one aggregate per field) plus optional
+    time-bucketed counts (one count per bucket), with at most
+    SN_REPORT_AGGREGATE_CONCURRENCY requests in flight.
+    """
+    slots = asyncio.Semaphore(SN_REPORT_AGGREGATE_CONCURRENCY)
+    grouped = await asyncio.gather(*(_count(table, query, field, slots) for field in fields))
+    summary = {"total": sum(grouped[0][0].values()) if grouped else (await _count(table, query, slots=slots))[0].get("", 0)}
+    for field, (counts, _) in zip(fields, grouped):
+        summary[f"by_{field}"] = {value or "unknown": count for value, count in counts.items()}
+    sources = {source for _, source in grouped}
+    if trend:
+        buckets = trend_buckets(trend["interval"], trend["buckets"])
+        field = trend["field"]
+        counted = await asyncio.gather(*(
+            _count(table, and_(query, Query().where(field, ">=", start).where(field, "<", end)), slots=slots)
+            for _, start, end in buckets
+        ))
+        summary["trend"] = {**trend, "counts": {label: counts.get("", 0) for (label, _, _), (counts, _) in zip(buckets, counted)}}
+        sources.update(source for _, source in counted)
+    summary["source"] = "replica" if sources == {"replica"} else "aggregate"
+    return summary
+
+async def _summarize(table: str, query: str, limit: int, fields: list, trend: dict = None) -> dict:
+    """
+    Stream up to `limit` matching rows (all rows when limit is None) and count
+    them per value of each field as they are decoded, without holding the
+    rows or a page of them in memory.
+    """
+    total = 0
+    counters = {field: Counter() for field in fields}
+    buckets = trend_buckets(trend["interval"], trend["buckets"]) if trend else []
+    starts = [start for _, start, _ in buckets]
+    trend_counts = Counter()
+    columns = fields + [trend["field"]] if trend else fields
+    async for record in replica.aiter_records(table, query, max_records=limit, fields=columns, exclude_reference_link=True,
+                                              stream=True):
+        total += 1
+        for field, counter in counters.items():
+            counter[record.get(field) or "unknown"] += 1
+        if buckets:
+            value = record.get(trend["field"]) or ""
+            index = bisect.bisect_right(starts, value) - 1
+            if index >= 0 and value < buckets[index][2]:
+                trend_counts[buckets[index][0]] += 1
+    summary = {"total": total, **{f"by_{field}": dict(counter) for field, counter in counters.items()}}
+    if trend:
+        summary["trend"] = {**trend, "counts": {label: trend_counts.get(label, 0) for label, _, _ in buckets}}
+    summary["source"] = "rows"
+    return summary
+
+async def _report(table: str, query: str, limit: int, fields: list, trend: dict) -> dict:
+    if limit is None:
+        try:
+            return await _aggregate(table, query, fields, trend)
+        except httpx.HTTPStatusError as e:
+            logging.warning(f"Aggregate API unavailable for {table} ({e.response.status_code}); streaming rows instead")
+    return await _summarize(table, query, limit, fields, trend)
+
+def _trend(field: str, interval: str, buckets: int) -> dict:
+    return {"field": field, "interval": interval, "buckets": buckets} if buckets else None
+
+async def generate_incident_report(query: str = "active=true", limit: int = None, trend_field: str = "opened_at",
+                                   trend_interval: str = "day", trend_buckets: int = 0) -> dict:
+    """
+    Summarize incidents matching the query by priority, state and category,
+    with optional counts per day/week/month of `trend_field`. With `limit`,
+    only the first `limit` matching rows are summarized.
+    """
+    summary = await _report("incident", query, limit, ["priority", "state", "category"],
+                            _trend(trend_field, trend_interval, trend_buckets))
+    return {"table": "incident", "query": query, **summary}
+
+async def generate_change_report(query: str = "active=true", limit: int = None, trend_field: str = "opened_at",
+                                 trend_interval: str = "day", trend_buckets: int = 0) -> dict:
+    """
+    Summarize change requests matching the query by type, state and risk,
+    with optional counts per day/week/month of `trend_field`. With `limit`,
+    only the first `limit` matching rows are summarized.
+    """
+    summary = await _report("change_request", query, limit, ["type", "state", "risk"],
+                            _trend(trend_field, trend_interval, trend_buckets))
+    return {"table": "change_request", "query": query, **summary}
+
+# MCP tools
+REPORT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "limit": {"type": "number", "description": "Summarize only the first N matching rows (default: all, aggregated on the instance)"},
+        "trend_field": {"type": "string", "description": "Date field for time-bucketed counts (default: opened_at)"},
+        "trend_interval": {"type": "string", "enum": list(TREND_INTERVALS)},
+        "trend_buckets": {"type": "integer", "minimum": 0, "maximum": MAX_TREND_BUCKETS}
+    }
+}
+
+def _report_arguments(arguments: dict) -> dict:
+    return {
+        "query": arguments.get("query", "active=true"),
+        "limit": arguments.get("limit"),
+        "trend_field": arguments.get("trend_field", "opened_at"),
+        "trend_interval": arguments.get("trend_interval", "day"),
+        "trend_buckets": arguments.get("trend_buckets", 0),
+    }
+
+@tool("report_generate_incident", "Generate an incident report", REPORT_SCHEMA, coalesce=True)
+async def _incident_report_tool(arguments: dict):
+    return await generate_incident_report(**_report_arguments(arguments))
+
+@tool("report_generate_change", "Generate a change report", REPORT_SCHEMA, coalesce=True)
+async def _change_report_tool(arguments: dict):
+    return await generate_change_report(**_report_arguments(arguments))
@@ -1 +1,24 @@
+# server/sam.py
+from servicenow_client import sn_async
+from server.registry import tool
 
+async def create_license(data: dict) -> dict:
+    """
+    Create a software license record (alm_license).
+    `license_name` is stored as the license's display name.
+    """
+    record = {key: value for key, value in data.items() if key != "license_name"}
+    record["display_name"] = data["license_name"]
+    return await sn_async.create_record("alm_license", record)
+
+# MCP tools
+@tool("sam_create_license", "Create a SAM license record", {
+    "type": "object",
+    "properties": {
+        "license_name": {"type": "string"},
+        "assigned_to": {"type": "string"}
+    },
+    "required": ["license_name", "assigned_to"]
+})
+async def _create_license_tool(arguments: dict):
+    return await create_license(arguments)
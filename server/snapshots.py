@@ -0,0 +1,264 @@
+# server/snapshots.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import (
+    SN_PORTAL_SNAPSHOT_TTL, SN_PORTAL_STALE_WHILE_REVALIDATE,
+    SN_PORTAL_REFRESH_INTERVAL, SN_PORTAL_SNAPSHOT_IDLE, SN_PORTAL_MAX_SNAPSHOTS, SN_PORTAL_SHARED_LEASE
+)
+
+# Precomputed report snapshots for the portal. A snapshot is fresh for `ttl`
+# seconds; for `stale_while_revalidate` more seconds it is still served while
+# one background refresh runs. Concurrent requests for a key that has to be
+# (re)generated share a single producer call. A background task refreshes
+# snapshots that are still being requested before they go stale, so
+# dashboards are normally served from memory without touching the instance.
+# When the portal runs as several worker processes, the stores share their
+# snapshots through a local SQLite file: a worker whose snapshot is no longer
+# fresh first adopts a newer one another worker saved, and only the worker
+# holding a key's refresh lease calls the producer while the others wait for
+# its result, so each report is still generated once per refresh.
+
+_SHARED_POLL = 0.05  # seconds between checks while another worker refreshes a snapshot
+
+class Snapshot:
+    def __init__(self, value):
+        self.body = json.dumps(value, separators=(",", ":"), sort_keys=True).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.created = time.monotonic()
+        self.created_at = time.time()
+
+    @classmethod
+    def restore(cls, body: bytes, etag: str, created_at: float) -> "Snapshot":
+        snapshot = cls.__new__(cls)
+        snapshot.body = body
+        snapshot.etag = etag
+        snapshot.created_at = created_at
+        snapshot.created = time.monotonic() - max(0.0, time.time() - created_at)
+        return snapshot
+
+    def age(self) -> float:
+        return time.monotonic() - self.created
+
+class _SharedStore:
+    """
+    Snapshots and refresh leases in a SQLite file shared by the portal's worker processes.
+    """
+    def __init__(self, path: str, retention: float):
+        self.path = path
+        self.retention = retention
+        self.owner = f"{os.getpid()}-{id(self)}"
+        self._local = threading.local()  # one connection per thread
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, body BLOB, etag TEXT, created_at REAL);
+                CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires REAL);
+            """)
+            self._local.db = db
+        return db
+
+    def load(self, key: str):
+        row = self._db().execute("SELECT body, etag, created_at FROM snapshots WHERE key = ?", (key,)).fetchone()
+        return Snapshot.restore(*row) if row else None
+
+    def save(self, key: str, snapshot: Snapshot) -> None:
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET body = excluded.body, "
+                       "etag = excluded.etag, created_at = excluded.created_at WHERE excluded.created_at > created_at",
+                       (key, snapshot.body, snapshot.etag, snapshot.created_at))
+            db.execute("DELETE FROM snapshots WHERE created_at < ?", (time.time() - self.retention,))
+
+    def acquire(self, key: str, lease: float) -> bool:
+        """
+        Take the refresh lease of `key` unless another worker holds an unexpired one.
+        """
+        db = self._db()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+            row = db.execute("SELECT owner FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != self.owner:
+                return False
+            db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (key, self.owner, now + lease))
+            return True
+
+    def release(self, key: str) -> None:
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+class SnapshotStore:
+    def __init__(self, ttl: float = SN_PORTAL_SNAPSHOT_TTL, stale_while_revalidate: float = SN_PORTAL_STALE_WHILE_REVALIDATE,
+                 refresh_interval: float = SN_PORTAL_REFRESH_INTERVAL, idle: float = SN_PORTAL_SNAPSHOT_IDLE,
+                 max_snapshots: int = SN_PORTAL_MAX_SNAPSHOTS, shared_path: str = None,
+                 shared_lease: float = SN_PORTAL_SHARED_LEASE):
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.refresh_interval = refresh_interval
+        self.idle = idle
+        self.max_snapshots = max_snapshots
+        self.shared_lease = shared_lease
+        self._shared = _SharedStore(shared_path, ttl + stale_while_revalidate + idle) if shared_path else None
+        self._entries = {}   # key -> {"snapshot", "producer", "last_access"}
+        self._inflight = {}  # key -> asyncio.Task of the running producer
+        self._counters = dict.fromkeys(("fresh", "stale", "misses", "refreshes", "coalesced", "errors", "not_modified",
+                                        "shared"), 0)
+
+    async def get(self, key: tuple, producer) -> Snapshot:
+        """
+        Return the snapshot for `key`, calling `producer()` (a coroutine
+        function) only when there is none or it is too stale to serve.
+        """
+        entry = self.register(key, producer)
+        entry["last_access"] = time.monotonic()
+        snapshot = entry["snapshot"]
+        if self._shared and (snapshot is None or snapshot.age() >= self.ttl):
+            snapshot = await self._adopt(key, entry)
+        if snapshot is not None and snapshot.age() < self.ttl:
+            self._counters["fresh"] += 1
+            return snapshot
+        if snapshot is not None and snapshot.age() < self.ttl + self.stale_while_revalidate:
+            self._counters["stale"] += 1
+            self._start_refresh(key)
+            return snapshot
+        self._counters["misses"] += 1
+        return await asyncio.shield(self._start_refresh(key))
+
+    def register(self, key: tuple, producer) -> dict:
+        """
+        Add `key` without generating it; the refresh loop builds it on its next tick.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_snapshots:
+                self._evict()
+            entry = self._entries[key] = {"snapshot": None, "producer": producer, "last_access": time.monotonic()}
+        return entry
+
+    def not_modified(self, snapshot: Snapshot, if_none_match: str) -> bool:
+        """
+        True when the If-None-Match header lists the snapshot's ETag (or "*").
+        """
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        matched = "*" in tags or snapshot.etag in tags
+        if matched:
+            self._counters["not_modified"] += 1
+        return matched
+
+    def cache_control(self, snapshot: Snapshot) -> str:
+        max_age = max(0, int(self.ttl - snapshot.age()))
+        return f"max-age={max_age}, stale-while-revalidate={int(self.stale_while_revalidate)}"
+
+    def _start_refresh(self, key: tuple) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+            return task
+        task = asyncio.create_task(self._refresh(key))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _adopt(self, key: tuple, entry: dict) -> Snapshot:
+        # Take a snapshot another worker saved when it is newer than ours.
+        shared = await asyncio.to_thread(self._shared.load, _shared_key(key))
+        current = entry["snapshot"]
+        if shared is not None and (current is None or shared.created_at > current.created_at):
+            self._counters["shared"] += 1
+            entry["snapshot"] = shared
+        return entry["snapshot"]
+
+    async def _produce(self, key: tuple, entry: dict) -> Snapshot:
+        if self._shared is None:
+            return Snapshot(await entry["producer"]())
+        # One worker at a time refreshes a key; the others adopt its snapshot.
+        shared_key, previous = _shared_key(key), entry["snapshot"]
+        while not await asyncio.to_thread(self._shared.acquire, shared_key, self.shared_lease):
+            if await self._adopt(key, entry) is not previous:
+                return entry["snapshot"]
+            await asyncio.sleep(_SHARED_POLL)
+        try:
+            if await self._adopt(key, entry) is not previous:
+                return entry["snapshot"]
+            snapshot = Snapshot(await entry["producer"]())
+            await asyncio.to_thread(self._shared.save, shared_key, snapshot)
+            return snapshot
+        finally:
+            await asyncio.shield(asyncio.to_thread(self._shared.release, shared_key))
+
+    async def _refresh(self, key: tuple) -> Snapshot:
+        entry = self._entries[key]
+        try:
+            snapshot = await self._produce(key, entry)
+        except Exception as e:
+            self._counters["errors"] += 1
+            if entry["snapshot"] is None:
+                raise
+            logging.warning(f"Snapshot refresh failed for {key}, serving the previous one: {str(e)}")
+            return entry["snapshot"]
+        if snapshot is not entry["snapshot"]:  # not adopted from another worker
+            self._counters["refreshes"] += 1
+        entry["snapshot"] = snapshot
+        return snapshot
+
+    def _evict(self) -> None:
+        # Drop the least recently requested snapshot that is not being refreshed.
+        idle = [key for key in self._entries if key not in self._inflight]
+        if idle:
+            del self._entries[min(idle, key=lambda key: self._entries[key]["last_access"])]
+
+    async def refresh_due(self) -> None:
+        """
+        Refresh snapshots that will go stale before the next tick and drop the
+        ones nobody has requested for `idle` seconds.
+        """
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if now - entry["last_access"] > self.idle and key not in self._inflight:
+                del self._entries[key]
+            elif entry["snapshot"] is None or entry["snapshot"].age() >= self.ttl - self.refresh_interval:
+                self._start_refresh(key)
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight.values()), return_exceptions=True)
+
+    async def run(self) -> None:
+        """
+        Background refresh loop; cancel the task to stop it.
+        """
+        while True:
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                logging.error(f"Snapshot refresh loop failed: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def stats(self) -> dict:
+        served = self._counters["fresh"] + self._counters["stale"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_ratio": round((self._counters["fresh"] + self._counters["stale"]) / served, 4) if served else 0.0,
+            "snapshots": len(self._entries),
+            "refreshing": len(self._inflight),
+            "ttl": self.ttl,
+            "stale_while_revalidate": self.stale_while_revalidate,
+            "shared_store": self._shared.path if self._shared else None,
+        }
+
+def _shared_key(key: tuple) -> str:
+    return json.dumps(key, separators=(",", ":"))
@@ -0,0 +1,56 @@
+# server/streaming.py
+import contextvars
+import json
+from contextlib import contextmanager, aclosing
+from config import SN_STREAM_CHUNK_ROWS
+
+# Streamed tool results. A row-returning tool called with "stream": true sends
+# its rows to the client in chunks, as MCP progress notifications on the
+# call's progress token, while they are still being decoded from the
+# ServiceNow response (sn_async.astream_records), and its result only holds
+# the row count. Neither the upstream body nor the full row list is ever in
+# memory, and the client has the first rows as soon as the first chunk is
+# decoded. main.call_tool installs the sender when the request carries a
+# progress token; without one (or outside MCP) the tool answers in one
+# result as usual. Streamed calls are never coalesced (registry.dispatch).
+
+STREAM_PROPERTIES = {
+    "stream": {"type": "boolean", "description": "Send rows in chunks as progress notifications (needs a progress token); "
+                                                 "the result then only holds the row count"},
+}
+
+_sender = contextvars.ContextVar("sn_stream_sender", default=None)
+
+@contextmanager
+def use(sender):
+    """
+    Make `async sender(progress, message)` the target of streamed rows for the enclosed call.
+    """
+    token = _sender.set(sender)
+    try:
+        yield
+    finally:
+        _sender.reset(token)
+
+def requested(arguments: dict) -> bool:
+    return bool(arguments.get("stream")) and _sender.get() is not None
+
+async def send_rows(records, chunk_rows: int = SN_STREAM_CHUNK_ROWS, **summary) -> dict:
+    """
+    Send the records of an async generator in chunks of `chunk_rows`. Each
+    notification's message is {"chunk": n, "rows": [...]} as JSON and its
+    progress the number of rows sent so far.
+    """
+    send = _sender.get()
+    count, chunks, chunk = 0, 0, []
+    async with aclosing(records) as rows:
+        async for record in rows:
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                count, chunks = count + len(chunk), chunks + 1
+                await send(count, json.dumps({"chunk": chunks, "rows": chunk}, default=str))
+                chunk = []
+    if chunk:
+        count, chunks = count + len(chunk), chunks + 1
+        await send(count, json.dumps({"chunk": chunks, "rows": chunk}, default=str))
+    return {**summary, "streamed": True, "count": count, "chunks": chunks}
@@ -0,0 +1,133 @@
+# server/timeseries.py
+import numpy as np
+
+# Vectorized time-series helpers behind server/analytics.py. Series are 2-D
+# arrays of shape (groups, days): one row per dimension value (or a single
+# row for the overall series). Every function works on all rows at once.
+
+_MAD_SCALE = 0.6745  # makes the MAD z-score comparable to a normal z-score
+
+def bucket_counts(days: np.ndarray, codes: np.ndarray = None, groups: int = 1) -> tuple:
+    """
+    Count events per (group, day). `days` are integer day numbers, `codes`
+    the group index of each event. Returns (first_day, counts) where counts
+    has shape (groups, span) and gaps are zero-filled.
+    """
+    if days.size == 0:
+        return 0, np.zeros((groups, 0), dtype=np.int64)
+    first = int(days.min())
+    span = int(days.max()) - first + 1
+    offsets = days.astype(np.int64) - first
+    if codes is not None:
+        offsets = offsets + codes.astype(np.int64) * span
+    return first, np.bincount(offsets, minlength=groups * span).reshape(groups, span)
+
+def rolling_mean(series: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing mean over `window` days; the first window-1 values average what is available.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    sums = np.cumsum(series, axis=-1)
+    sums[..., window:] = sums[..., window:] - sums[..., :-window]
+    counts = np.minimum(np.arange(1, series.shape[-1] + 1), window)
+    return sums / counts
+
+def rolling_std(series: np.ndarray, window: int) -> np.ndarray:
+    mean = rolling_mean(series, window)
+    return np.sqrt(np.maximum(rolling_mean(np.square(series, dtype=np.float64), window) - mean ** 2, 0.0))
+
+def centered_mean(series: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average (2 x window for even windows, as in classical
+    decomposition). Edges are NaN where the window does not fit.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    kernel = np.ones(window) / window
+    if window % 2 == 0:
+        kernel = np.convolve(kernel, [0.5, 0.5])
+    half = len(kernel) // 2
+    result = np.full(series.shape, np.nan)
+    if series.shape[-1] >= len(kernel):
+        padded = np.cumsum(np.pad(series, [(0, 0)] * (series.ndim - 1) + [(1, 0)]), axis=-1)
+        if window % 2:
+            result[..., half:series.shape[-1] - half] = (padded[..., window:] - padded[..., :-window]) / window
+        else:
+            # Weighted (0.5, 1, ..., 1, 0.5) window of length window + 1.
+            inner = (padded[..., window:] - padded[..., :-window])
+            result[..., half:series.shape[-1] - half] = (inner[..., :-1] + inner[..., 1:]) / (2 * window)
+    return result
+
+def seasonal_decompose(series: np.ndarray, period: int = 7) -> dict:
+    """
+    Additive decomposition series = trend + seasonal + residual. The trend is
+    a centered moving average over one period; the seasonal profile is the
+    mean detrended value per phase, centered on zero. Series shorter than two
+    periods get a flat seasonal component.
+    """
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    length = series.shape[-1]
+    trend = centered_mean(series, period)
+    if length < 2 * period:
+        trend = np.where(np.isnan(trend), series.mean(axis=-1, keepdims=True), trend)
+        seasonal = np.zeros_like(series)
+    else:
+        detrended = series - trend
+        padded = np.pad(detrended, [(0, 0), (0, -length % period)], constant_values=np.nan)
+        profile = np.nanmean(padded.reshape(series.shape[0], -1, period), axis=1)
+        profile -= profile.mean(axis=-1, keepdims=True)
+        seasonal = np.tile(profile, (1, -(-length // period)))[:, :length]
+        # Extend the trend to the edges with the nearest defined value.
+        valid = ~np.isnan(trend[0])
+        first, last = np.argmax(valid), length - 1 - np.argmax(valid[::-1])
+        trend[:, :first] = trend[:, [first]]
+        trend[:, last + 1:] = trend[:, [last]]
+    return {"trend": trend, "seasonal": seasonal, "residual": series - trend - seasonal}
+
+def linear_fit(series: np.ndarray) -> tuple:
+    """
+    Least-squares (slope, intercept) of every row against 0..n-1.
+    """
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    x = np.arange(series.shape[-1], dtype=np.float64)
+    if x.size < 2:
+        return np.zeros(series.shape[0]), series.mean(axis=-1) if x.size else np.zeros(series.shape[0])
+    x_centered = x - x.mean()
+    slope = (series - series.mean(axis=-1, keepdims=True)) @ x_centered / np.dot(x_centered, x_centered)
+    return slope, series.mean(axis=-1) - slope * x.mean()
+
+def zscore(series: np.ndarray) -> np.ndarray:
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    std = series.std(axis=-1, keepdims=True)
+    return np.divide(series - series.mean(axis=-1, keepdims=True), std, out=np.zeros_like(series), where=std > 0)
+
+def mad_score(series: np.ndarray) -> np.ndarray:
+    """
+    Robust z-score: 0.6745 * (x - median) / MAD. A few spikes do not inflate
+    the scale the way they inflate the standard deviation.
+    """
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    median = np.median(series, axis=-1, keepdims=True)
+    mad = np.median(np.abs(series - median), axis=-1, keepdims=True)
+    return np.divide(_MAD_SCALE * (series - median), mad, out=np.zeros_like(series), where=mad > 0)
+
+def ewma_score(series: np.ndarray, alpha: float = 0.3) -> np.ndarray:
+    """
+    Deviation of each day from the exponentially weighted mean of the days
+    before it, in units of the exponentially weighted standard deviation.
+    The recursion runs over days and is vectorized across rows.
+    """
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    scores = np.zeros_like(series)
+    if series.shape[-1] == 0:
+        return scores
+    mean = series[:, 0].copy()
+    var = np.zeros(series.shape[0])
+    for t in range(1, series.shape[-1]):
+        deviation = series[:, t] - mean
+        std = np.sqrt(var)
+        scores[:, t] = np.divide(deviation, std, out=np.zeros_like(deviation), where=std > 0)
+        mean += alpha * deviation
+        var = (1 - alpha) * (var + alpha * deviation ** 2)
+    return scores
+
+SCORERS = {"zscore": zscore, "mad": mad_score, "ewma": ewma_score}
@@ -1 +1,291 @@
+# server/workflow.py
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import NamedTuple
+from servicenow_client import sn_async, instances
+from servicenow_client.encodedquery import Query, ids_in
+from server.base import update_comments
+from server.registry import tool
+from config import SN_WORKFLOW_CHECKPOINT_PATH, SN_WORKFLOW_CHECKPOINT_TTL
 
+# A small DAG workflow engine. A workflow is a list of steps, each naming the
+# steps it depends on; every step starts as soon as its dependencies are done,
+# so independent ServiceNow calls run concurrently. The result of each
+# completed step is checkpointed in SQLite under the workflow's run id: running
+# the same run again (e.g. a client retrying after a failure) resumes from the
+# checkpoints instead of repeating completed calls. Every run reports per-step
+# start offsets and durations.
+
+class Step(NamedTuple):
+    name: str
+    run: object        # async run(inputs, results) -> JSON-serializable result
+    after: tuple = ()  # names of the steps whose results it needs
+
+class CheckpointStore:
+    def __init__(self, path: str = SN_WORKFLOW_CHECKPOINT_PATH, ttl: float = SN_WORKFLOW_CHECKPOINT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._ready = False
+
+    def _db(self) -> sqlite3.Connection:
+        # Checkpoint traffic is a few rows per run; a short-lived connection per call keeps it thread-safe.
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            db.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+                workflow TEXT, run_id TEXT, step TEXT, result TEXT, duration REAL, completed_at REAL,
+                PRIMARY KEY (workflow, run_id, step))""")
+            db.execute("DELETE FROM checkpoints WHERE completed_at < ?", (time.time() - self.ttl,))
+            db.commit()
+            self._ready = True
+        return db
+
+    def load(self, workflow: str, run_id: str) -> dict:
+        """
+        Return {step: (result, duration)} for the completed steps of a run.
+        """
+        with self._db() as db:
+            rows = db.execute("SELECT step, result, duration FROM checkpoints WHERE workflow = ? AND run_id = ? "
+                              "AND completed_at >= ?", (workflow, run_id, time.time() - self.ttl)).fetchall()
+        return {step: (json.loads(result), duration) for step, result, duration in rows}
+
+    def save(self, workflow: str, run_id: str, step: str, result, duration: float) -> None:
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                       (workflow, run_id, step, json.dumps(result), duration, time.time()))
+
+    def clear(self, workflow: str, run_id: str) -> None:
+        with self._db() as db:
+            db.execute("DELETE FROM checkpoints WHERE workflow = ? AND run_id = ?", (workflow, run_id))
+
+checkpoints = CheckpointStore()
+
+class Workflow:
+    def __init__(self, name: str, steps: list):
+        self.name = name
+        self.steps = {step.name: step for step in steps}
+        for step in steps:
+            unknown = [dep for dep in step.after if dep not in self.steps]
+            if unknown:
+                raise ValueError(f"Workflow {name}: step {step.name} depends on unknown steps {unknown}")
+        done = set()
+        while len(done) < len(self.steps):
+            ready = [step.name for step in steps if step.name not in done and set(step.after) <= done]
+            if not ready:
+                raise ValueError(f"Workflow {name}: dependency cycle among {sorted(set(self.steps) - done)}")
+            done.update(ready)
+
+    async def run(self, run_id: str, inputs: dict, store: CheckpointStore = checkpoints, restart: bool = False) -> tuple:
+        """
+        Run every step not yet checkpointed for `run_id`; returns (results, timings)
+        keyed by step name. When a step fails, the steps already running are
+        allowed to finish (and are checkpointed) before its exception is raised.
+        """
+        if restart:
+            await asyncio.to_thread(store.clear, self.name, run_id)
+        saved = await asyncio.to_thread(store.load, self.name, run_id)
+        results = {name: result for name, (result, _) in saved.items() if name in self.steps}
+        timings = {name: {"status": "resumed", "duration_ms": round(saved[name][1] * 1000, 2)} for name in results}
+        pending = {name: step for name, step in self.steps.items() if name not in results}
+        running = {}
+        failure = None
+        started = time.monotonic()
+        try:
+            while pending or running:
+                if failure is None:
+                    for name, step in list(pending.items()):
+                        if all(dep in results for dep in step.after):
+                            del pending[name]
+                            running[asyncio.create_task(self._run_step(step, run_id, inputs, results, store, started, timings))] = name
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    if task.exception() is not None:
+                        timings[name] = {"status": "failed", "error": str(task.exception())}
+                        failure = failure or task.exception()
+                        logging.error(f"Workflow {self.name} ({run_id}) step {name} failed: {str(task.exception())}")
+                    else:
+                        results[name] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+        if failure is not None:
+            raise failure
+        return results, timings
+
+    async def _run_step(self, step: Step, run_id: str, inputs: dict, results: dict, store: CheckpointStore,
+                        started: float, timings: dict):
+        start = time.monotonic()
+        result = await step.run(inputs, {dep: results[dep] for dep in step.after})
+        duration = time.monotonic() - start
+        await asyncio.to_thread(store.save, self.name, run_id, step.name, result, duration)
+        timings[step.name] = {"status": "completed", "started_ms": round((start - started) * 1000, 2),
+                              "duration_ms": round(duration * 1000, 2)}
+        return result
+
+# Access provisioning for a requested item (RITM). Roles are requested through the
+# RITM's u_requested_roles field (comma-separated role names).
+
+async def fetch_request(ritm_id: str) -> dict:
+    """
+    Retrieve the access provisioning request (sc_req_item).
+    """
+    return (await sn_async.read_record("sc_req_item", ritm_id)).get("result", {})
+
+async def fetch_user(user_id: str) -> dict:
+    """
+    Look up the user being provisioned (fails for an unknown sys_id).
+    """
+    return (await sn_async.read_record("sys_user", user_id, fields=["sys_id", "user_name", "active"])).get("result", {})
+
+def classify_roles(ritm: dict) -> list:
+    """
+    Determine which roles the request asks for.
+    """
+    requested = ritm.get("u_requested_roles") or ""
+    return [role.strip() for role in requested.split(",") if role.strip()]
+
+async def identify_groups(roles: list) -> list:
+    """
+    Find the groups that grant the requested roles.
+    """
+    if not roles:
+        return []
+    query = ids_in(roles, "role.name")
+    rows = (await sn_async.query_records("sys_group_has_role", query, fields=["group"], exclude_reference_link=True)).get("result", [])
+    return sorted({row["group"] for row in rows if row.get("group")})
+
+async def current_groups(user_id: str) -> list:
+    """
+    Groups the user is already a member of.
+    """
+    query = Query().where("user", "=", user_id).encode()
+    return sorted({row["group"] async for row in sn_async.aiter_records("sys_user_grmember", query, fields=["group"],
+                                                                          exclude_reference_link=True) if row.get("group")})
+
+async def request_approvals(ritm_id: str, group_ids: list) -> list:
+    """
+    Ask the manager of each group to approve the request, skipping managers
+    who already have an approval on it.
+    """
+    if not group_ids:
+        return []
+    groups = (await sn_async.query_records("sys_user_group", ids_in(group_ids), limit=len(group_ids),
+                                           fields=["sys_id", "manager"], exclude_reference_link=True)).get("result", [])
+    managers = sorted({group["manager"] for group in groups if group.get("manager")})
+    if not managers:
+        return []
+    existing = (await sn_async.query_records("sysapproval_approver", ids_in(managers, "approver", Query().where("sysapproval", "=", ritm_id)),
+                                             limit=len(managers), fields=["approver"], exclude_reference_link=True)).get("result", [])
+    requested = {row.get("approver") for row in existing}
+    created = await asyncio.gather(*(
+        sn_async.create_record("sysapproval_approver", {"sysapproval": ritm_id, "approver": manager, "state": "requested"})
+        for manager in managers if manager not in requested
+    ))
+    return [approval.get("result", {}) for approval in created]
+
+async def await_approvals(ritm_id: str, group_ids: list) -> list:
+    """
+    Return the groups once the manager of every one of them has approved the
+    request. Raises ValueError while an approval is still pending (running the
+    workflow again later resumes here) or when one was rejected, so no access
+    is granted before it is approved.
+    """
+    if not group_ids:
+        return []
+    groups = (await sn_async.query_records("sys_user_group", ids_in(group_ids), limit=len(group_ids),
+                                           fields=["sys_id", "manager"], exclude_reference_link=True)).get("result", [])
+    managers = {group["sys_id"]: group.get("manager") for group in groups}
+    unmanaged = sorted(group_id for group_id in group_ids if not managers.get(group_id))
+    if unmanaged:
+        raise ValueError(f"Groups {unmanaged} have no manager to approve the request; assign them manually")
+    query = ids_in(set(managers.values()), "approver", Query().where("sysapproval", "=", ritm_id))
+    states = {}  # approver -> states of their approvals on this request
+    async for approval in sn_async.aiter_records("sysapproval_approver", query, fields=["approver", "state"],
+                                                 exclude_reference_link=True):
+        states.setdefault(approval.get("approver"), set()).add(approval.get("state"))
+    rejected = sorted(group_id for group_id in group_ids if "rejected" in states.get(managers[group_id], ()))
+    if rejected:
+        raise ValueError(f"Access to groups {rejected} was rejected; the user was not added to any group")
+    pending = sorted(group_id for group_id in group_ids if "approved" not in states.get(managers[group_id], ()))
+    if pending:
+        raise ValueError(f"Waiting for approval of groups {pending}; run the workflow again once they are approved")
+    return list(group_ids)
+
+async def assign_groups(user_id: str, group_ids: list) -> list:
+    """
+    Add the user to each group they are not already a member of. The
+    memberships are read here rather than taken from an earlier step, so a
+    run retried after a partial failure skips the groups already added.
+    """
+    member_of = set(await current_groups(user_id))
+    missing = [group_id for group_id in group_ids if group_id not in member_of]
+    created = await asyncio.gather(*(sn_async.create_record("sys_user_grmember", {"user": user_id, "group": group_id})
+                                     for group_id in missing), return_exceptions=True)
+    # Let every insert finish before failing, so a retry knows what was added.
+    failure = next((result for result in created if isinstance(result, BaseException)), None)
+    if failure is not None:
+        raise failure
+    return missing
+
+async def close_request(ritm_id: str, comment: str) -> dict:
+    """
+    Record the outcome on the RITM and close it as complete.
+    """
+    return await update_comments(ritm_id, comment, state="3")
+
+def _closing_comment(user_id: str, roles: list, added: list) -> str:
+    return f"Access provisioned for user {user_id}: roles {roles or 'none'}, groups added {added or 'none'}."
+
+ACCESS_PROVISIONING = Workflow("access_provisioning", [
+    Step("fetch_request", lambda inputs, done: fetch_request(inputs["ritm_id"])),
+    Step("fetch_user", lambda inputs, done: fetch_user(inputs["user_id"])),
+    Step("identify_groups", lambda inputs, done: identify_groups(classify_roles(done["fetch_request"])), ("fetch_request",)),
+    Step("request_approvals", lambda inputs, done: request_approvals(inputs["ritm_id"], done["identify_groups"]),
+         ("identify_groups",)),
+    # Access is only granted after approval: assign_groups waits for await_approvals, which
+    # fails (and is retried on the next run) until every group's manager has approved.
+    Step("await_approvals", lambda inputs, done: await_approvals(inputs["ritm_id"], done["identify_groups"]),
+         ("identify_groups", "request_approvals")),
+    Step("assign_groups", lambda inputs, done: assign_groups(inputs["user_id"], done["await_approvals"]),
+         ("await_approvals", "fetch_user")),
+    Step("close_request", lambda inputs, done: close_request(inputs["ritm_id"], _closing_comment(
+        inputs["user_id"], classify_roles(done["fetch_request"]), done["assign_groups"])),
+         ("fetch_request", "assign_groups")),
+])
+
+async def process_access_provisioning(ritm_id: str, user_id: str, restart: bool = False) -> dict:
+    """
+    Run the access provisioning workflow for a RITM: the request and user
+    are fetched concurrently, then the groups for the requested roles are
+    identified and approvals requested. The user is
+    only added to the groups once every approval is granted; until then the
+    run fails with the pending groups, and the request is closed after the
+    assignment. A repeated call for the same RITM and user resumes from the
+    completed steps; restart=True runs every step again.
+    """
+    run_id = f"{instances.current().name}:{ritm_id}:{user_id}"
+    started = time.monotonic()
+    results, timings = await ACCESS_PROVISIONING.run(run_id, {"ritm_id": ritm_id, "user_id": user_id}, restart=restart)
+    logging.info(f"Workflow access provisioning complete for {ritm_id}")
+    return {"ritm_id": ritm_id, "user_id": user_id, "roles": classify_roles(results["fetch_request"]),
+            "groups": results["identify_groups"], "groups_added": results["assign_groups"],
+            "approvals_requested": len(results["request_approvals"]),
+            "run_id": run_id, "duration_ms": round((time.monotonic() - started) * 1000, 2), "steps": timings}
+
+# MCP tools
+@tool("workflow_process_access", "Orchestrate the multi-step access provisioning process", {
+    "type": "object",
+    "properties": {
+        "ritm_id": {"type": "string"},
+        "user_id": {"type": "string"},
+        "restart": {"type": "boolean", "description": "Ignore checkpoints from an earlier run and redo every step"}
+    },
+    "required": ["ritm_id", "user_id"]
+})
+async def _process_access_tool(arguments: dict):
+    return await process_access_provisioning(arguments["ritm_id"], arguments["user_id"], arguments.get("restart", False))
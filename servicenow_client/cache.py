@@ -0,0 +1,153 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from servicenow_client.encodedquery import canonical
+from config import SN_CACHE_ENABLED, SN_CACHE_TTL, SN_CACHE_MAX_ENTRIES, SN_CACHE_MAX_BYTES
+
+# Read-through cache shared by sn_client and sn_async. Entries are evicted
+# least-recently-used first once either the entry or the byte cap is reached,
+# and expire after a TTL. Writes to a table drop that table's cached queries and
+# the cached reads of the written record. A read that was already in flight
+# when the write happened may return the old record after the invalidation, so
+# callers take generation() before fetching and put() drops the value if its
+# table (queries) or record (reads) was invalidated since.
+
+def read_key(table: str, sys_id: str, fields: list = None, display_value: str = None,
+             exclude_reference_link: bool = False) -> tuple:
+    return ("read", table, sys_id, tuple(fields or ()), display_value, exclude_reference_link)
+
+def query_key(table: str, query: str, limit: int, offset: int, fields: list = None,
+              display_value: str = None, exclude_reference_link: bool = False) -> tuple:
+    return ("query", table, canonical(query), limit, offset, tuple(fields or ()),
+            display_value, exclude_reference_link)
+
+class RecordCache:
+    def __init__(self, ttl: float = SN_CACHE_TTL, max_entries: int = SN_CACHE_MAX_ENTRIES,
+                 max_bytes: int = SN_CACHE_MAX_BYTES, enabled: bool = SN_CACHE_ENABLED):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._by_table = {}            # table -> keys, for invalidation
+        self._bytes = 0
+        self._clock = 0                # bumped by every invalidation
+        self._written = OrderedDict()  # (table,) or (table, sys_id) -> clock of its last invalidation, oldest first
+        self._floor = 0                # the newest clock forgotten from _written
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(("hits", "misses", "evictions", "expirations", "invalidations", "stale"), 0)
+
+    def get(self, key: tuple):
+        """
+        Return a copy of the cached value, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            value = entry[0]
+        return copy.deepcopy(value)
+
+    def generation(self) -> int:
+        """
+        Taken before fetching a value that will be put() in the cache.
+        """
+        with self._lock:
+            return self._clock
+
+    def put(self, key: tuple, value: dict, generation: int = None) -> None:
+        """
+        Cache `value`, unless it was fetched at `generation` and `key` has been
+        invalidated since.
+        """
+        if not self.enabled:
+            return
+        size = len(json.dumps(value, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            if generation is not None and self._stale(key, generation):
+                self._counters["stale"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._by_table.setdefault(key[1], set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def invalidate(self, table: str, sys_id: str = None) -> None:
+        """
+        Drop every cached query on `table` and, when given, the cached reads
+        of `sys_id`.
+        """
+        with self._lock:
+            self._clock += 1
+            self._stamp((table,))
+            if sys_id is not None:
+                self._stamp((table, sys_id))
+            for key in list(self._by_table.get(table, ())):
+                if key[0] == "query" or (sys_id is not None and key[2] == sys_id):
+                    self._remove(key)
+                    self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+            self._clock += 1
+            self._written.clear()
+            self._floor = self._clock
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+    def _stamp(self, written: tuple) -> None:
+        self._written[written] = self._clock
+        self._written.move_to_end(written)
+        while len(self._written) > self.max_entries:
+            _, forgotten = self._written.popitem(last=False)
+            self._floor = max(self._floor, forgotten)
+
+    def _stale(self, key: tuple, generation: int) -> bool:
+        if generation < self._floor:
+            return True  # what happened since was forgotten: assume the worst
+        written = (key[1],) if key[0] == "query" else (key[1], key[2])
+        return self._written.get(written, 0) > generation
+
+    def _remove(self, key: tuple) -> None:
+        value, _, size = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._by_table.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_table[key[1]]
+
+record_cache = RecordCache()
@@ -0,0 +1,161 @@
+import asyncio
+import contextvars
+import copy
+import threading
+import weakref
+
+# Single-flight request coalescing. Identical calls that arrive while one is
+# already in flight wait for it and share its result (or its exception)
+# instead of reaching ServiceNow again. Used under sn_client/sn_async for GET
+# requests and by server.registry for read-only tools. When a result was
+# shared, every caller gets its own deep copy so one caller's edits are not
+# seen by the others. Counters are kept per label (tool name or table).
+# After a write, forget() detaches the flights of the written table, so reads
+# issued after the write start a new call instead of joining an older one.
+# Tool flights (track=True) are detached by the tables their handler has read
+# so far: sn_client/sn_async report each table they read with reading().
+
+_flights = weakref.WeakSet()
+_reads = contextvars.ContextVar("sn_flight_reads", default=())  # table sets of the enclosing tracked flights
+
+def reading(table: str) -> None:
+    """
+    Note that the current call reads `table`, so a write to it detaches the tracked flights it runs in.
+    """
+    for tables in _reads.get():
+        tables.add(table)
+
+async def _tracked(fn, tables: set):
+    # Runs in the flight's own task, so the context change stays local to it.
+    _reads.set(_reads.get() + (tables,))
+    return await fn()
+
+def forget(label: str = None) -> None:
+    """
+    Detach in-flight calls with this label (all when None) from every flight group.
+    """
+    for flights in list(_flights):
+        flights.forget(label)
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels = {}  # label -> [calls, coalesced]
+
+    def count(self, label: str, coalesced: bool) -> None:
+        with self._lock:
+            counts = self._labels.setdefault(label, [0, 0])
+            counts[0] += 1
+            counts[1] += coalesced
+
+    def stats(self) -> dict:
+        with self._lock:
+            labels = {label: list(counts) for label, counts in self._labels.items()}
+        calls = sum(counts[0] for counts in labels.values())
+        coalesced = sum(counts[1] for counts in labels.values())
+        return {
+            "calls": calls,
+            "coalesced": coalesced,
+            "upstream": calls - coalesced,
+            "coalescing_ratio": round(coalesced / calls, 4) if calls else 0.0,
+            "by_label": {
+                label: {"calls": c, "coalesced": k, "coalescing_ratio": round(k / c, 4)}
+                for label, (c, k) in sorted(labels.items())
+            },
+        }
+
+class _Call:
+    def __init__(self, label: str):
+        self.label = label
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Thread-based single flight for blocking callers (sn_client).
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = _Counters()
+        _flights.add(self)
+
+    def do(self, key, fn, label: str = ""):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(label)
+            else:
+                call.waiters += 1
+        self._counters.count(label, not leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]  # later callers start a new flight
+                shared = call.waiters > 0
+            call.done.set()
+        return copy.deepcopy(call.result) if shared else call.result
+
+    def forget(self, label: str = None) -> None:
+        with self._lock:
+            for key in [key for key, call in self._calls.items() if label is None or call.label == label]:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        return {**self._counters.stats(), "in_flight": len(self._calls)}
+
+class AsyncSingleFlight:
+    """
+    asyncio single flight (sn_async, tool dispatch). The shared call runs in
+    its own task, so a caller that is cancelled does not cancel it for the
+    others. With track=True the call records the tables it reads, and
+    forget(table) also detaches it when it has read that table.
+    """
+    def __init__(self):
+        self._calls = {}  # key -> [task, waiters, label, tables read or None]
+        self._lock = threading.Lock()  # forget() is also called from worker threads (sn_client writes)
+        self._counters = _Counters()
+        _flights.add(self)
+
+    async def do(self, key, fn, label: str = "", track: bool = False):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                tables = set() if track else None
+                task = asyncio.ensure_future(_tracked(fn, tables) if track else fn())
+                call = self._calls[key] = [task, 0, label, tables]
+            else:
+                call[1] += 1
+        if leader:
+            task.add_done_callback(lambda _: self._detach(key, call))
+        self._counters.count(label, not leader)
+        result = await asyncio.shield(call[0])
+        return copy.deepcopy(result) if call[1] else result
+
+    def _detach(self, key, call: list) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]  # later callers start a new flight
+
+    def forget(self, label: str = None) -> None:
+        with self._lock:
+            for key in [key for key, call in self._calls.items()
+                        if label is None or call[2] == label or (call[3] is not None and label in call[3])]:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        return {**self._counters.stats(), "in_flight": len(self._calls)}
@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from typing import NamedTuple
+from servicenow_client.encodedquery import Query
+from config import SN_CURSOR_SECRET, SN_CURSOR_TTL
+
+# Keyset continuation cursors for paged queries. A page is read in the
+# order of the query's ORDERBY/ORDERBYDESC fields with sys_id as the final
+# tie-breaker; the cursor records the original query and the sort values and
+# sys_id of the last row returned, and the next page asks for the rows
+# ordered after that position. Each page is then a bounded index range on the
+# instance, however deep, and rows inserted or deleted between calls do not
+# shift later pages the way sysparm_offset does. Cursors are opaque to
+# callers: base64url JSON signed with HMAC-SHA256 under SN_CURSOR_SECRET and
+# bound to the table and instance they were issued for. With no secret
+# configured a random one is generated per process, so cursors do not survive
+# a restart. Queries with related-list or sub-queries (RLQUERY, SUBQUERY) are
+# refused: they are kept verbatim, so neither their ORDERBY clauses nor the
+# keyset conditions can be combined with every filter group.
+
+_SECRET = (SN_CURSOR_SECRET or "").encode() or secrets.token_bytes(32)
+
+class Cursor(NamedTuple):
+    instance: str
+    table: str
+    query: str     # the caller's query, ORDERBY clauses included
+    values: tuple  # sort key values of the last row, sys_id last
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_SECRET, payload, hashlib.sha256).digest()
+
+def encode(cursor: Cursor, ttl: float = SN_CURSOR_TTL) -> str:
+    payload = json.dumps([cursor.instance, cursor.table, cursor.query, list(cursor.values), int(time.time() + ttl)],
+                         separators=(",", ":")).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+def decode(token: str, instance: str, table: str) -> Cursor:
+    """
+    Verify and unpack a cursor issued for `table` on `instance`; raises
+    ValueError for a tampered, expired or foreign cursor.
+    """
+    try:
+        payload, signature = (_b64decode(part) for part in token.split("."))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("Invalid cursor")
+    issued_instance, issued_table, query, values, expires = json.loads(payload)
+    if expires < time.time():
+        raise ValueError("Cursor expired; run the query again")
+    if (issued_instance, issued_table) != (instance, table):
+        raise ValueError(f"Cursor was issued for {issued_table} on instance {issued_instance}")
+    return Cursor(issued_instance, issued_table, query, tuple(values))
+
+def _parse(query) -> Query:
+    parsed = Query.parse(query)
+    if parsed.positional:
+        clause = next(clause for clause in ("RLQUERY", "SUBQUERY") if clause in parsed.encode())
+        raise ValueError(f"Cursor paging does not support {clause} clauses: related-list and sub-queries "
+                         f"cannot be combined with the keyset conditions")
+    return parsed
+
+def sort_keys(query) -> list:
+    """
+    [(field, descending)] from the ORDERBY/ORDERBYDESC clauses of an encoded
+    query, ending with ("sys_id", False). Raises ValueError for a query
+    cursor paging cannot handle.
+    """
+    keys = [(field, descending) for field, descending in _parse(query).order if field != "sys_id"]
+    return keys + [("sys_id", False)]
+
+def _sorted(query: Query, keys: list) -> str:
+    for field, descending in keys:
+        query.order_by(field, descending)
+    return query.encode()
+
+def _filters(query) -> Query:
+    return _parse(query).unordered()
+
+def _equal(field: str, value: str) -> tuple:
+    return (field, "ISEMPTY", "") if value == "" else (field, "=", value)
+
+def _after(field: str, descending: bool, value: str) -> list:
+    # Alternative conditions for "sorts after `value`"; empty values sort first ascending, last descending.
+    if value == "":
+        return [] if descending else [(field, "ISNOTEMPTY", "")]
+    if descending:
+        return [(field, "<", value), (field, "ISEMPTY", "")]
+    return [(field, ">", value)]
+
+def ordered(query) -> str:
+    """
+    The first page's query: the caller's filters sorted by its sort keys, sys_id last.
+    """
+    return _sorted(_filters(query), sort_keys(query))
+
+def page_query(cursor: Cursor) -> str:
+    """
+    The query for the rows after the cursor's position: for each sort key,
+    the rows equal on the keys before it and after it on that key, OR-ed with
+    ^NQ and combined with every filter group of the original query.
+    """
+    keys = sort_keys(cursor.query)
+    keyset = Query()
+    for index, (field, descending) in enumerate(keys):
+        for condition in _after(field, descending, cursor.values[index]):
+            keyset.new_query()
+            for key, value in zip(keys[:index], cursor.values):
+                keyset.where(*_equal(key[0], value))
+            keyset.where(*condition)
+    return _sorted(_filters(cursor.query).and_(keyset), keys)
+
+def _raw(value) -> str:
+    # Reference links and display_value=all return {"value": ...}.
+    if isinstance(value, dict):
+        value = value.get("value", "")
+    return "" if value is None else str(value)
+
+def fields_for(query: str, fields: list) -> list:
+    """
+    A projection that also returns the sort keys, so the next cursor can be built.
+    """
+    if not fields:
+        return fields
+    return list(dict.fromkeys([*fields, *(field for field, _ in sort_keys(query))]))
+
+def after(instance: str, table: str, query: str, record: dict) -> str:
+    """
+    The cursor for the rows after `record`, the last row of a page.
+    """
+    values = tuple(_raw(record.get(field)) for field, _ in sort_keys(query))
+    return encode(Cursor(instance, table, query, values))
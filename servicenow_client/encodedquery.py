@@ -0,0 +1,314 @@
+import re
+from typing import NamedTuple
+
+# ServiceNow encoded queries as data. A query is a list of ^NQ groups (OR-ed),
+# each a list of AND-ed terms, each term one condition or several ^OR-ed
+# ones, plus ORDERBY/ORDERBYDESC sort keys. Query.parse() reads the encoded
+# form and Query.encode() writes it back, escaping "^" in values as "^^", so
+# callers build queries with where()/or_where()/in_() instead of f-strings
+# and values cannot break the clause structure. canonical() orders terms,
+# alternatives, groups and IN lists, so queries that differ only in clause
+# order or whitespace have one form: the record cache, GET coalescing and
+# tool-call coalescing key on it. Clauses the parser does not model are kept
+# verbatim, and queries with related-list or sub-queries (whose clauses depend
+# on their position) are never reordered.
+
+OPERATORS = (
+    "ISNOTEMPTY", "ISEMPTY", "ANYTHING", "EMPTYSTRING", "NOTIN", "IN", "NOTLIKE", "LIKE", "STARTSWITH",
+    "ENDSWITH", "NOTON", "ON", "BETWEEN", "DYNAMIC", "NSAMEAS", "SAMEAS", "!=", ">=", "<=", "=", ">", "<"
+)
+UNARY = ("ISNOTEMPTY", "ISEMPTY", "ANYTHING", "EMPTYSTRING")
+_CONDITION = re.compile(r"^([a-z0-9_.]+?)(" + "|".join(re.escape(op) for op in OPERATORS) + r")(.*)$", re.S)
+_POSITIONAL = re.compile(r"RLQUERY|SUBQUERY")
+
+class Condition(NamedTuple):
+    field: str
+    operator: str
+    value: str = ""
+
+    def encode(self) -> str:
+        return f"{self.field}{self.operator}{escape(self.value)}"
+
+    def canonical(self) -> "Condition":
+        if self.operator in ("IN", "NOTIN"):
+            return self._replace(value=",".join(sorted(set(self.value.split(",")))))
+        return self
+
+class Raw(str):
+    """
+    A clause kept as written (already encoded): javascript: values, unknown operators.
+    """
+    def encode(self) -> str:
+        return str(self)
+
+    def canonical(self) -> "Raw":
+        return self
+
+def escape(value: str) -> str:
+    return str(value).replace("^", "^^")
+
+def _split(text: str) -> list:
+    # Split on "^" but not on the "^^" escape; returns the unescaped clauses.
+    clauses, current, position = [], [], 0
+    while position < len(text):
+        char = text[position]
+        if char == "^" and text.startswith("^^", position):
+            current.append("^")
+            position += 2
+            continue
+        if char == "^":
+            clauses.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+        position += 1
+    clauses.append("".join(current))
+    return clauses
+
+def condition(clause: str):
+    """
+    One clause (unescaped) as a Condition, or Raw when it is not a plain
+    field-operator-value condition.
+    """
+    match = _CONDITION.match(clause)
+    if not match or match.group(3).startswith("javascript:") or (match.group(2) in UNARY and match.group(3)):
+        return Raw(escape(clause))
+    return Condition(*match.groups())
+
+def _value(operator: str, value) -> str:
+    if operator in ("IN", "NOTIN") and not isinstance(value, str):
+        return ",".join(str(item) for item in value)
+    return "" if value is None else str(value)
+
+class Query:
+    """
+    An encoded query. Builder methods return the query itself, so calls chain:
+    Query().where("active", "=", "true").in_("sys_id", ids).order_by("number").
+    """
+    def __init__(self):
+        self.groups = [[]]  # ^NQ groups of terms; a term is a tuple of ^OR-ed conditions
+        self.order = []     # [(field, descending)]
+        self._verbatim = None
+
+    @classmethod
+    def parse(cls, text) -> "Query":
+        if isinstance(text, Query):
+            return text.copy()
+        query = cls()
+        text = (text or "").strip()
+        if _POSITIONAL.search(text):
+            query._verbatim = "^".join(clause.strip() for clause in text.split("^"))
+            return query
+        for clause in (clause.strip() for clause in _split(text)):
+            if not clause or clause == "EQ":
+                continue
+            if clause.startswith("NQ"):
+                query.new_query()
+                clause = clause[2:]
+                if not clause:
+                    continue
+            if clause.startswith("ORDERBYDESC"):
+                query.order_by(clause[len("ORDERBYDESC"):], descending=True)
+            elif clause.startswith("ORDERBY"):
+                query.order_by(clause[len("ORDERBY"):])
+            elif clause.startswith("OR") and query.groups[-1]:
+                query.groups[-1][-1] += (condition(clause[2:]),)
+            else:
+                query.groups[-1].append((condition(clause),))
+        if len(query.groups) > 1 and not query.groups[-1]:
+            query.groups.pop()  # a trailing ^NQ adds no group
+        return query
+
+    def copy(self) -> "Query":
+        query = Query()
+        query.groups = [list(group) for group in self.groups]
+        query.order = list(self.order)
+        query._verbatim = self._verbatim
+        return query
+
+    @property
+    def positional(self) -> bool:
+        """
+        True for a query with related-list or sub-queries, kept verbatim.
+        """
+        return self._verbatim is not None
+
+    def _append(self, clause: str) -> "Query":
+        # Positional queries are only ever extended at the end, as written.
+        self._verbatim = "^".join(part for part in (self._verbatim, clause) if part)
+        return self
+
+    def unordered(self) -> "Query":
+        """
+        A copy with the sort keys removed, ORDERBY clauses of positional queries included.
+        """
+        query = self.copy()
+        query.order = []
+        if query.positional:
+            query._verbatim = "^".join(clause for clause in query._verbatim.split("^") if not clause.startswith("ORDERBY"))
+        return query
+
+    def where(self, field: str, operator: str = "=", value="") -> "Query":
+        """
+        AND a condition; `value` may be a list for IN/NOTIN.
+        """
+        added = Condition(field, operator, _value(operator, value))
+        if self.positional:
+            return self._append(added.encode())
+        self.groups[-1].append((added,))
+        return self
+
+    def or_where(self, field: str, operator: str = "=", value="") -> "Query":
+        """
+        OR a condition with the last term (^OR).
+        """
+        added = Condition(field, operator, _value(operator, value))
+        if self.positional:
+            return self._append(f"OR{added.encode()}")
+        if not self.groups[-1]:
+            raise ValueError("or_where() needs a preceding condition")
+        self.groups[-1][-1] += (added,)
+        return self
+
+    def in_(self, field: str, values) -> "Query":
+        return self.where(field, "IN", values)
+
+    def new_query(self) -> "Query":
+        """
+        Start a new ^NQ group, OR-ed with the previous ones.
+        """
+        if self.positional:
+            raise ValueError("Cannot start a ^NQ group after a related-list or sub-query")
+        if self.groups[-1]:
+            self.groups.append([])
+        return self
+
+    def order_by(self, field: str, descending: bool = False) -> "Query":
+        if self.positional:
+            return self._append(f"ORDERBYDESC{field}" if descending else f"ORDERBY{field}")
+        if all(existing != field for existing, _ in self.order):
+            self.order.append((field, descending))
+        return self
+
+    def and_(self, other) -> "Query":
+        """
+        This query AND-ed with `other` (a Query or encoded string); every
+        ^NQ group of one is combined with every group of the other.
+        A positional query only takes single-group queries, appended as written.
+        """
+        other = Query.parse(other)
+        if self.positional or other.positional:
+            if len(self.groups) > 1 or len(other.groups) > 1:
+                raise ValueError("Only single-group queries can be combined with related-list or sub-queries")
+            return Query.parse("^".join(part for part in (self.encode(), other.encode()) if part))
+        combined = Query()
+        combined.groups = [[*mine, *theirs] for mine in self.groups for theirs in other.groups]
+        for field, descending in self.order + other.order:
+            combined.order_by(field, descending)
+        return combined
+
+    def canonical(self) -> "Query":
+        """
+        The same query with duplicate terms removed and terms, alternatives,
+        groups and IN lists sorted; sort keys keep their order.
+        """
+        if self.positional:
+            return self.copy()
+        query = Query()
+        groups = set()
+        for group in self.groups:
+            terms = {tuple(sorted({item.canonical() for item in term}, key=_encode_item)) for term in group}
+            groups.add(tuple(sorted(terms, key=_encode_term)))
+        if len(groups) > 1:
+            groups.discard(())
+        query.groups = [list(group) for group in sorted(groups, key=_encode_group)] or [[]]
+        query.order = list(self.order)
+        return query
+
+    def fields(self) -> set:
+        """
+        Fields referenced by conditions and sort keys (Raw clauses excluded).
+        """
+        referenced = {field for field, _ in self.order}
+        for group in self.groups:
+            referenced.update(item.field for term in group for item in term if isinstance(item, Condition))
+        return referenced
+
+    def encode(self) -> str:
+        if self.positional:
+            return self._verbatim
+        filters = "^NQ".join(_encode_group(group) for group in self.groups if group)
+        order = "^".join(f"ORDERBYDESC{field}" if descending else f"ORDERBY{field}" for field, descending in self.order)
+        return "^".join(part for part in (filters, order) if part)
+
+    def __str__(self) -> str:
+        return self.encode()
+
+    def __repr__(self) -> str:
+        return f"Query({self.encode()!r})"
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Query, str)):
+            return canonical(self) == canonical(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(canonical(self))
+
+def _encode_item(item) -> str:
+    return item.encode()
+
+def _encode_term(term: tuple) -> str:
+    return "^OR".join(item.encode() for item in term)
+
+def _encode_group(group) -> str:
+    return "^".join(_encode_term(term) for term in group)
+
+def canonical(query) -> str:
+    """
+    The canonical encoded form of a query string (or Query): the key under
+    which equivalent queries are cached and coalesced.
+    """
+    return Query.parse(query).canonical().encode()
+
+def and_(*queries) -> str:
+    """
+    The encoded AND of several queries or clauses; empty ones are skipped.
+    """
+    combined = Query()
+    for query in queries:
+        if query:
+            combined = combined.and_(query)
+    return combined.encode()
+
+def ids_in(ids, field: str = "sys_id", query=None) -> str:
+    """
+    One `field`IN lookup for many ids (deduplicated, sorted), AND-ed with `query`.
+    """
+    return Query.parse(query).and_(Query().in_(field, sorted({str(i) for i in ids if i}))).canonical().encode()
+
+def merge_lookups(queries: list, field: str = "sys_id"):
+    """
+    Merge queries that differ only in one `field`=value (or `field`IN)
+    condition into a single `field`IN query; None when they cannot be merged.
+    """
+    rest, ids = None, []
+    for text in queries:
+        query = Query.parse(text).canonical()
+        if query.positional or len(query.groups) != 1 or query.order:
+            return None
+        lookups = [term for term in query.groups[0]
+                   if len(term) == 1 and isinstance(term[0], Condition)
+                   and term[0].field == field and term[0].operator in ("=", "IN")]
+        if len(lookups) != 1:
+            return None
+        others = tuple(term for term in query.groups[0] if term is not lookups[0])
+        if rest is not None and others != rest:
+            return None
+        rest = others
+        ids.extend(lookups[0][0].value.split(","))
+    if rest is None:
+        return None
+    base = Query()
+    base.groups = [list(rest)]
+    return ids_in(ids, field, base)
@@ -0,0 +1,189 @@
+import contextvars
+import importlib.util
+import threading
+from contextlib import contextmanager
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from servicenow_client.cache import RecordCache
+from servicenow_client.oauth import TokenManager, OAuthCredentials
+from config import (
+    SN_INSTANCE_URL, SN_AUTH_METHOD, SN_USERNAME, SN_PASSWORD,
+    SN_OAUTH_URL, SN_CLIENT_ID, SN_CLIENT_SECRET, SN_OAUTH_GRANT_TYPE,
+    SN_DEFAULT_INSTANCE, SN_INSTANCES,
+    SN_POOL_CONNECTIONS, SN_POOL_MAXSIZE, SN_CONNECT_TIMEOUT, SN_READ_TIMEOUT, SN_HTTP2
+)
+
+# Named ServiceNow instances served by one process. Each Instance owns its
+# connection pools (a requests.Session for sn_client, an httpx.AsyncClient for
+# sn_async), its credentials and OAuth tokens and its record cache; the rate
+# limiter and circuit breaker are keyed by instance URL in resilience.py.
+# Pools are opened on first use, so configured but idle instances cost a few
+# objects. The instance a call runs against is held in a context variable:
+# registry.dispatch() sets it from the `instance` tool argument, asyncio tasks
+# and asyncio.to_thread() inherit it, and everything else uses
+# SN_DEFAULT_INSTANCE, built from the top-level settings in config.py.
+
+_current = contextvars.ContextVar("sn_instance", default=None)
+
+class Instance:
+    def __init__(self, name: str, instance_url: str, auth_method: str = "basic", username: str = None,
+                 password: str = None, oauth_url: str = None, client_id: str = None, client_secret: str = None,
+                 oauth_grant_type: str = "client_credentials"):
+        if auth_method not in ("basic", "oauth"):
+            raise ValueError(f"Unknown auth_method for instance {name}: {auth_method}")
+        self.name = name
+        self.url = instance_url.rstrip("/")
+        self.auth_method = auth_method
+        self.username = username
+        self.password = password
+        self.oauth = OAuthCredentials(oauth_url or f"{self.url}/oauth_token.do", client_id, client_secret,
+                                      oauth_grant_type, username, password)
+        self.tokens = TokenManager(self._post_token)
+        self.cache = RecordCache()
+        self._caches = {}
+        self._session = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def principal(self) -> str:
+        # The user the instance rate-limits us as.
+        return self.oauth.client_id if self.auth_method == "oauth" else self.username
+
+    def session(self) -> requests.Session:
+        """
+        Return this instance's pooled keep-alive session (sn_client).
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=SN_POOL_CONNECTIONS, pool_maxsize=SN_POOL_MAXSIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update({"Accept": "application/json", "Connection": "keep-alive"})
+                    self._session = session
+        return self._session
+
+    def client(self) -> httpx.AsyncClient:
+        """
+        Return this instance's AsyncClient (sn_async), HTTP/2 when the `h2` package is installed.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=SN_HTTP2 and importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_connections=SN_POOL_MAXSIZE, max_keepalive_connections=SN_POOL_MAXSIZE),
+                timeout=httpx.Timeout(SN_READ_TIMEOUT, connect=SN_CONNECT_TIMEOUT),
+                headers={"Accept": "application/json"},
+            )
+        return self._client
+
+    def named_cache(self, name: str, **options) -> RecordCache:
+        """
+        Return a RecordCache private to this instance for other per-instance
+        data (e.g. CMDB adjacency lists); `options` apply when it is created.
+        """
+        cache = self._caches.get(name)
+        if cache is None:
+            with self._lock:
+                cache = self._caches.setdefault(name, RecordCache(**options))
+        return cache
+
+    def caches(self) -> dict:
+        """
+        {name: RecordCache}: the record cache ("records") and the named caches.
+        """
+        with self._lock:
+            return {"records": self.cache, **self._caches}
+
+    def close_session(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _post_token(self, url: str, data: dict) -> dict:
+        response = self.session().post(url, data=data, timeout=(SN_CONNECT_TIMEOUT, SN_READ_TIMEOUT))
+        response.raise_for_status()
+        return response.json()
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "auth_method": self.auth_method,
+            "principal": self.principal,
+            "default": self.name == SN_DEFAULT_INSTANCE,
+            "loaded": True,
+            "session_open": self._session is not None,
+            "async_client_open": self._client is not None and not self._client.is_closed,
+            "cached_entries": self.cache.stats()["entries"],
+        }
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+def _from_config(name: str) -> Instance:
+    if name == SN_DEFAULT_INSTANCE and name not in SN_INSTANCES:
+        return Instance(name, SN_INSTANCE_URL, SN_AUTH_METHOD, SN_USERNAME, SN_PASSWORD,
+                        SN_OAUTH_URL, SN_CLIENT_ID, SN_CLIENT_SECRET, SN_OAUTH_GRANT_TYPE)
+    if name not in SN_INSTANCES:
+        raise ValueError(f"Unknown ServiceNow instance: {name}")
+    return Instance(name, **SN_INSTANCES[name])
+
+def get(name: str = None) -> Instance:
+    """
+    Return the named instance (default: the current one), created from
+    config.py on first use. Raises ValueError for an unknown name.
+    """
+    name = name or _current.get() or SN_DEFAULT_INSTANCE
+    instance = _instances.get(name)
+    if instance is None:
+        with _instances_lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = _from_config(name)
+    return instance
+
+def current() -> Instance:
+    return get()
+
+def register(name: str, instance_url: str, **settings) -> Instance:
+    """
+    Add or replace an instance at runtime; `settings` are the Instance keyword
+    arguments (auth_method, username, password, oauth_url, client_id, ...).
+    """
+    instance = Instance(name, instance_url, **settings)
+    with _instances_lock:
+        previous, _instances[name] = _instances.get(name), instance
+    if previous is not None:
+        previous.close_session()
+    return instance
+
+def names() -> list:
+    return list(dict.fromkeys([SN_DEFAULT_INSTANCE, *SN_INSTANCES, *_instances]))
+
+def loaded() -> list:
+    with _instances_lock:
+        return list(_instances.values())
+
+@contextmanager
+def use(name: str = None):
+    """
+    Run the enclosed calls against the named instance (None keeps the current one).
+    """
+    if not name:
+        yield current()
+        return
+    instance = get(name)
+    token = _current.set(instance.name)
+    try:
+        yield instance
+    finally:
+        _current.reset(token)
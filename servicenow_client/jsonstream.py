@@ -0,0 +1,81 @@
+import codecs
+import json
+import re
+
+# Incremental parsing of Table API response bodies. A query answers
+# {"result": [record, record, ...]}; ResultParser is fed the body in chunks as
+# it arrives and returns each record as soon as its closing brace is in,
+# so a large response is never held whole, as text or as parsed objects.
+# Records are decoded with the stdlib JSONDecoder (raw_decode), so the only
+# buffered text is the record currently being received. A body of any other
+# shape (e.g. {"error": ...}) is buffered and its "result" array, if any,
+# returned when the body is complete.
+
+_PREFIX = re.compile(r'\s*\{\s*"result"\s*:\s*\[')
+_SEPARATORS = " \t\r\n,"
+
+class ResultParser:
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "prefix"  # prefix -> items -> done, or prefix -> whole
+        self.records = 0
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        Add the next chunk of the body; return the records it completed.
+        """
+        self._buffer += self._text.decode(chunk)
+        if self._state == "prefix":
+            match = _PREFIX.match(self._buffer)
+            if match:
+                self._buffer = self._buffer[match.end():]
+                self._state = "items"
+            elif not _could_start(self._buffer):
+                self._state = "whole"
+        if self._state != "items":
+            return []
+        records, position = [], 0
+        buffer = self._buffer
+        while True:
+            while position < len(buffer) and buffer[position] in _SEPARATORS:
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                self._state = "done"
+                position = len(buffer)
+                break
+            try:
+                record, end = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # incomplete: wait for the next chunk
+            if end >= len(buffer) and not isinstance(record, (dict, list)):
+                break  # a number may continue in the next chunk
+            records.append(record)
+            position = end
+        self._buffer = buffer[position:]
+        self.records += len(records)
+        return records
+
+    def close(self) -> list:
+        """
+        Finish the body; returns any records of a body that was not streamable
+        and raises ValueError when the body was truncated or malformed.
+        """
+        self._buffer += self._text.decode(b"", final=True)
+        if self._state == "done":
+            return []
+        if self._state == "items":
+            raise ValueError(f"Truncated Table API response after {self.records} records")
+        body = json.loads(self._buffer) if self._buffer.strip() else {}
+        self._buffer = ""
+        result = body.get("result", []) if isinstance(body, dict) else []
+        records = result if isinstance(result, list) else [result]
+        self.records += len(records)
+        return records
+
+def _could_start(text: str) -> bool:
+    # Whether `text` may still grow into the {"result": [ prefix.
+    return '{"result":['.startswith(re.sub(r"\s+", "", text))
@@ -0,0 +1,166 @@
+import threading
+import time
+from typing import NamedTuple
+import requests
+from config import SN_OAUTH_REFRESH_MARGIN, SN_READ_TIMEOUT
+
+# OAuth access tokens, one per credential set. Reading a valid token takes no
+# lock: the token, its refresh time and its expiry live in one tuple that a
+# refresh replaces in a single assignment. SN_OAUTH_REFRESH_MARGIN seconds
+# before expiry (but not before half the token's lifetime) the first caller
+# starts one background refresh and keeps using the current token; only a
+# caller holding no valid token at all waits, and concurrent waiters share the
+# same refresh. A held refresh_token is tried
+# first, falling back to the configured grant when the instance rejects it.
+
+class OAuthCredentials(NamedTuple):
+    token_url: str
+    client_id: str
+    client_secret: str
+    grant_type: str = "client_credentials"  # or "password"
+    username: str = None
+    password: str = None
+
+class _TokenState:
+    def __init__(self):
+        self.current = None        # (access_token, refresh_at, expires_at)
+        self.refresh_token = None
+        self.inflight = None       # threading.Event of the running refresh
+        self.error = None
+        self.lock = threading.Lock()
+
+def _expired(current: tuple) -> bool:
+    return current is None or time.time() >= current[2]
+
+def _due(current: tuple) -> bool:
+    return current is None or time.time() >= current[1]
+
+class TokenManager:
+    def __init__(self, post, margin: float = SN_OAUTH_REFRESH_MARGIN):
+        """
+        `post(url, data)` sends the token request and returns the decoded JSON,
+        raising requests.HTTPError on a non-2xx answer.
+        """
+        self._post = post
+        self.margin = margin
+        self._states = {}
+        self._states_lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ("refreshes", "proactive_refreshes", "waits", "refresh_token_grants", "refresh_token_rejected",
+             "failures", "invalidations"), 0)
+
+    def _count(self, name: str) -> None:
+        with self._states_lock:
+            self._counters[name] += 1
+
+    def _state(self, credentials: OAuthCredentials) -> _TokenState:
+        state = self._states.get(credentials)
+        if state is None:
+            with self._states_lock:
+                state = self._states.setdefault(credentials, _TokenState())
+        return state
+
+    def peek(self, credentials: OAuthCredentials) -> str:
+        """
+        Return a valid token without blocking, or None when the caller has to
+        wait for a refresh (see get_token). Starts a background refresh when
+        the token is close to expiry.
+        """
+        state = self._state(credentials)
+        current = state.current
+        now = time.time()
+        if current is None or now >= current[2]:
+            return None
+        if now >= current[1] and self._begin(state, _due)[1]:
+            self._count("proactive_refreshes")
+            threading.Thread(target=self._refresh, args=(credentials, state), daemon=True).start()
+        return current[0]
+
+    def get_token(self, credentials: OAuthCredentials) -> str:
+        """
+        Return a valid access token, refreshing it first if none is held.
+        """
+        token = self.peek(credentials)
+        if token is not None:
+            return token
+        state = self._state(credentials)
+        event, started = self._begin(state, _expired)
+        if started:
+            self._refresh(credentials, state)
+        elif event is not None:
+            self._count("waits")
+            event.wait(SN_READ_TIMEOUT)
+        current = state.current
+        if current is not None and time.time() < current[2]:
+            return current[0]
+        raise state.error or RuntimeError("OAuth token refresh did not complete")
+
+    def invalidate(self, credentials: OAuthCredentials, token: str) -> None:
+        """
+        Drop `token` after the instance rejected it (HTTP 401). Callers that hit
+        401 with an older token do not discard a newer one.
+        """
+        state = self._state(credentials)
+        current = state.current
+        if current is not None and current[0] == token:
+            state.current = None
+            self._count("invalidations")
+
+    def _begin(self, state: _TokenState, needed) -> tuple:
+        # (event, True) for the caller that must run the refresh, (event, False) for the others, and
+        # (None, False) when a refresh that finished since the caller looked made it unnecessary.
+        with state.lock:
+            if state.inflight is not None:
+                return state.inflight, False
+            if not needed(state.current):
+                return None, False
+            state.inflight = threading.Event()
+            return state.inflight, True
+
+    def _refresh(self, credentials: OAuthCredentials, state: _TokenState) -> None:
+        try:
+            data = self._request_token(credentials, state.refresh_token)
+            expires_in = float(data.get("expires_in", 1800))
+            now = time.time()
+            state.refresh_token = data.get("refresh_token") or state.refresh_token
+            # Short-lived tokens are refreshed halfway through, not on every use.
+            state.current = (data["access_token"], now + max(expires_in / 2, expires_in - self.margin), now + expires_in)
+            state.error = None
+            self._count("refreshes")
+        except Exception as e:
+            state.error = e
+            self._count("failures")
+        finally:
+            with state.lock:
+                event, state.inflight = state.inflight, None
+            event.set()
+
+    def _request_token(self, credentials: OAuthCredentials, refresh_token: str) -> dict:
+        client = {"client_id": credentials.client_id, "client_secret": credentials.client_secret}
+        if refresh_token:
+            try:
+                data = self._post(credentials.token_url, {"grant_type": "refresh_token", "refresh_token": refresh_token, **client})
+                self._count("refresh_token_grants")
+                return data
+            except requests.HTTPError:
+                self._count("refresh_token_rejected")  # expired or revoked: start over
+        data = {"grant_type": credentials.grant_type, **client}
+        if credentials.grant_type == "password":
+            data.update(username=credentials.username, password=credentials.password)
+        return self._post(credentials.token_url, data)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._states_lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "tokens": {
+                f"{credentials.client_id}@{credentials.token_url}": {
+                    "valid": state.current is not None and now < state.current[2],
+                    "expires_in": round(state.current[2] - now, 1) if state.current else None,
+                    "has_refresh_token": state.refresh_token is not None,
+                }
+                for credentials, state in list(self._states.items())
+            },
+        }
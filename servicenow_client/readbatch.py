@@ -0,0 +1,199 @@
+import asyncio
+import copy
+import re
+import threading
+from servicenow_client import telemetry
+from config import SN_READ_BATCH_ENABLED, SN_READ_BATCH_WINDOW, SN_READ_BATCH_MAX_SIZE
+
+# Dataloader-style batching of point reads. The first read_record() of a
+# table (with a given projection, on a given instance) opens a batch; reads of
+# the same table and projection that arrive before it is sent join it, and the
+# batch is then fetched with one sys_idIN query (sent at once when
+# SN_READ_BATCH_MAX_SIZE reads have joined). A batch is sent as soon as it is
+# opened (async: at the end of the current event loop iteration, so reads
+# started together, e.g. by gather(), still share it) unless a batch of the
+# same key is already being fetched; only then does it wait
+# SN_READ_BATCH_WINDOW seconds for more reads, so a lone read is never
+# delayed. Each caller gets {"result": record} as from GET
+# /table/{table}/{sys_id}, or the same 404 HTTP error for a sys_id the query
+# did not return. A batch of one is sent as the plain GET. Reads of the same
+# sys_id in one batch share one row. Batch sizes are recorded in
+# telemetry.READ_BATCH_SIZE.
+
+_BATCHABLE_ID = re.compile(r"^[A-Za-z0-9_\-]+$")  # anything else could break the IN list
+
+NOT_FOUND_BODY = {
+    "error": {"message": "No Record found", "detail": "Record doesn't exist or ACL restricts the record retrieval"},
+    "status": "failure",
+}
+
+def batchable(sys_id: str) -> bool:
+    return bool(sys_id) and _BATCHABLE_ID.match(sys_id) is not None
+
+def query_fields(fields: list) -> list:
+    """
+    The projection for the batch query: the caller's fields plus sys_id, to match rows back to reads.
+    """
+    return fields + ["sys_id"] if fields and "sys_id" not in fields else fields
+
+def _row_id(row: dict) -> str:
+    value = row.get("sys_id")
+    return value.get("value") if isinstance(value, dict) else value  # display_value=all
+
+def _resolve(ids: list, rows: list, fields: list, missing) -> dict:
+    # {sys_id: record or exception} for every id of the batch.
+    found = {}
+    for row in rows:
+        row = dict(row)
+        sys_id = _row_id(row)
+        if fields and "sys_id" not in fields:
+            row.pop("sys_id", None)
+        found[sys_id] = row
+    return {sys_id: found[sys_id] if sys_id in found else missing(sys_id) for sys_id in ids}
+
+class _Batch:
+    def __init__(self):
+        self.ids = {}  # sys_id -> number of callers, in arrival order
+        self.results = {}
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+class ReadBatcher:
+    """
+    Thread-based batcher for blocking callers (sn_client): the thread that
+    opens a batch fetches it for everyone, after the window when a batch of
+    the same key is in flight.
+    """
+    def __init__(self, window: float = SN_READ_BATCH_WINDOW, max_size: int = SN_READ_BATCH_MAX_SIZE,
+                 enabled: bool = SN_READ_BATCH_ENABLED):
+        self.window = window
+        self.max_size = max_size
+        self.enabled = enabled
+        self._pending = {}
+        self._in_flight = {}  # key -> batches being fetched
+        self._lock = threading.Lock()
+
+    def read(self, key: tuple, sys_id: str, fetch_one, fetch_many, fields: list, missing) -> dict:
+        """
+        {"result": record} for `sys_id`. `key` is (instance, table, projection...);
+        fetch_one() GETs this record alone, fetch_many(ids) returns the rows of
+        a sys_idIN query and missing(sys_id) builds the 404 error.
+        """
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch()
+            batch.ids[sys_id] = batch.ids.get(sys_id, 0) + 1
+            if len(batch.ids) >= self.max_size:
+                self._pending.pop(key, None)
+                batch.full.set()
+        if leader:
+            if self._in_flight.get(key):
+                batch.full.wait(self.window)
+            with self._lock:
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            try:
+                batch.results = self._fetch(key, list(batch.ids), fetch_one, fetch_many, fields, missing)
+            except BaseException as e:
+                batch.results = dict.fromkeys(batch.ids, e)
+            finally:
+                with self._lock:
+                    _release(self._in_flight, key)
+                batch.done.set()
+        else:
+            batch.done.wait()
+        return _deliver(batch.results[sys_id], batch.ids[sys_id] > 1)
+
+    def _fetch(self, key: tuple, ids: list, fetch_one, fetch_many, fields: list, missing) -> dict:
+        telemetry.READ_BATCH_SIZE.observe(len(ids), key[0], key[1])
+        if len(ids) == 1:
+            return {ids[0]: fetch_one()}
+        return {sys_id: _wrap(row) for sys_id, row in _resolve(ids, fetch_many(ids), fields, missing).items()}
+
+class AsyncReadBatcher:
+    """
+    asyncio batcher (sn_async). A batch is fetched in its own task, so a
+    caller that is cancelled does not cancel the read for the others.
+    """
+    def __init__(self, window: float = SN_READ_BATCH_WINDOW, max_size: int = SN_READ_BATCH_MAX_SIZE,
+                 enabled: bool = SN_READ_BATCH_ENABLED):
+        self.window = window
+        self.max_size = max_size
+        self.enabled = enabled
+        self._pending = {}  # (loop, key) -> [{sys_id: [future, callers]}, timer]
+        self._in_flight = {}  # (loop, key) -> batches being fetched
+
+    async def read(self, key: tuple, sys_id: str, fetch_one, fetch_many, fields: list, missing) -> dict:
+        """
+        Async counterpart of ReadBatcher.read; fetch_one and fetch_many are coroutine functions.
+        """
+        loop = asyncio.get_running_loop()
+        pending_key = (loop, key)
+        batch = self._pending.get(pending_key)
+        if batch is None:
+            batch = self._pending[pending_key] = [{}, None]
+            flush = (self._flush, pending_key, batch, fetch_one, fetch_many, fields, missing)
+            batch[1] = loop.call_later(self.window, *flush) if self._in_flight.get(pending_key) else loop.call_soon(*flush)
+        entry = batch[0].get(sys_id)
+        if entry is None:
+            future = loop.create_future()
+            future.add_done_callback(_retrieve)
+            entry = batch[0][sys_id] = [future, 0]
+        entry[1] += 1
+        if len(batch[0]) >= self.max_size:
+            batch[1].cancel()
+            self._flush(pending_key, batch, fetch_one, fetch_many, fields, missing)
+        return _deliver(await asyncio.shield(entry[0]), entry[1] > 1)
+
+    def _flush(self, pending_key: tuple, batch: list, fetch_one, fetch_many, fields: list, missing) -> None:
+        if self._pending.get(pending_key) is batch:
+            del self._pending[pending_key]
+            self._in_flight[pending_key] = self._in_flight.get(pending_key, 0) + 1
+            asyncio.ensure_future(self._fetch(pending_key, batch[0], fetch_one, fetch_many, fields, missing))
+
+    async def _fetch(self, pending_key: tuple, entries: dict, fetch_one, fetch_many, fields: list, missing) -> None:
+        ids = list(entries)
+        key = pending_key[1]
+        telemetry.READ_BATCH_SIZE.observe(len(ids), key[0], key[1])
+        try:
+            if len(ids) == 1:
+                results = {ids[0]: await fetch_one()}
+            else:
+                rows = _resolve(ids, await fetch_many(ids), fields, missing)
+                results = {sys_id: _wrap(row) for sys_id, row in rows.items()}
+        except BaseException as e:
+            results = dict.fromkeys(ids, e)
+        finally:
+            _release(self._in_flight, pending_key)
+        for sys_id, (future, _) in entries.items():
+            if future.done():
+                continue
+            if isinstance(results[sys_id], BaseException):
+                future.set_exception(results[sys_id])
+            else:
+                future.set_result(results[sys_id])
+        error = results[ids[0]]
+        if isinstance(error, asyncio.CancelledError):
+            raise error
+
+def _release(in_flight: dict, key) -> None:
+    if in_flight[key] > 1:
+        in_flight[key] -= 1
+    else:
+        del in_flight[key]
+
+def _wrap(row):
+    return row if isinstance(row, BaseException) else {"result": row}
+
+def _deliver(result, shared: bool) -> dict:
+    if isinstance(result, BaseException):
+        raise result
+    return copy.deepcopy(result) if shared else result
+
+def _retrieve(future: asyncio.Future) -> None:
+    # An error nobody awaited any more (all its callers were cancelled) is not worth a warning.
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,381 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from servicenow_client import sn_client, sn_async, instances
+from servicenow_client.encodedquery import Condition, Query
+from config import (
+    SN_DEFAULT_INSTANCE, SN_REPLICA_ENABLED, SN_REPLICA_PATH, SN_REPLICA_TABLES,
+    SN_REPLICA_MAX_LAG, SN_REPLICA_OVERLAP, SN_PAGE_SIZE
+)
+
+# Local SQLite replica of selected tables. The first sync of a table is a full
+# keyset scan; later syncs only pull rows whose sys_updated_on is at or after the
+# stored watermark, and apply deletes recorded in sys_audit_delete. Reporting
+# and analytics read through aiter_records() below, which serves a table from
+# the replica while it is fresh and falls back to the instance otherwise.
+# The replica mirrors SN_DEFAULT_INSTANCE only; calls routed to any other
+# instance always go to that instance.
+
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # sys_updated_on / sys_created_on, UTC
+_TABLE_NAME = re.compile(r"^[a-z0-9_]+$")
+_OPERATORS = {"ISNOTEMPTY", "ISEMPTY", "ANYTHING", "NOTIN", "IN", "NOTLIKE", "LIKE", "STARTSWITH", "ENDSWITH",
+              "!=", ">=", "<=", "=", ">", "<"}
+_WRITE_BATCH = 1000
+
+def _parse_time(value: str) -> datetime:
+    return datetime.strptime(value, _TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+def _format_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime(_TIME_FORMAT)
+
+def _number(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _condition(condition) -> tuple:
+    # One encoded-query condition as (sql, params) over the JSON row.
+    if (not isinstance(condition, Condition) or not _TABLE_NAME.match(condition.field)
+            or condition.operator not in _OPERATORS):
+        raise ValueError(f"Encoded query clause not supported by the replica: {condition.encode()}")
+    field, operator, value = condition
+    column = f"json_extract(data, '$.{field}')"
+    if operator == "ANYTHING":
+        return "1", []
+    if operator == "ISEMPTY":
+        return f"COALESCE({column}, '') = ''", []
+    if operator == "ISNOTEMPTY":
+        return f"COALESCE({column}, '') != ''", []
+    if operator in ("IN", "NOTIN"):
+        values = value.split(",")
+        placeholders = ",".join("?" * len(values))
+        if operator == "IN":
+            return f"{column} IN ({placeholders})", values
+        return f"COALESCE({column}, '') NOT IN ({placeholders})", values
+    if operator in ("LIKE", "NOTLIKE", "STARTSWITH", "ENDSWITH"):
+        pattern = {"STARTSWITH": "{}%", "ENDSWITH": "%{}"}.get(operator, "%{}%").format(_escape_like(value))
+        negate = "NOT " if operator == "NOTLIKE" else ""
+        return f"COALESCE({column}, '') {negate}LIKE ? ESCAPE '\\'", [pattern]
+    if operator in ("=", "!="):
+        return f"COALESCE({column}, '') {operator} ?", [value]
+    number = _number(value)
+    if number is not None:
+        return f"CAST({column} AS REAL) {operator} ?", [number]
+    return f"{column} {operator} ?", [value]
+
+def compile_query(query) -> tuple:
+    """
+    Translate an encoded query into (where_sql, params, order_sql) for the
+    replica. Supports ^, ^OR, ^NQ, ORDERBY/ORDERBYDESC and the common field
+    operators; dot-walked fields, javascript: values and related-list or
+    sub-queries raise ValueError so the caller can go to the instance instead.
+    """
+    parsed = Query.parse(query)
+    if parsed.positional:
+        raise ValueError(f"Encoded query not supported by the replica: {parsed}")
+    groups, params = [], []
+    for group in parsed.groups:
+        ands = []
+        for term in group:
+            conditions = [_condition(item) for item in term]
+            ands.append(" OR ".join(sql for sql, _ in conditions))
+            params.extend(value for _, values in conditions for value in values)
+        if ands:
+            groups.append("(" + ") AND (".join(ands) + ")")
+    order = []
+    for field, descending in parsed.order:
+        if not _TABLE_NAME.match(field):
+            raise ValueError(f"Encoded query clause not supported by the replica: ORDERBY{field}")
+        order.append(f"json_extract(data, '$.{field}'){' DESC' if descending else ''}")
+    where = " OR ".join(f"({sql})" for sql in groups) or "1"
+    return where, params, ", ".join(order + ["sys_id"])
+
+class Replica:
+    def __init__(self, path: str = SN_REPLICA_PATH, tables: list = SN_REPLICA_TABLES,
+                 enabled: bool = SN_REPLICA_ENABLED, max_lag: float = SN_REPLICA_MAX_LAG,
+                 overlap: float = SN_REPLICA_OVERLAP):
+        for table in tables:
+            if not _TABLE_NAME.match(table):
+                raise ValueError(f"Invalid table name for replica: {table}")
+        self.path = path
+        self.tables = list(tables)
+        self.enabled = enabled
+        self.max_lag = max_lag
+        self.overlap = overlap
+        self._local = threading.local()   # one SQLite connection per thread
+        self._sync_lock = threading.Lock()
+        self._synced_at = {}              # table -> start of its last sync (None: never), kept in memory for covers()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    tbl TEXT PRIMARY KEY, generation INTEGER, watermark TEXT, delete_watermark TEXT,
+                    synced_at REAL, duration REAL, rows INTEGER, deleted INTEGER, full_sync INTEGER
+                );
+            """)
+            self._local.db = db
+        return db
+
+    def _state(self, table: str) -> dict:
+        row = self._db().execute("SELECT * FROM sync_state WHERE tbl = ?", (table,)).fetchone()
+        if row is None:
+            return None
+        keys = ("table", "generation", "watermark", "delete_watermark", "synced_at", "duration", "rows", "deleted", "full_sync")
+        return dict(zip(keys, row))
+
+    def covers(self, table: str) -> bool:
+        """
+        True when `table` is replicated and its last sync started less than
+        max_lag seconds ago, and the call runs against the replicated instance.
+        """
+        if not self.enabled or table not in self.tables or instances.current().name != SN_DEFAULT_INSTANCE:
+            return False
+        synced_at = self.synced_at(table)
+        return synced_at is not None and time.time() - synced_at <= self.max_lag
+
+    def synced_at(self, table: str) -> float:
+        # Read from sync_state once; sync_table() keeps it current after that.
+        if table not in self._synced_at:
+            state = self._state(table)
+            self._synced_at[table] = state["synced_at"] if state else None
+        return self._synced_at[table]
+
+    def sync(self, tables: list = None, full: bool = False) -> dict:
+        """
+        Bring the given tables (default: all configured tables) up to date.
+        Returns the per-table sync report.
+        """
+        return {table: self.sync_table(table, full) for table in (tables or self.tables)}
+
+    def sync_table(self, table: str, full: bool = False) -> dict:
+        if table not in self.tables:
+            raise ValueError(f"Table is not replicated: {table}")
+        with self._sync_lock, instances.use(SN_DEFAULT_INSTANCE):
+            db = self._db()
+            db.execute(f"""CREATE TABLE IF NOT EXISTS "{table}" (
+                sys_id TEXT PRIMARY KEY, sys_updated_on TEXT, generation INTEGER, data TEXT)""")
+            started_at, started = time.time(), time.monotonic()
+            state = self._state(table)
+            full = full or state is None or not state["watermark"]
+            generation = (state["generation"] if state else 0) + (1 if full else 0)
+            query = ""
+            if not full:
+                # Re-read the overlap plus the previous pull's duration: rows updated during that pull
+                # may have been skipped by the keyset scan but carry a timestamp inside this window.
+                lookback = timedelta(seconds=self.overlap + (state["duration"] or 0))
+                query = Query().where("sys_updated_on", ">=", _format_time(_parse_time(state["watermark"]) - lookback)).encode()
+            watermark = state["watermark"] if state and not full else None
+            rows, batch = 0, []
+            for record in sn_client.iter_records(table, query, page_size=SN_PAGE_SIZE, prefetch=True,
+                                                 exclude_reference_link=True):
+                updated_on = record.get("sys_updated_on") or ""
+                batch.append((record["sys_id"], updated_on, generation, json.dumps(record, separators=(",", ":"))))
+                watermark = max(watermark or updated_on, updated_on)
+                if len(batch) >= _WRITE_BATCH:
+                    rows += self._upsert(db, table, batch)
+                    batch = []
+            rows += self._upsert(db, table, batch)
+            if full:
+                deleted = db.execute(f'DELETE FROM "{table}" WHERE generation != ?', (generation,)).rowcount
+                delete_watermark = _format_time(datetime.fromtimestamp(started_at, timezone.utc))
+            else:
+                deleted, delete_watermark = self._apply_deletes(db, table, state["delete_watermark"])
+            duration = time.monotonic() - started
+            db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (table, generation, watermark, delete_watermark, started_at, duration, rows, deleted, int(full)))
+            db.commit()
+            self._synced_at[table] = started_at
+        report = {
+            "full": full,
+            "rows": rows,
+            "deleted": deleted,
+            "duration_seconds": round(duration, 3),
+            "rows_per_second": round(rows / max(duration, 1e-9), 1),
+            "watermark": watermark,
+        }
+        logging.info("Replica sync %s: %s", table, report)
+        return report
+
+    def _upsert(self, db: sqlite3.Connection, table: str, batch: list) -> int:
+        db.executemany(f"""INSERT INTO "{table}" VALUES (?, ?, ?, ?)
+            ON CONFLICT(sys_id) DO UPDATE SET sys_updated_on = excluded.sys_updated_on,
+            generation = excluded.generation, data = excluded.data""", batch)
+        return len(batch)
+
+    def _apply_deletes(self, db: sqlite3.Connection, table: str, since: str) -> tuple:
+        # sys_audit_delete only records deletes on tables that have delete auditing on;
+        # a periodic full sync (full=True) reconciles anything missed.
+        start = _format_time(_parse_time(since) - timedelta(seconds=self.overlap))
+        query = Query().where("tablename", "=", table).where("sys_created_on", ">=", start).encode()
+        deleted, watermark = 0, since
+        for entry in sn_client.iter_records("sys_audit_delete", query, fields=["documentkey", "sys_created_on"]):
+            deleted += db.execute(f'DELETE FROM "{table}" WHERE sys_id = ?', (entry.get("documentkey"),)).rowcount
+            watermark = max(watermark, entry.get("sys_created_on") or watermark)
+        return deleted, watermark
+
+    def select(self, table: str, query: str = "", limit: int = None, fields: list = None):
+        """
+        Return an iterator over replicated rows matching the encoded query,
+        ordered like a keyset scan. Raises ValueError up front when the query
+        cannot be evaluated locally.
+        """
+        where, params, order = compile_query(query)
+        sql = f'SELECT data FROM "{table}" WHERE {where} ORDER BY {order}'
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        fields = sn_client.normalize_fields(fields)
+        cursor = self._db().execute(sql, params)
+        def rows():
+            for (data,) in cursor:
+                record = json.loads(data)
+                yield {field: record.get(field, "") for field in fields} if fields else record
+        return rows()
+
+    def select_batches(self, table: str, query: str = "", limit: int = None, fields: list = None,
+                       size: int = _WRITE_BATCH):
+        """
+        select() as an iterator of row lists of up to `size` rows, read through
+        a connection of its own, so consecutive batches can be fetched from
+        different worker threads (aiter_records). Raises ValueError up front
+        when the query cannot be evaluated locally.
+        """
+        where, params, order = compile_query(query)
+        sql = f'SELECT data FROM "{table}" WHERE {where} ORDER BY {order}'
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        fields = sn_client.normalize_fields(fields)
+        def batches():
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            try:
+                cursor = db.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        return
+                    records = [json.loads(data) for (data,) in rows]
+                    yield [{field: record.get(field, "") for field in fields} for record in records] if fields else records
+            finally:
+                db.close()
+        return batches()
+
+    def count(self, table: str, query: str = "", group_by: str = None) -> dict:
+        """
+        {value of group_by: row count} for rows matching the query, or {"": total}
+        without group_by. The local counterpart of the Aggregate API.
+        """
+        where, params, _ = compile_query(query)
+        if group_by is None:
+            sql = f'SELECT \'\', COUNT(*) FROM "{table}" WHERE {where}'
+        elif _TABLE_NAME.match(group_by):
+            sql = f'''SELECT COALESCE(json_extract(data, '$.{group_by}'), ''), COUNT(*) FROM "{table}"
+                      WHERE {where} GROUP BY 1'''
+        else:
+            raise ValueError(f"Group by field not supported by the replica: {group_by}")
+        return dict(self._db().execute(sql, params).fetchall())
+
+    def query_records(self, table: str, query: str, limit: int = 100, offset: int = 0, fields: list = None) -> dict:
+        """
+        sn_client.query_records() against the replica.
+        """
+        rows = self.select(table, query, limit=None if limit is None else offset + limit, fields=fields)
+        return {"result": list(rows)[offset:]}
+
+    def stats(self) -> dict:
+        """
+        Per-table replica lag, row count and the figures of the last sync.
+        """
+        now = time.time()
+        tables = {}
+        for table in self.tables if os.path.exists(self.path) else ():
+            state = self._state(table)
+            if state is None:
+                tables[table] = {"synced": False}
+                continue
+            tables[table] = {
+                "synced": True,
+                "fresh": now - state["synced_at"] <= self.max_lag,
+                "lag_seconds": round(now - state["synced_at"], 1),
+                "row_count": self._db().execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0],
+                "watermark": state["watermark"],
+                "last_sync": {
+                    "full": bool(state["full_sync"]),
+                    "rows": state["rows"],
+                    "deleted": state["deleted"],
+                    "duration_seconds": round(state["duration"], 3),
+                    "rows_per_second": round(state["rows"] / max(state["duration"], 1e-9), 1),
+                },
+            }
+        return {"enabled": self.enabled, "path": self.path, "max_lag": self.max_lag, "tables": tables}
+
+    async def run(self, interval: float) -> None:
+        """
+        Sync every configured table every `interval` seconds until cancelled.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception as e:
+                logging.error(f"Replica sync failed: {str(e)}")
+            await asyncio.sleep(interval)
+
+replica_store = Replica()
+
+async def aiter_records(table: str, query: str = "", max_records: int = None, fields: list = None, **options):
+    """
+    sn_async.aiter_records() that reads `table` from the local replica when it
+    is fresh and the query can be evaluated locally, and from the instance
+    otherwise. Replica rows carry raw values with reference links excluded.
+    """
+    batches = None
+    if await covers(table) and not options.get("display_value"):
+        try:
+            batches = replica_store.select_batches(table, query, limit=max_records, fields=fields)
+        except ValueError as e:
+            logging.debug(f"Replica fallback for {table}: {str(e)}")
+    if batches is None:
+        async for record in sn_async.aiter_records(table, query, max_records=max_records, fields=fields, **options):
+            yield record
+        return
+    # The SQLite scan and JSON decoding run in worker threads, one batch at a time, off the event loop.
+    try:
+        while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+            for record in batch:
+                yield record
+    finally:
+        await asyncio.to_thread(_close, batches)
+
+def _close(batches) -> None:
+    try:
+        batches.close()
+    except ValueError:
+        pass  # a cancelled fetch is still running; the generator closes its connection when collected
+
+async def covers(table: str) -> bool:
+    """
+    Replica.covers() for code on the event loop: the freshness is served from
+    memory, and only its first lookup reads SQLite, in a worker thread.
+    """
+    if replica_store.enabled and table in replica_store.tables and table not in replica_store._synced_at:
+        await asyncio.to_thread(replica_store.synced_at, table)
+    return replica_store.covers(table)
+
+async def count(table: str, query: str = "", group_by: str = None) -> dict:
+    """
+    Replica.count() in a worker thread.
+    """
+    return await asyncio.to_thread(replica_store.count, table, query, group_by)
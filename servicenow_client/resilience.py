@@ -0,0 +1,239 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from config import (
+    SN_RATE_LIMIT, SN_RATE_BURST, SN_RATE_MIN,
+    SN_RETRY_MAX_ATTEMPTS, SN_RETRY_BASE_DELAY, SN_RETRY_MAX_DELAY,
+    SN_BREAKER_FAILURE_THRESHOLD, SN_BREAKER_RESET_TIMEOUT
+)
+
+# Client-side protection shared by sn_client and sn_async, one RequestGuard per
+# instance and user:
+#   - a token bucket paces requests; a 429 halves its rate (never below
+#     SN_RATE_MIN) and successes grow it back, and Retry-After /
+#     X-RateLimit-Reset pause every caller until the instance accepts traffic;
+#   - idempotent calls (and any call answered 429, which the instance did not
+#     process) are retried with full-jitter exponential backoff;
+#   - a circuit breaker opens after consecutive 5xx/transport failures and
+#     fails fast until a trial request succeeds.
+# Both clients drive the same decisions and only differ in how they sleep.
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the instance while its circuit breaker is open.
+    """
+
+def _retry_after(headers) -> float:
+    # Seconds to wait from Retry-After (seconds or HTTP date) or X-RateLimit-Reset (epoch seconds).
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get("X-RateLimit-Reset")
+    if reset and headers.get("X-RateLimit-Remaining") == "0":
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+class TokenBucket:
+    def __init__(self, rate: float = SN_RATE_LIMIT, burst: int = SN_RATE_BURST, min_rate: float = SN_RATE_MIN):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token and return how long the caller must wait before sending.
+        Tokens may go negative, so waiters queue up in arrival order.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def throttled(self) -> None:
+        # Concurrent requests rejected by the same throttle event count as one decrease.
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased_at >= 1.0:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._decreased_at = now
+
+    def succeeded(self) -> None:
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = SN_BREAKER_FAILURE_THRESHOLD, reset_timeout: float = SN_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial = 0
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> tuple:
+        """
+        Return (allowed, trial). trial is non-zero when this call was let
+        through as the half-open trial; pass it to release() once the attempt
+        ends, so a trial that never reached a verdict does not hold the
+        breaker half-open.
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state, self._trial = "half_open", 0
+            if self.state == "closed":
+                return True, 0
+            if self.state == "half_open" and not self._trial:
+                self._trials += 1
+                self._trial = self._trials  # one trial request at a time
+                return True, self._trial
+            return False, 0
+
+    def release(self, trial: int) -> None:
+        # The trial ended without success() or failure(): let the next caller try.
+        with self._lock:
+            if trial and self._trial == trial:
+                self._trial = 0
+
+    def success(self) -> None:
+        with self._lock:
+            self.state, self.failures, self._trial = "closed", 0, 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state, self._opened_at, self._trial = "open", time.monotonic(), 0
+
+class RequestGuard:
+    def __init__(self, name: str):
+        self.name = name
+        self.limiter = TokenBucket()
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ("requests", "throttled", "throttle_wait_seconds", "retries", "retries_exhausted", "rejected"), 0)
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def admit(self) -> tuple:
+        """
+        Called before every attempt. Returns (pacing delay, breaker trial),
+        or raises CircuitOpenError while the breaker is open. The caller
+        hands the trial back to release() when it is done with the request.
+        """
+        allowed, trial = self.breaker.allow()
+        if not allowed:
+            self._count("rejected")
+            raise CircuitOpenError(f"ServiceNow circuit open for {self.name}; failing fast")
+        self._count("requests")
+        wait = self.limiter.reserve()
+        if wait > 0:
+            self._count("throttle_wait_seconds", wait)
+        return wait, trial
+
+    def release(self, trial: int) -> None:
+        self.breaker.release(trial)
+
+    def _retry(self, method: str, attempt: int, retryable: bool, floor: float = 0.0) -> float:
+        if not retryable:
+            return None
+        if attempt >= SN_RETRY_MAX_ATTEMPTS:
+            self._count("retries_exhausted")
+            return None
+        self._count("retries")
+        backoff = random.uniform(0, min(SN_RETRY_MAX_DELAY, SN_RETRY_BASE_DELAY * 2 ** attempt))
+        return max(backoff, floor)
+
+    def on_response(self, method: str, attempt: int, status: int, headers) -> float:
+        """
+        Record a response; return the delay before retrying, or None to return it to the caller.
+        """
+        if status == 429:
+            self._count("throttled")
+            self.limiter.throttled()
+            wait = _retry_after(headers)
+            if wait is not None:
+                self.limiter.pause(wait)
+                self._count("throttle_wait_seconds", wait)
+            self.breaker.success()  # throttled, not degraded
+            return self._retry(method, attempt, True, wait or 0.0)
+        wait = _retry_after(headers)
+        if wait:
+            self.limiter.pause(wait)  # X-RateLimit-Remaining hit 0: hold back before the next call
+        if status >= 500:
+            self.breaker.failure()
+            return self._retry(method, attempt, method.upper() in IDEMPOTENT_METHODS and status in RETRY_STATUSES)
+        self.breaker.success()
+        self.limiter.succeeded()
+        return None
+
+    def on_error(self, method: str, attempt: int, connect_failed: bool) -> float:
+        """
+        Record a transport error. A failed connect never reached the instance,
+        so it is retried for any method; other errors only for idempotent ones.
+        """
+        self.breaker.failure()
+        return self._retry(method, attempt, connect_failed or method.upper() in IDEMPOTENT_METHODS)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["throttle_wait_seconds"] = round(counters["throttle_wait_seconds"], 3)
+        return {
+            **counters,
+            "rate": round(self.limiter.rate, 3),
+            "max_rate": self.limiter.max_rate,
+            "breaker": {"state": self.breaker.state, "failures": self.breaker.failures, "opened": self.breaker.opened},
+        }
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+def guard_for(instance_url: str, user: str) -> RequestGuard:
+    """
+    Return the shared guard for an instance and user; the sync and async clients use the same one.
+    """
+    key = (instance_url, user)
+    with _guards_lock:
+        if key not in _guards:
+            _guards[key] = RequestGuard(f"{instance_url} ({user})")
+        return _guards[key]
+
+def stats() -> dict:
+    with _guards_lock:
+        guards = list(_guards.values())
+    return {guard.name: guard.stats() for guard in guards}
@@ -0,0 +1,356 @@
+import asyncio
+import json
+import time
+import weakref
+from contextlib import asynccontextmanager, aclosing
+import httpx
+from servicenow_client import instances, telemetry, jsonstream, readbatch, coalesce
+from servicenow_client.encodedquery import ids_in
+from servicenow_client.sn_client import (
+    normalize_fields, batch_operation, _batch_payload, _batch_results, _batch_failed, _invalidate_batch,
+    _page_request, _page_size, _page_options, _projection_params, _stats_params, stats_rows, _reauthenticate,
+    flight_key, flight_label, _invalidate, _span_attributes, _traced, _observe, _query_params,
+    _cursor_request, _cursor_fields, _next_cursor, _batch_key
+)
+from servicenow_client.coalesce import AsyncSingleFlight
+from servicenow_client.cache import read_key, query_key
+from servicenow_client.resilience import guard_for, CircuitOpenError
+from config import SN_MAX_CONCURRENCY, SN_PAGE_SIZE, SN_BATCH_SIZE, SN_BATCH_CONCURRENCY, SN_STREAM_CHUNK_BYTES
+
+# Async counterpart of sn_client: same functions, same return values, but
+# every call is awaited on the running event loop instead of blocking it.
+
+_semaphores = weakref.WeakKeyDictionary()  # event loop -> {instance url: Semaphore}
+
+# Single flight for concurrent identical GETs (servicenow_client/coalesce.py)
+request_flights = AsyncSingleFlight()
+
+# Concurrent point reads of a table gathered into one sys_idIN query (servicenow_client/readbatch.py)
+read_batcher = readbatch.AsyncReadBatcher()
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the current instance's AsyncClient (connection pool, keep-alive,
+    HTTP/2 if the `h2` package is installed).
+    """
+    return instances.current().client()
+
+async def aclose() -> None:
+    """
+    Close the AsyncClients of every loaded instance and their pooled connections.
+    """
+    for instance in instances.loaded():
+        await instance.aclose()
+
+def _semaphore(instance_url: str) -> asyncio.Semaphore:
+    # One ceiling per instance so a burst of tool calls cannot exceed SN_MAX_CONCURRENCY
+    # in-flight requests against the same ServiceNow node. Semaphores are bound to
+    # the loop they are first used on, hence one set per event loop.
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if instance_url not in semaphores:
+        semaphores[instance_url] = asyncio.Semaphore(SN_MAX_CONCURRENCY)
+    return semaphores[instance_url]
+
+async def _auth_kwargs(instance: instances.Instance) -> dict:
+    if instance.auth_method == "oauth":
+        # A valid token is read without blocking; only a missing/expired one waits for the refresh, off the loop.
+        token = instance.tokens.peek(instance.oauth)
+        if token is None:
+            token = await asyncio.to_thread(instance.tokens.get_token, instance.oauth)
+        return {"headers": {"Authorization": f"Bearer {token}"}}
+    return {"auth": (instance.username, instance.password)}
+
+async def _request(method: str, path: str, **kwargs) -> dict:
+    instance = instances.current()
+    if method == "GET":
+        coalesce.reading(flight_label(path))
+        key = flight_key(instance, path, kwargs.get("params"))
+        return await request_flights.do(key, lambda: _send(instance, method, path, **kwargs), flight_label(path))
+    return await _send(instance, method, path, **kwargs)
+
+async def _read(response: httpx.Response) -> None:
+    try:
+        await response.aread()
+    except BaseException:
+        await response.aclose()
+        raise
+
+@asynccontextmanager
+async def _open(instance: instances.Instance, method: str, path: str, stream: bool = False, **kwargs):
+    """
+    Async counterpart of sn_client._open: yields the final response, raising
+    httpx.HTTPStatusError for an error status; with stream=True its body is
+    left unread. The concurrency slot is held only until the body is read,
+    or until the headers are in when streaming.
+    """
+    guard = guard_for(instance.url, instance.principal)
+    table = flight_label(path)
+    with telemetry.span(f"{method} {table}", "CLIENT", **_span_attributes(instance, method, path)) as current:
+        attempt, reauthenticated, retry, trial = 0, False, False, 0
+        try:
+            while True:
+                if not retry:  # a re-authenticated retry reuses its admission
+                    wait, trial = guard.admit()
+                    await asyncio.sleep(wait)
+                retry = False
+                auth = await _auth_kwargs(instance)
+                traced = _traced(auth, current)
+                started = time.perf_counter()
+                client = instance.client()
+                try:
+                    async with _semaphore(instance.url):
+                        request = client.build_request(method, instance.url + path, headers=traced.get("headers"), **kwargs)
+                        response = await client.send(request, auth=traced.get("auth"), stream=True)
+                        if not stream:
+                            await _read(response)
+                except httpx.TransportError as e:
+                    _observe(instance, method, table, started, "error")
+                    delay = guard.on_error(method, attempt, isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)))
+                    if delay is None:
+                        raise
+                else:
+                    retry = _reauthenticate(instance, response.status_code, auth, reauthenticated)
+                    if retry:
+                        reauthenticated = True
+                    else:
+                        delay = guard.on_response(method, attempt, response.status_code, response.headers)
+                        if delay is None:
+                            break
+                    await response.aclose()
+                    _observe(instance, method, table, started, response.status_code, response.num_bytes_downloaded)
+                    if retry:
+                        continue
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            guard.release(trial)  # no-op once the trial's response was recorded
+        current.set_attribute("http.response.status_code", response.status_code)
+        current.set_attribute("servicenow.attempts", attempt + 1)
+        try:
+            if response.status_code >= 400:
+                await _read(response)  # keep the error body readable after close
+            response.raise_for_status()
+            yield response
+        finally:
+            await response.aclose()
+            _observe(instance, method, table, started, response.status_code, response.num_bytes_downloaded)
+
+async def _send(instance: instances.Instance, method: str, path: str, **kwargs) -> dict:
+    async with _open(instance, method, path, **kwargs) as response:
+        content = response.content
+    if not content:  # DELETE answers 204 No Content
+        return {}
+    return json.loads(content)
+
+async def _astream_pages(table: str, query: str, page_size: int, mode: str, max_records: int, options: dict):
+    fetched, last_sys_id = 0, None
+    options = {name: value for name, value in options.items() if name != "use_cache"}
+    while True:
+        size = _page_size(page_size, max_records, fetched)
+        if size <= 0:
+            return
+        received = 0
+        async with aclosing(astream_records(*_page_request(table, query, size, mode, fetched, last_sys_id), **options)) as page:
+            async for record in page:
+                received += 1
+                last_sys_id = record.get("sys_id")
+                yield record
+        fetched += received
+        if received < size:
+            return
+
+async def create_record(table: str, data: dict) -> dict:
+    path = f"/api/now/table/{table}"
+    result = await _request("POST", path, json=data)
+    _invalidate(table, (result.get("result") or {}).get("sys_id"))
+    return result
+
+async def read_record(table: str, sys_id: str, fields: list = None, display_value: str = None,
+                      exclude_reference_link: bool = False, use_cache: bool = True) -> dict:
+    key = read_key(table, sys_id, normalize_fields(fields), display_value, exclude_reference_link)
+    coalesce.reading(table)  # also when served from the cache
+    cache = instances.current().cache
+    generation = cache.generation()  # before the fetch: a write during it keeps the result out of the cache
+    cached = cache.get(key) if use_cache else None
+    if cached is not None:
+        return cached
+    path = f"/api/now/table/{table}/{sys_id}"
+    params = _projection_params(fields, display_value, exclude_reference_link)
+    if read_batcher.enabled and readbatch.batchable(sys_id):
+        fields = normalize_fields(fields)
+
+        async def fetch_many(ids: list) -> list:
+            return (await query_records(table, ids_in(ids), len(ids), 0, readbatch.query_fields(fields), display_value,
+                                        exclude_reference_link, use_cache=False)).get("result", [])
+        result = await read_batcher.read(
+            _batch_key(table, fields, display_value, exclude_reference_link), sys_id,
+            lambda: _request("GET", path, params=params), fetch_many,
+            fields, lambda missing: _not_found(f"/api/now/table/{table}/{missing}", params)
+        )
+    else:
+        result = await _request("GET", path, params=params)
+    if use_cache:
+        cache.put(key, result, generation)
+    return result
+
+def _not_found(path: str, params: dict) -> httpx.HTTPStatusError:
+    # The error GET /table/{table}/{sys_id} raises for a record the batched query did not return.
+    request = httpx.Request("GET", instances.current().url + path, params=params)
+    response = httpx.Response(404, json=readbatch.NOT_FOUND_BODY, request=request)
+    return httpx.HTTPStatusError(f"Client error '404 Not Found' for url '{request.url}'", request=request, response=response)
+
+async def update_record(table: str, sys_id: str, data: dict) -> dict:
+    path = f"/api/now/table/{table}/{sys_id}"
+    try:
+        return await _request("PUT", path, json=data)
+    finally:
+        _invalidate(table, sys_id)
+
+async def delete_record(table: str, sys_id: str) -> dict:
+    path = f"/api/now/table/{table}/{sys_id}"
+    try:
+        return await _request("DELETE", path)
+    finally:
+        _invalidate(table, sys_id)
+
+async def query_records(table: str, query: str, limit: int = 100, offset: int = 0, fields: list = None,
+                        display_value: str = None, exclude_reference_link: bool = False, use_cache: bool = True) -> dict:
+    key = query_key(table, query, limit, offset, normalize_fields(fields), display_value, exclude_reference_link)
+    coalesce.reading(table)  # also when served from the cache
+    cache = instances.current().cache
+    generation = cache.generation()  # before the fetch: a write during it keeps the result out of the cache
+    cached = cache.get(key) if use_cache else None
+    if cached is not None:
+        return cached
+    path = f"/api/now/table/{table}"
+    result = await _request("GET", path, params=_query_params(query, limit, offset, fields, display_value, exclude_reference_link))
+    if use_cache:
+        cache.put(key, result, generation)
+    return result
+
+async def astream_records(table: str, query: str, limit: int = 100, offset: int = 0, fields: list = None,
+                          display_value: str = None, exclude_reference_link: bool = False):
+    """
+    Async counterpart of sn_client.stream_records: yields the records of one
+    query as the body arrives. Close it (contextlib.aclosing) when stopping early.
+    """
+    path = f"/api/now/table/{table}"
+    params = _query_params(query, limit, offset, fields, display_value, exclude_reference_link)
+    parser = jsonstream.ResultParser()
+    coalesce.reading(table)
+    async with _open(instances.current(), "GET", path, stream=True, params=params) as response:
+        async for chunk in response.aiter_bytes(SN_STREAM_CHUNK_BYTES):
+            for record in parser.feed(chunk):
+                yield record
+    for record in parser.close():
+        yield record
+
+async def query_page(table: str, query: str = "", limit: int = 100, cursor: str = None, offset: int = 0,
+                     fields: list = None, display_value: str = None, exclude_reference_link: bool = False) -> dict:
+    """
+    Async counterpart of sn_client.query_page: one keyset-ordered page and the cursor for the next.
+    """
+    query, sent, offset = _cursor_request(table, query, cursor, offset)
+    fields = _cursor_fields(query, fields, display_value)
+    rows = (await query_records(table, sent, limit, offset, fields, display_value, exclude_reference_link)).get("result", [])
+    return {"result": rows, "next_cursor": _next_cursor(table, query, rows[-1] if rows else None, len(rows), limit)}
+
+async def astream_page(table: str, query: str = "", limit: int = 100, cursor: str = None, offset: int = 0,
+                       fields: list = None, display_value: str = None, exclude_reference_link: bool = False,
+                       page: dict = None):
+    """
+    query_page() streamed like astream_records; the cursor for the next page
+    is stored in page["next_cursor"] once the records are exhausted.
+    """
+    query, sent, offset = _cursor_request(table, query, cursor, offset)
+    fields = _cursor_fields(query, fields, display_value)
+    last, count = None, 0
+    async with aclosing(astream_records(table, sent, limit, offset, fields, display_value, exclude_reference_link)) as records:
+        async for last in records:
+            count += 1
+            yield last
+    if page is not None:
+        page["next_cursor"] = _next_cursor(table, query, last, count, limit)
+
+async def aggregate_records(table: str, query: str = "", group_by: list = None, count: bool = True,
+                            avg_fields: list = None, min_fields: list = None, max_fields: list = None,
+                            sum_fields: list = None, display_value: str = None) -> dict:
+    path = f"/api/now/stats/{table}"
+    params = _stats_params(query, group_by, count, avg_fields, min_fields, max_fields, sum_fields, display_value)
+    return await _request("GET", path, params=params)
+
+async def aiter_records(table: str, query: str = "", page_size: int = SN_PAGE_SIZE, mode: str = "keyset",
+                        prefetch: bool = True, max_records: int = None, fields: list = None,
+                        display_value: str = None, exclude_reference_link: bool = False, stream: bool = False):
+    """
+    Async counterpart of sn_client.iter_records: yields every matching record,
+    paging by sys_id keyset (default) or sysparm_offset. With prefetch=True the
+    next page is already in flight while the caller consumes the current one.
+    With stream=True each page is decoded as it arrives (astream_records)
+    instead, so at most one record is buffered; prefetch is then ignored.
+    """
+    _page_request(table, query, page_size, mode, 0, None)  # reject an unknown mode up front
+    options = _page_options(mode, fields, display_value, exclude_reference_link)
+    if stream:
+        async with aclosing(_astream_pages(table, query, page_size, mode, max_records, options)) as records:
+            async for record in records:
+                yield record
+        return
+    task = None
+    fetched, last_sys_id = 0, None
+    size = _page_size(page_size, max_records, fetched)
+    try:
+        page = (await query_records(*_page_request(table, query, size, mode, fetched, last_sys_id), **options)).get("result", []) if size > 0 else []
+        while page:
+            fetched += len(page)
+            last_sys_id = page[-1].get("sys_id")
+            next_size = _page_size(page_size, max_records, fetched)
+            has_more = len(page) >= size and next_size > 0
+            if has_more and prefetch:
+                task = asyncio.create_task(query_records(*_page_request(table, query, next_size, mode, fetched, last_sys_id), **options))
+            for record in page:
+                yield record
+            if not has_more:
+                return
+            if task is not None:
+                page = (await task).get("result", [])
+                task = None
+            else:
+                page = (await query_records(*_page_request(table, query, next_size, mode, fetched, last_sys_id), **options)).get("result", [])
+            size = next_size
+    finally:
+        if task is not None:
+            task.cancel()
+
+async def batch_requests(operations: list, chunk_size: int = SN_BATCH_SIZE) -> list:
+    """
+    Async counterpart of sn_client.batch_requests: chunks are sent through
+    /api/now/v1/batch concurrently (at most SN_BATCH_CONCURRENCY at a time) and
+    per-operation results come back in input order.
+    """
+    path = "/api/now/v1/batch"
+    limit = asyncio.Semaphore(SN_BATCH_CONCURRENCY)
+
+    async def send(start: int) -> list:
+        chunk = operations[start:start + chunk_size]
+        async with limit:
+            try:
+                return _batch_results(await _request("POST", path, json=_batch_payload(chunk, start)), chunk, start)
+            except (httpx.HTTPError, CircuitOpenError) as e:
+                return _batch_failed(chunk, start, e)
+
+    chunks = await asyncio.gather(*(send(start) for start in range(0, len(operations), chunk_size)))
+    _invalidate_batch(operations)
+    return [result for chunk in chunks for result in chunk]
+
+async def bulk_create_records(table: str, records: list) -> list:
+    return await batch_requests([batch_operation("POST", table, data=record) for record in records])
+
+async def bulk_update_records(table: str, updates: list) -> list:
+    """
+    updates: [(sys_id, data), ...]
+    """
+    return await batch_requests([batch_operation("PUT", table, sys_id, data) for sys_id, data in updates])
+
+async def bulk_delete_records(table: str, sys_ids: list) -> list:
+    return await batch_requests([batch_operation("DELETE", table, sys_id) for sys_id in sys_ids])
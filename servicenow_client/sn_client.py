@@ -1,77 +1,495 @@
+import base64
+import contextvars
+import json
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import requests
+from servicenow_client import instances, coalesce, telemetry, jsonstream, cursors, readbatch
+from servicenow_client.encodedquery import Query, canonical, ids_in
+from servicenow_client.cache import read_key, query_key
+from servicenow_client.resilience import guard_for, CircuitOpenError
 from config import (
-    SN_INSTANCE_URL, SN_AUTH_METHOD,
-    SN_USERNAME, SN_PASSWORD,
-    SN_OAUTH_URL, SN_CLIENT_ID, SN_CLIENT_SECRET
+    SN_CONNECT_TIMEOUT, SN_READ_TIMEOUT, SN_PAGE_SIZE, SN_BATCH_SIZE, SN_TRACE_PROPAGATE, SN_STREAM_CHUNK_BYTES
 )
 
-# Global variables for OAuth token caching
-_token = None
-_token_expiry = 0
+def get_session() -> requests.Session:
+    """
+    Return the pooled session of the current instance (see instances.py).
+    Connections are kept alive and reused across tool calls.
+    """
+    return instances.current().session()
+
+def close_session() -> None:
+    """
+    Close the pooled sessions of every loaded instance and drop their idle connections.
+    """
+    for instance in instances.loaded():
+        instance.close_session()
+
+# Single flight for concurrent identical GETs (servicenow_client/coalesce.py)
+request_flights = coalesce.SingleFlight()
+
+# Concurrent point reads of a table gathered into one sys_idIN query (servicenow_client/readbatch.py)
+read_batcher = readbatch.ReadBatcher()
 
 def get_oauth_token() -> str:
-    global _token, _token_expiry
-    if _token and _token_expiry > time.time():
-        return _token
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": SN_CLIENT_ID,
-        "client_secret": SN_CLIENT_SECRET,
-    }
-    response = requests.post(SN_OAUTH_URL, data=data)
-    response.raise_for_status()
-    token_data = response.json()
-    _token = token_data["access_token"]
-    _token_expiry = time.time() + token_data["expires_in"] - 60  # buffer 60 seconds
-    return _token
+    instance = instances.current()
+    return instance.tokens.get_token(instance.oauth)
+
+def _auth_kwargs(instance: instances.Instance) -> dict:
+    if instance.auth_method == "oauth":
+        return {"headers": {"Authorization": f"Bearer {instance.tokens.get_token(instance.oauth)}"}}
+    return {"auth": (instance.username, instance.password)}
+
+def _reauthenticate(instance: instances.Instance, status: int, auth: dict, already: bool) -> bool:
+    # A 401 with a bearer token: drop the token and retry once with a fresh one.
+    if status != 401 or already or "headers" not in auth:
+        return False
+    instance.tokens.invalidate(instance.oauth, auth["headers"]["Authorization"].removeprefix("Bearer "))
+    return True
+
+def flight_key(instance: instances.Instance, path: str, params: dict) -> tuple:
+    # Identical GETs: same instance and user, path and query parameters.
+    return (instance.url, instance.principal, path, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+
+def flight_label(path: str) -> str:
+    parts = path.split("/")  # /api/now/{table|stats}/{table}[/{sys_id}]
+    return parts[4] if len(parts) > 4 else path
+
+def _request(method: str, path: str, **kwargs) -> dict:
+    # All table operations funnel through here so they share the current instance's
+    # pool, timeouts, auth, rate limiter, retries and circuit breaker. Identical
+    # GETs in flight at the same time share one upstream call.
+    instance = instances.current()
+    if method == "GET":
+        coalesce.reading(flight_label(path))
+        key = flight_key(instance, path, kwargs.get("params"))
+        return request_flights.do(key, lambda: _send(instance, method, path, **kwargs), flight_label(path))
+    return _send(instance, method, path, **kwargs)
+
+def _span_attributes(instance: instances.Instance, method: str, path: str) -> dict:
+    return {"http.request.method": method, "server.address": instance.url, "url.path": path,
+            "servicenow.instance": instance.name, "servicenow.table": flight_label(path)}
+
+def _traced(auth: dict, current: telemetry.Span) -> dict:
+    # Request kwargs with the W3C traceparent of the request span added to the headers.
+    if not SN_TRACE_PROPAGATE:
+        return auth
+    return {**auth, "headers": {**auth.get("headers", {}), "traceparent": current.traceparent()}}
+
+def _observe(instance: instances.Instance, method: str, table: str, started: float, status, size: int = None) -> None:
+    telemetry.HTTP_LATENCY.observe(time.perf_counter() - started, instance.name, method, table, str(status))
+    if size is not None:
+        telemetry.HTTP_RESPONSE_BYTES.observe(size, instance.name, method, table)
+
+def _received(response: requests.Response) -> int:
+    # Body bytes read from the connection so far.
+    return response.raw.tell() if hasattr(response.raw, "tell") else len(response.content)
+
+@contextmanager
+def _open(instance: instances.Instance, method: str, path: str, stream: bool = False, **kwargs):
+    """
+    Send a request through the instance's rate limiter, retries, circuit
+    breaker and 401 re-authentication and yield the final response, raising
+    requests.HTTPError for an error status. With stream=True the body is left
+    unread for the caller to iterate.
+    """
+    kwargs.setdefault("timeout", (SN_CONNECT_TIMEOUT, SN_READ_TIMEOUT))
+    guard = guard_for(instance.url, instance.principal)
+    table = flight_label(path)
+    with telemetry.span(f"{method} {table}", "CLIENT", **_span_attributes(instance, method, path)) as current:
+        attempt, reauthenticated, retry, trial = 0, False, False, 0
+        try:
+            while True:
+                if not retry:  # a re-authenticated retry reuses its admission
+                    wait, trial = guard.admit()
+                    time.sleep(wait)
+                retry = False
+                auth = _auth_kwargs(instance)
+                started = time.perf_counter()
+                try:
+                    response = instance.session().request(method, instance.url + path, stream=stream, **kwargs,
+                                                          **_traced(auth, current))
+                except requests.RequestException as e:
+                    _observe(instance, method, table, started, "error")
+                    delay = guard.on_error(method, attempt, isinstance(e, requests.ConnectTimeout))
+                    if delay is None:
+                        raise
+                else:
+                    retry = _reauthenticate(instance, response.status_code, auth, reauthenticated)
+                    if retry:
+                        reauthenticated = True
+                    else:
+                        delay = guard.on_response(method, attempt, response.status_code, response.headers)
+                        if delay is None:
+                            break
+                    response.close()
+                    _observe(instance, method, table, started, response.status_code, _received(response))
+                    if retry:
+                        continue
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            guard.release(trial)  # no-op once the trial's response was recorded
+        current.set_attribute("http.response.status_code", response.status_code)
+        current.set_attribute("servicenow.attempts", attempt + 1)
+        try:
+            if response.status_code >= 400:
+                response.content  # keep the error body readable after close
+            response.raise_for_status()
+            yield response
+        finally:
+            response.close()
+            _observe(instance, method, table, started, response.status_code, _received(response))
+
+def _send(instance: instances.Instance, method: str, path: str, **kwargs) -> dict:
+    with _open(instance, method, path, **kwargs) as response:
+        content = response.content
+    if not content:  # DELETE answers 204 No Content
+        return {}
+    return json.loads(content)
+
+def normalize_fields(fields) -> list:
+    """
+    Accept a list of field names or a comma-separated string; return a
+    de-duplicated list in the given order (None when no projection is wanted).
+    """
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return list(dict.fromkeys(field.strip() for field in fields if field.strip())) or None
+
+def _projection_params(fields: list = None, display_value: str = None, exclude_reference_link: bool = False) -> dict:
+    # sysparm_fields trims columns, sysparm_exclude_reference_link drops the {link, value}
+    # wrapper on reference fields, sysparm_display_value picks raw/display/both values.
+    params = {}
+    fields = normalize_fields(fields)
+    if fields:
+        params["sysparm_fields"] = ",".join(fields)
+    if display_value is not None:
+        params["sysparm_display_value"] = str(display_value).lower()
+    if exclude_reference_link:
+        params["sysparm_exclude_reference_link"] = "true"
+    return params
+
+def _invalidate(table: str, sys_id: str = None) -> None:
+    # After a write: drop cached reads and detach in-flight GETs of the table.
+    instances.current().cache.invalidate(table, sys_id)
+    coalesce.forget(table)
 
 def create_record(table: str, data: dict) -> dict:
-    url = f"{SN_INSTANCE_URL}/api/now/table/{table}"
-    if SN_AUTH_METHOD == "oauth":
-        headers = {"Authorization": f"Bearer {get_oauth_token()}"}
-        response = requests.post(url, headers=headers, json=data)
-    else:
-        response = requests.post(url, auth=(SN_USERNAME, SN_PASSWORD), json=data)
-    response.raise_for_status()
-    return response.json()
-
-def read_record(table: str, sys_id: str) -> dict:
-    url = f"{SN_INSTANCE_URL}/api/now/table/{table}/{sys_id}"
-    if SN_AUTH_METHOD == "oauth":
-        headers = {"Authorization": f"Bearer {get_oauth_token()}"}
-        response = requests.get(url, headers=headers)
+    path = f"/api/now/table/{table}"
+    result = _request("POST", path, json=data)
+    _invalidate(table, (result.get("result") or {}).get("sys_id"))
+    return result
+
+def read_record(table: str, sys_id: str, fields: list = None, display_value: str = None,
+                exclude_reference_link: bool = False, use_cache: bool = True) -> dict:
+    key = read_key(table, sys_id, normalize_fields(fields), display_value, exclude_reference_link)
+    coalesce.reading(table)  # also when served from the cache
+    cache = instances.current().cache
+    generation = cache.generation()  # before the fetch: a write during it keeps the result out of the cache
+    cached = cache.get(key) if use_cache else None
+    if cached is not None:
+        return cached
+    path = f"/api/now/table/{table}/{sys_id}"
+    params = _projection_params(fields, display_value, exclude_reference_link)
+    if read_batcher.enabled and readbatch.batchable(sys_id):
+        fields = normalize_fields(fields)
+        result = read_batcher.read(
+            _batch_key(table, fields, display_value, exclude_reference_link), sys_id,
+            lambda: _request("GET", path, params=params),
+            lambda ids: query_records(table, ids_in(ids), len(ids), 0, readbatch.query_fields(fields), display_value,
+                                      exclude_reference_link, use_cache=False).get("result", []),
+            fields, lambda missing: _not_found(f"/api/now/table/{table}/{missing}", params)
+        )
     else:
-        response = requests.get(url, auth=(SN_USERNAME, SN_PASSWORD))
-    response.raise_for_status()
-    return response.json()
+        result = _request("GET", path, params=params)
+    if use_cache:
+        cache.put(key, result, generation)
+    return result
+
+def _batch_key(table: str, fields: list, display_value: str, exclude_reference_link: bool) -> tuple:
+    # Reads share a batch when they would share the query: same instance, table and projection.
+    return (instances.current().name, table, tuple(fields or ()), display_value, exclude_reference_link)
+
+def _not_found(path: str, params: dict) -> requests.HTTPError:
+    # The error GET /table/{table}/{sys_id} raises for a record the batched query did not return.
+    response = requests.Response()
+    response.status_code, response.reason = 404, "Not Found"
+    response.url = requests.Request("GET", instances.current().url + path, params=params).prepare().url
+    response._content = json.dumps(readbatch.NOT_FOUND_BODY).encode()
+    return requests.HTTPError(f"404 Client Error: Not Found for url: {response.url}", response=response)
 
 def update_record(table: str, sys_id: str, data: dict) -> dict:
-    url = f"{SN_INSTANCE_URL}/api/now/table/{table}/{sys_id}"
-    if SN_AUTH_METHOD == "oauth":
-        headers = {"Authorization": f"Bearer {get_oauth_token()}"}
-        response = requests.put(url, headers=headers, json=data)
-    else:
-        response = requests.put(url, auth=(SN_USERNAME, SN_PASSWORD), json=data)
-    response.raise_for_status()
-    return response.json()
+    path = f"/api/now/table/{table}/{sys_id}"
+    try:
+        return _request("PUT", path, json=data)
+    finally:
+        _invalidate(table, sys_id)
 
 def delete_record(table: str, sys_id: str) -> dict:
-    url = f"{SN_INSTANCE_URL}/api/now/table/{table}/{sys_id}"
-    if SN_AUTH_METHOD == "oauth":
-        headers = {"Authorization": f"Bearer {get_oauth_token()}"}
-        response = requests.delete(url, headers=headers)
-    else:
-        response = requests.delete(url, auth=(SN_USERNAME, SN_PASSWORD))
-    response.raise_for_status()
-    return response.json()
-
-def query_records(table: str, query: str, limit: int = 100, offset: int = 0) -> dict:
-    url = f"{SN_INSTANCE_URL}/api/now/table/{table}?sysparm_query={query}&sysparm_limit={limit}&sysparm_offset={offset}"
-    if SN_AUTH_METHOD == "oauth":
-        headers = {"Authorization": f"Bearer {get_oauth_token()}"}
-        response = requests.get(url, headers=headers)
-    else:
-        response = requests.get(url, auth=(SN_USERNAME, SN_PASSWORD))
-    response.raise_for_status()
-    return response.json()
+    path = f"/api/now/table/{table}/{sys_id}"
+    try:
+        return _request("DELETE", path)
+    finally:
+        _invalidate(table, sys_id)
+
+def query_records(table: str, query: str, limit: int = 100, offset: int = 0, fields: list = None,
+                  display_value: str = None, exclude_reference_link: bool = False, use_cache: bool = True) -> dict:
+    key = query_key(table, query, limit, offset, normalize_fields(fields), display_value, exclude_reference_link)
+    coalesce.reading(table)  # also when served from the cache
+    cache = instances.current().cache
+    generation = cache.generation()  # before the fetch: a write during it keeps the result out of the cache
+    cached = cache.get(key) if use_cache else None
+    if cached is not None:
+        return cached
+    path = f"/api/now/table/{table}"
+    result = _request("GET", path, params=_query_params(query, limit, offset, fields, display_value, exclude_reference_link))
+    if use_cache:
+        cache.put(key, result, generation)
+    return result
+
+def _query_params(query: str, limit: int, offset: int, fields: list, display_value: str,
+                  exclude_reference_link: bool) -> dict:
+    params = {"sysparm_query": canonical(query), "sysparm_offset": offset}
+    if limit is not None:
+        params["sysparm_limit"] = limit
+    params.update(_projection_params(fields, display_value, exclude_reference_link))
+    return params
+
+def stream_records(table: str, query: str, limit: int = 100, offset: int = 0, fields: list = None,
+                   display_value: str = None, exclude_reference_link: bool = False):
+    """
+    query_records() as a generator: records are yielded while the response
+    body is still arriving, decoded incrementally (jsonstream.py), so neither
+    the body nor the whole result list is held in memory. limit=None leaves
+    the page size to the instance. Streams bypass the cache and coalescing.
+    """
+    path = f"/api/now/table/{table}"
+    params = _query_params(query, limit, offset, fields, display_value, exclude_reference_link)
+    parser = jsonstream.ResultParser()
+    coalesce.reading(table)
+    with _open(instances.current(), "GET", path, stream=True, params=params) as response:
+        for chunk in response.iter_content(SN_STREAM_CHUNK_BYTES):
+            yield from parser.feed(chunk)
+    yield from parser.close()
+
+def _cursor_request(table: str, query: str, cursor: str, offset: int) -> tuple:
+    # (original query, query to send, offset) for a query_page() call.
+    if not cursor:
+        return query or "", cursors.ordered(query), offset
+    position = cursors.decode(cursor, instances.current().name, table)
+    return position.query, cursors.page_query(position), 0
+
+def _cursor_fields(query: str, fields: list, display_value: str) -> list:
+    if str(display_value).lower() == "true" and len(cursors.sort_keys(query)) > 1:
+        raise ValueError("Cursor paging sorts on raw values: use display_value 'all' or 'false' with ORDERBY fields")
+    return cursors.fields_for(query, normalize_fields(fields))
+
+def _next_cursor(table: str, query: str, last: dict, count: int, limit: int):
+    # Cursor for the page after a full one; None once a short page ends the result set.
+    if last is None or (limit is not None and count < limit):
+        return None
+    return cursors.after(instances.current().name, table, query, last)
+
+def query_page(table: str, query: str = "", limit: int = 100, cursor: str = None, offset: int = 0,
+               fields: list = None, display_value: str = None, exclude_reference_link: bool = False) -> dict:
+    """
+    One page of a query in keyset order (the query's ORDERBY fields, then
+    sys_id): {"result": [...], "next_cursor": token or None}. Pass next_cursor
+    back as `cursor` for the following page; the query and order then come
+    from the cursor, and the page is read after the previous page's last row
+    instead of skipping `offset` rows, so every page costs the same.
+    """
+    query, sent, offset = _cursor_request(table, query, cursor, offset)
+    fields = _cursor_fields(query, fields, display_value)
+    rows = query_records(table, sent, limit, offset, fields, display_value, exclude_reference_link).get("result", [])
+    return {"result": rows, "next_cursor": _next_cursor(table, query, rows[-1] if rows else None, len(rows), limit)}
+
+def _stats_params(query: str, group_by: list = None, count: bool = True, avg_fields: list = None,
+                  min_fields: list = None, max_fields: list = None, sum_fields: list = None,
+                  display_value: str = None) -> dict:
+    params = {"sysparm_query": canonical(query), "sysparm_count": str(bool(count)).lower()}
+    for name, value in (("group_by", group_by), ("avg_fields", avg_fields), ("min_fields", min_fields),
+                        ("max_fields", max_fields), ("sum_fields", sum_fields)):
+        value = normalize_fields(value)
+        if value:
+            params[f"sysparm_{name}"] = ",".join(value)
+    if display_value is not None:
+        params["sysparm_display_value"] = str(display_value).lower()
+    return params
+
+def stats_rows(response: dict) -> list:
+    """
+    Flatten an Aggregate API response into [{"group": {field: value}, "count": n, "stats": {...}}].
+    A request without group_by yields a single row with an empty group.
+    """
+    result = response.get("result", [])
+    rows = []
+    for entry in result if isinstance(result, list) else [result]:
+        stats = dict(entry.get("stats", {}))
+        group = {item.get("field"): item.get("value", "") for item in entry.get("groupby_fields", [])}
+        rows.append({"group": group, "count": int(stats.pop("count", 0) or 0), "stats": stats})
+    return rows
+
+def aggregate_records(table: str, query: str = "", group_by: list = None, count: bool = True,
+                      avg_fields: list = None, min_fields: list = None, max_fields: list = None,
+                      sum_fields: list = None, display_value: str = None) -> dict:
+    """
+    Compute counts and avg/min/max/sum on the instance with the Aggregate API
+    (/api/now/stats/{table}), optionally grouped by one or more fields.
+    """
+    path = f"/api/now/stats/{table}"
+    params = _stats_params(query, group_by, count, avg_fields, min_fields, max_fields, sum_fields, display_value)
+    return _request("GET", path, params=params)
+
+def _keyset_query(query: str, last_sys_id: str = None) -> str:
+    # Pages continue after the last sys_id, so they must be in sys_id order only: a caller's
+    # ORDERBY ahead of it would make "sys_id > last" skip rows that sort earlier by sys_id.
+    after = Query().where("sys_id", ">", last_sys_id) if last_sys_id else Query()
+    return Query.parse(query).unordered().and_(after).order_by("sys_id").encode()
+
+def _page_request(table: str, query: str, size: int, mode: str, offset: int, last_sys_id: str) -> tuple:
+    # Arguments for query_records() that fetch the page after `offset` rows / `last_sys_id`.
+    if mode == "keyset":
+        return table, _keyset_query(query, last_sys_id), size, 0
+    if mode == "offset":
+        return table, query, size, offset
+    raise ValueError(f"Unknown paging mode: {mode}")
+
+def _page_size(page_size: int, max_records: int, fetched: int) -> int:
+    return page_size if max_records is None else min(page_size, max_records - fetched)
+
+def _page_options(mode: str, fields: list, display_value: str, exclude_reference_link: bool) -> dict:
+    # Keyword arguments for every page request. Pages of a full scan are read once,
+    # so they bypass the record cache instead of evicting useful entries.
+    fields = normalize_fields(fields)
+    if fields and mode == "keyset" and "sys_id" not in fields:
+        fields.append("sys_id")  # keyset paging continues from the last sys_id
+    return {"fields": fields, "display_value": display_value,
+            "exclude_reference_link": exclude_reference_link, "use_cache": False}
+
+def iter_records(table: str, query: str = "", page_size: int = SN_PAGE_SIZE, mode: str = "keyset",
+                 prefetch: bool = False, max_records: int = None, fields: list = None,
+                 display_value: str = None, exclude_reference_link: bool = False):
+    """
+    Yield every record matching the query, one page at a time.
+
+    mode="offset" pages with sysparm_offset; mode="keyset" orders by sys_id
+    (the query's ORDERBY clauses are dropped) and continues from the last
+    sys_id seen, which stays fast at any depth and does not skip or repeat
+    rows when the table changes mid-scan. With prefetch=True
+    the next page is requested in a worker thread while the caller consumes the
+    current one. At most two pages are held in memory. fields/display_value/
+    exclude_reference_link are passed through to query_records(); pages are
+    not cached.
+    """
+    _page_request(table, query, page_size, mode, 0, None)  # reject an unknown mode up front
+    options = _page_options(mode, fields, display_value, exclude_reference_link)
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    future = None
+    fetched, last_sys_id = 0, None
+    size = _page_size(page_size, max_records, fetched)
+    try:
+        page = query_records(*_page_request(table, query, size, mode, fetched, last_sys_id), **options).get("result", []) if size > 0 else []
+        while page:
+            fetched += len(page)
+            last_sys_id = page[-1].get("sys_id")
+            next_size = _page_size(page_size, max_records, fetched)
+            has_more = len(page) >= size and next_size > 0
+            if has_more and executor:
+                # The worker thread does not inherit the caller's context, so hand it the current instance.
+                future = executor.submit(contextvars.copy_context().run, query_records, *_page_request(table, query, next_size, mode, fetched, last_sys_id), **options)
+            yield from page
+            if not has_more:
+                return
+            if future is not None:
+                page = future.result().get("result", [])
+                future = None
+            else:
+                page = query_records(*_page_request(table, query, next_size, mode, fetched, last_sys_id), **options).get("result", [])
+            size = next_size
+    finally:
+        if future is not None:
+            future.cancel()
+        if executor:
+            executor.shutdown(wait=False)
+
+def batch_operation(method: str, table: str, sys_id: str = None, data: dict = None) -> dict:
+    """
+    Describe one Table API call for batch_requests(), e.g.
+    batch_operation("PATCH", "incident", sys_id, {"state": "2"}).
+    """
+    path = f"/api/now/table/{table}" + (f"/{sys_id}" if sys_id else "")
+    return {"method": method.upper(), "url": path, "body": data}
+
+def _batch_payload(operations: list, start: int) -> dict:
+    # Batch API bodies are base64-encoded JSON; request ids are the operation indexes.
+    headers = [{"name": "Content-Type", "value": "application/json"}, {"name": "Accept", "value": "application/json"}]
+    rest_requests = []
+    for index, operation in enumerate(operations, start):
+        request = {"id": str(index), "method": operation["method"], "url": operation["url"], "headers": headers}
+        if operation.get("body") is not None:
+            request["body"] = base64.b64encode(json.dumps(operation["body"]).encode()).decode()
+        rest_requests.append(request)
+    return {"batch_request_id": str(uuid.uuid4()), "rest_requests": rest_requests}
+
+def _batch_results(response: dict, operations: list, start: int) -> list:
+    results = {index: {"index": index, "ok": False, "status_code": None, "error": "not serviced"}
+               for index in range(start, start + len(operations))}
+    for serviced in response.get("serviced_requests", []):
+        index = int(serviced["id"])
+        status_code = serviced.get("status_code")
+        body = json.loads(base64.b64decode(serviced["body"])) if serviced.get("body") else {}
+        ok = status_code is not None and 200 <= status_code < 300
+        results[index] = {"index": index, "ok": ok, "status_code": status_code}
+        if ok:
+            results[index]["result"] = body.get("result", body)
+        else:
+            results[index]["error"] = (body.get("error") or {}).get("message") or serviced.get("status_text")
+    return [results[index] for index in sorted(results)]
+
+def _invalidate_batch(operations: list) -> None:
+    for operation in operations:
+        if operation["method"] != "GET":
+            parts = operation["url"].split("/")  # /api/now/table/{table}[/{sys_id}]
+            _invalidate(parts[4], parts[5] if len(parts) > 5 else None)
+
+def _batch_failed(operations: list, start: int, error: Exception) -> list:
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return [{"index": index, "ok": False, "status_code": status_code, "error": str(error)}
+            for index in range(start, start + len(operations))]
+
+def batch_requests(operations: list, chunk_size: int = SN_BATCH_SIZE) -> list:
+    """
+    Send many Table API operations through /api/now/v1/batch, chunk_size per
+    request. Returns one {"index", "ok", "status_code", "result"|"error"} per
+    operation, in input order; a failed chunk marks its operations as failed
+    instead of raising.
+    """
+    path = "/api/now/v1/batch"
+    results = []
+    for start in range(0, len(operations), chunk_size):
+        chunk = operations[start:start + chunk_size]
+        try:
+            results.extend(_batch_results(_request("POST", path, json=_batch_payload(chunk, start)), chunk, start))
+        except (requests.RequestException, CircuitOpenError) as e:
+            results.extend(_batch_failed(chunk, start, e))
+    _invalidate_batch(operations)
+    return results
+
+def bulk_create_records(table: str, records: list) -> list:
+    return batch_requests([batch_operation("POST", table, data=record) for record in records])
+
+def bulk_update_records(table: str, updates: list) -> list:
+    """
+    updates: [(sys_id, data), ...]
+    """
+    return batch_requests([batch_operation("PUT", table, sys_id, data) for sys_id, data in updates])
+
+def bulk_delete_records(table: str, sys_ids: list) -> list:
+    return batch_requests([batch_operation("DELETE", table, sys_id) for sys_id in sys_ids])
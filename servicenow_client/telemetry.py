@@ -0,0 +1,185 @@
+import bisect
+import contextvars
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from config import SN_METRICS_LATENCY_BUCKETS, SN_METRICS_SIZE_BUCKETS, SN_METRICS_BATCH_BUCKETS, SN_TRACE_BUFFER
+
+try:  # optional: with an OpenTelemetry SDK configured, spans are also exported through it
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# In-process metrics and tracing. Histograms use fixed buckets (Prometheus
+# semantics: a value is counted in the first bucket whose upper bound is >= it)
+# and are rendered by server/metrics.py. Spans follow the OpenTelemetry data
+# model (trace/span ids, parent, kind, attributes, status) and nest through a
+# context variable, so a tool call's span is the parent of the HTTP spans of
+# the ServiceNow requests it makes, across asyncio tasks and to_thread(). The
+# last SN_TRACE_BUFFER finished spans are kept for server_stats. When the
+# opentelemetry API is installed the same spans are opened on its tracer, and
+# the trace ids come from it whenever an SDK is configured.
+
+class Histogram:
+    def __init__(self, name: str, description: str, labels: tuple, buckets: list = SN_METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts (+Inf last), sum, count, max]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0, value]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            series[3] = max(series[3], value)
+
+    def series(self) -> list:
+        """
+        [(labels dict, bucket counts, sum, count, max)] with non-cumulative bucket counts.
+        """
+        with self._lock:
+            items = [(values, list(counts), total, count, peak) for values, (counts, total, count, peak) in self._series.items()]
+        return [(dict(zip(self.labels, values)), counts, total, count, peak) for values, counts, total, count, peak in items]
+
+    def quantile(self, counts: list, q: float, peak: float) -> float:
+        # Linear interpolation inside the bucket holding the q-th observation.
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else peak
+                return min(peak, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return 0.0
+
+    def summary(self) -> dict:
+        """
+        {"label=value,...": {count, sum, mean, p50, p90, p99, max}} per series.
+        """
+        result = {}
+        for labels, counts, total, count, peak in self.series():
+            key = ",".join(f"{name}={value}" for name, value in labels.items())
+            result[key] = {
+                "count": count,
+                "sum": round(total, 6),
+                "mean": round(total / count, 6) if count else 0.0,
+                **{f"p{int(q * 100)}": round(self.quantile(counts, q, peak), 6) for q in (0.5, 0.9, 0.99)},
+                "max": round(peak, 6),
+            }
+        return result
+
+# Tool calls (server/registry.py) and ServiceNow requests (sn_client, sn_async)
+TOOL_LATENCY = Histogram("mcp_tool_duration_seconds", "MCP tool call latency", ("tool", "status"))
+TOOL_RESULT_BYTES = Histogram("mcp_tool_result_bytes", "Serialized MCP tool result size", ("tool",), SN_METRICS_SIZE_BUCKETS)
+HTTP_LATENCY = Histogram("servicenow_request_duration_seconds", "ServiceNow HTTP request latency per attempt",
+                         ("instance", "method", "table", "status"))
+HTTP_RESPONSE_BYTES = Histogram("servicenow_response_bytes", "ServiceNow HTTP response body size",
+                                ("instance", "method", "table"), SN_METRICS_SIZE_BUCKETS)
+READ_BATCH_SIZE = Histogram("servicenow_read_batch_size", "Point reads served per batched read (servicenow_client/readbatch.py)",
+                            ("instance", "table"), SN_METRICS_BATCH_BUCKETS)
+HISTOGRAMS = [TOOL_LATENCY, TOOL_RESULT_BYTES, HTTP_LATENCY, HTTP_RESPONSE_BYTES, READ_BATCH_SIZE]
+
+_current_span = contextvars.ContextVar("sn_span", default=None)
+_finished = deque(maxlen=SN_TRACE_BUFFER)
+_tracer = otel_trace.get_tracer("servicenow-mcp-server") if otel_trace is not None else None
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "kind", "start_time", "end_time",
+                 "attributes", "status", "_otel")
+
+    def __init__(self, name: str, kind: str, parent, attributes: dict, otel_span=None):
+        context = otel_span.get_span_context() if otel_span is not None else None
+        if context is not None and context.is_valid:
+            self.trace_id, self.span_id = f"{context.trace_id:032x}", f"{context.span_id:016x}"
+        else:
+            self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+            self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.attributes = dict(attributes)
+        self.status = "UNSET"
+        self._otel = otel_span
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+        if self._otel is not None:
+            self._otel.set_attribute(key, value)
+
+    def traceparent(self) -> str:
+        """
+        W3C Trace Context header value for requests made inside this span.
+        """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_time,
+            "end_time_unix_nano": self.end_time,
+            "duration_ms": round((self.end_time - self.start_time) / 1e6, 3) if self.end_time else None,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+@contextmanager
+def span(name: str, kind: str = "INTERNAL", **attributes):
+    """
+    Open a span as a child of the current one; kind is INTERNAL, SERVER or
+    CLIENT. An exception marks it ERROR and is re-raised.
+    """
+    attributes = {key: value for key, value in attributes.items() if value is not None}
+    parent = _current_span.get()
+    otel_context = None
+    if _tracer is not None:
+        otel_context = _tracer.start_as_current_span(name, kind=getattr(otel_trace.SpanKind, kind), attributes=attributes,
+                                                     record_exception=False, set_status_on_exception=False)
+    current = Span(name, kind, parent, attributes, otel_context.__enter__() if otel_context is not None else None)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+        if current.status == "UNSET":
+            current.status = "OK"
+    except BaseException as e:
+        error = e
+        current.status = "ERROR"
+        current.set_attribute("error.type", type(e).__name__)
+        raise
+    finally:
+        current.end_time = time.time_ns()
+        try:
+            _current_span.reset(token)
+        except ValueError:  # a streaming generator finalized from another context
+            pass
+        _finished.append(current)
+        if otel_context is not None:
+            if current.status == "ERROR":
+                current._otel.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(error)))
+            otel_context.__exit__(None, None, None)
+
+def current_span() -> Span:
+    return _current_span.get()
+
+def recent_spans(limit: int = 50, trace_id: str = None) -> list:
+    """
+    The most recently finished spans, newest first, optionally of one trace.
+    """
+    spans = [s for s in reversed(_finished) if trace_id is None or s.trace_id == trace_id]
+    return [s.as_dict() for s in spans[:limit]]
@@ -0,0 +1,40 @@
+# tests/conftest.py
+import asyncio
+import pytest
+from benchmarks import emulator as em
+from servicenow_client import instances, sn_async
+
+# Tests run against the local ServiceNow emulator (benchmarks/emulator.py).
+# Each test gets its own emulator on a fresh port, registered as the default
+# instance, so rate limiters, breakers and caches keyed by instance URL start
+# clean.
+
+@pytest.fixture
+def store():
+    store = em.Store()
+    em.seed(store, incidents=250, cis=120, relationships_per_ci=1, changes=20, groups=5, days=30)
+    return store
+
+@pytest.fixture
+def emulator(store):
+    server = em.Emulator(store)
+    url = server.start()
+    instance = instances.register("default", url, username="test", password="test")
+    instance.cache.enabled = False
+    yield server
+    instance.close_session()
+    server.stop()
+
+@pytest.fixture
+def run():
+    """
+    Run a coroutine on a fresh event loop, closing the instance's async client on that loop.
+    """
+    def run(coroutine):
+        async def wrapped():
+            try:
+                return await coroutine
+            finally:
+                await sn_async.aclose()
+        return asyncio.run(wrapped())
+    return run
@@ -0,0 +1,95 @@
+# tests/test_cache.py
+import time
+import pytest
+import requests
+from servicenow_client import instances, sn_async, sn_client
+
+@pytest.fixture
+def cache(emulator):
+    cache = instances.current().cache
+    cache.enabled = True
+    return cache
+
+def _requests(emulator, fn, *args, **kwargs) -> tuple:
+    before = emulator.stats()["requests"]
+    result = fn(*args, **kwargs)
+    return result, emulator.stats()["requests"] - before
+
+def test_reads_and_queries_are_served_from_the_cache(emulator, store, cache):
+    sys_id = store.select("incident", "", limit=1)[0]["sys_id"]
+    assert _requests(emulator, sn_client.read_record, "incident", sys_id)[1] == 1
+    record, sent = _requests(emulator, sn_client.read_record, "incident", sys_id)
+    assert sent == 0 and record["result"]["sys_id"] == sys_id
+    record["result"]["state"] = "edited"  # callers get copies
+    assert sn_client.read_record("incident", sys_id)["result"]["state"] != "edited"
+    assert _requests(emulator, sn_client.query_records, "incident", "priority=1", 5)[1] == 1
+    assert _requests(emulator, sn_client.query_records, "incident", "priority=1", 5)[1] == 0
+
+def test_update_drops_the_record_and_the_table_queries_only(emulator, store, cache):
+    first, other = (row["sys_id"] for row in store.select("incident", "", limit=2))
+    sn_client.read_record("incident", first)
+    sn_client.read_record("incident", other)
+    sn_client.query_records("incident", "priority=1", 5)
+    sn_client.query_records("change_request", "", 5)
+    sn_client.update_record("incident", first, {"short_description": "updated"})
+    record, sent = _requests(emulator, sn_client.read_record, "incident", first)
+    assert sent == 1 and record["result"]["short_description"] == "updated"
+    assert _requests(emulator, sn_client.read_record, "incident", other)[1] == 0
+    assert _requests(emulator, sn_client.query_records, "incident", "priority=1", 5)[1] == 1
+    assert _requests(emulator, sn_client.query_records, "change_request", "", 5)[1] == 0
+
+def test_async_and_batch_writes_invalidate_the_shared_cache(emulator, store, cache, run):
+    first, second = (row["sys_id"] for row in store.select("incident", "", limit=2))
+    sn_client.read_record("incident", first)
+    run(sn_async.update_record("incident", first, {"short_description": "async"}))
+    assert sn_client.read_record("incident", first)["result"]["short_description"] == "async"
+
+    sn_client.read_record("incident", second)
+    sn_client.query_records("incident", "active=true", 5)
+    sn_client.bulk_update_records("incident", [(second, {"short_description": "batched"})])
+    assert sn_client.read_record("incident", second)["result"]["short_description"] == "batched"
+    created = sn_client.create_record("incident", {"short_description": "new", "active": "true"})["result"]
+    assert _requests(emulator, sn_client.query_records, "incident", "active=true", 5)[1] == 1
+    sn_client.read_record("incident", created["sys_id"])
+    sn_client.delete_record("incident", created["sys_id"])
+    with pytest.raises(requests.HTTPError):
+        sn_client.read_record("incident", created["sys_id"])
+
+def test_entries_expire_after_the_ttl(emulator, store, cache, monkeypatch):
+    monkeypatch.setattr(cache, "ttl", 0.05)
+    sys_id = store.select("incident", "", limit=1)[0]["sys_id"]
+    sn_client.read_record("incident", sys_id)
+    time.sleep(0.1)
+    assert _requests(emulator, sn_client.read_record, "incident", sys_id)[1] == 1
+    assert cache.stats()["expirations"] >= 1
+
+def test_read_that_races_a_write_is_not_cached(emulator, store, cache, monkeypatch, run):
+    sys_id = store.select("incident", "", limit=1)[0]["sys_id"]
+    request = sn_client._request
+
+    def racing(method, path, **kwargs):
+        result = request(method, path, **kwargs)  # the old record is on its way back...
+        if method == "GET":
+            sn_client.update_record("incident", sys_id, {"short_description": "raced"})  # ...when it is updated
+        return result
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sn_client, "_request", racing)
+        assert sn_client.read_record("incident", sys_id)["result"]["short_description"] != "raced"
+    record, sent = _requests(emulator, sn_client.read_record, "incident", sys_id)
+    assert sent == 1 and record["result"]["short_description"] == "raced"
+    assert cache.stats()["stale"] == 1
+
+    async_request = sn_async._request
+
+    async def racing_query(method, path, **kwargs):
+        result = await async_request(method, path, **kwargs)
+        if method == "GET":
+            await sn_async.update_record("incident", sys_id, {"short_description": "raced again"})
+        return result
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sn_async, "_request", racing_query)
+        run(sn_async.query_records("incident", f"sys_id={sys_id}", 1))
+    rows, sent = _requests(emulator, sn_client.query_records, "incident", f"sys_id={sys_id}", 1)
+    assert sent == 1 and rows["result"][0]["short_description"] == "raced again"
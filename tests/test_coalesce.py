@@ -0,0 +1,114 @@
+# tests/test_coalesce.py
+import asyncio
+import threading
+import pytest
+from server import registry
+from servicenow_client import coalesce, sn_async, sn_client
+from servicenow_client.coalesce import AsyncSingleFlight
+
+@pytest.fixture
+def tools():
+    added = []
+
+    def add(name, handler, coalesce=False):
+        registry.register(name, "test tool", {"type": "object"}, handler, replace=True, coalesce=coalesce)
+        added.append(name)
+    yield add
+    for name in set(added):
+        registry.unregister(name)
+
+def test_identical_gets_share_one_request(emulator, run):
+    async def scenario():
+        return await asyncio.gather(*(sn_async.query_records("incident", "priority=1", 5) for _ in range(8)))
+
+    before = emulator.stats()["requests"]
+    results = run(scenario())
+    assert emulator.stats()["requests"] - before == 1
+    assert all(result == results[0] for result in results)
+    assert results[0] is not results[1]  # each caller gets its own copy
+
+def _reader(started: asyncio.Event, release: asyncio.Event, runs: list):
+    async def handler(arguments):
+        runs.append(arguments)
+        await sn_async.query_records("incident", "active=true", 1)
+        started.set()
+        await release.wait()
+        return len(runs)
+    return handler
+
+def test_write_detaches_only_tool_flights_that_read_the_table(emulator, store, run, tools):
+    async def scenario(table):
+        started, release, runs = asyncio.Event(), asyncio.Event(), []
+        tools("test_read_incidents", _reader(started, release, runs), coalesce=True)
+        tools("test_noop_write", lambda arguments: {"written": True})
+        first = asyncio.ensure_future(registry.dispatch("test_read_incidents", {}))
+        await started.wait()
+        await registry.dispatch("test_noop_write", {})  # a tool that does not write to the table
+        sys_id = store.select(table, "", limit=1)[0]["sys_id"]
+        await sn_async.update_record(table, sys_id, {"short_description": "changed"})
+        second = asyncio.ensure_future(registry.dispatch("test_read_incidents", {}))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await first, await second, len(runs)
+
+    # A change_request write leaves the incident reader joinable; an incident write detaches it.
+    assert run(scenario("change_request")) == ({"result": 1}, {"result": 1}, 1)
+    assert run(scenario("incident"))[2] == 2
+
+def test_forget_from_worker_thread_while_loop_adds_flights(emulator, run):
+    flights = AsyncSingleFlight()
+    stop = threading.Event()
+
+    def forget_loop():
+        while not stop.is_set():
+            flights.forget("incident")
+
+    async def scenario():
+        thread = threading.Thread(target=forget_loop)
+        thread.start()
+        try:
+            for round in range(200):
+                await asyncio.gather(*(flights.do(("key", n % 5), lambda: asyncio.sleep(0, "ok"), "incident")
+                                       for n in range(20)))
+        finally:
+            stop.set()
+            thread.join()
+        return flights.stats()
+
+    stats = run(scenario())
+    assert stats["calls"] == 4000
+    assert stats["in_flight"] == 0
+
+def test_sync_write_in_worker_thread_detaches_async_gets(emulator, store, run):
+    sys_id = store.select("incident", "", limit=1)[0]["sys_id"]
+
+    async def scenario():
+        first = asyncio.ensure_future(sn_async.query_records("incident", f"sys_id={sys_id}", 1, use_cache=False))
+        await asyncio.sleep(0)
+        assert sn_async.request_flights.stats()["in_flight"] == 1
+        await asyncio.to_thread(sn_client.update_record, "incident", sys_id, {"short_description": "after"})
+        assert sn_async.request_flights.stats()["in_flight"] == 0
+        second = await sn_async.query_records("incident", f"sys_id={sys_id}", 1, use_cache=False)
+        await first
+        return second
+
+    assert run(scenario())["result"][0]["short_description"] == "after"
+
+def test_reading_records_tables_of_enclosing_tracked_flights(run):
+    flights = AsyncSingleFlight()
+
+    async def scenario():
+        async def handler():
+            coalesce.reading("incident")
+            await asyncio.sleep(0.01)
+            return "done"
+        task = asyncio.ensure_future(flights.do("key", handler, "tool", track=True))
+        await asyncio.sleep(0)
+        flights.forget("change_request")
+        kept = flights.stats()["in_flight"]
+        flights.forget("incident")
+        await task
+        return kept, flights.stats()["in_flight"]
+
+    assert run(scenario()) == (1, 0)
+    coalesce.reading("incident")  # outside a tracked flight: nothing to record
@@ -0,0 +1,14 @@
+# tests/test_concurrency.py
+import asyncio
+from servicenow_client import sn_async
+
+async def _burst(count: int) -> list:
+    # Distinct queries, so coalescing does not fold them into one request.
+    results = await asyncio.gather(*(sn_async.query_records("incident", f"number!=INC{n}", 1) for n in range(count)))
+    await sn_async.aclose()
+    return results
+
+def test_concurrency_ceiling_works_on_successive_loops(emulator, monkeypatch):
+    monkeypatch.setattr(sn_async, "SN_MAX_CONCURRENCY", 2)
+    assert len(asyncio.run(_burst(6))) == 6
+    assert len(asyncio.run(_burst(6))) == 6  # a semaphore bound to the first loop fails here
@@ -0,0 +1,59 @@
+# tests/test_cpupool.py
+import os
+import time
+import pytest
+from server import analytics, cmdb, cpupool
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = cpupool.ProcessPool(workers=1, timeout=60, enabled=True)
+    monkeypatch.setattr(cpupool, "pool", pool)
+    yield pool
+    pool.shutdown()
+
+def _in_thread(monkeypatch, pool: cpupool.ProcessPool):
+    monkeypatch.setattr(pool, "enabled", False)
+
+def test_analytics_fetch_in_parent_and_score_in_worker(emulator, run, pool, monkeypatch):
+    before = emulator.stats()["requests"]
+    pooled = run(analytics.predict_incident_trends("", horizon=5, dimension="priority"))
+    anomalies = run(analytics.anomaly_detection("", method="mad", dimension="category"))
+    requests = emulator.stats()["requests"] - before
+    assert pool.stats()["jobs"] == 2 and pool.stats()["started"] == 1
+
+    _in_thread(monkeypatch, pool)
+    before = emulator.stats()["requests"]
+    assert run(analytics.predict_incident_trends("", horizon=5, dimension="priority")) == pooled
+    assert run(analytics.anomaly_detection("", method="mad", dimension="category")) == anomalies
+    assert emulator.stats()["requests"] - before == requests  # the worker made no requests of its own
+    assert pool.stats()["jobs"] == 2
+
+def test_unknown_anomaly_method_fails_before_fetching(emulator, run, pool):
+    before = emulator.stats()["requests"]
+    with pytest.raises(ValueError):
+        run(analytics.anomaly_detection("", method="nope"))
+    assert emulator.stats()["requests"] == before and pool.stats()["jobs"] == 0
+
+def test_deduplicate_clusters_in_worker(emulator, store, run, pool, monkeypatch):
+    rows = store.select("cmdb_ci", "", limit=3)
+    store.insert_many("cmdb_ci", [{**row, "sys_id": f"dup{n}", "name": row["name"].upper()} for n, row in enumerate(rows)])
+    pooled = run(cmdb.deduplicate_ci(fuzzy=True))
+    assert pool.stats()["jobs"] == 1  # only the clustering; chunks are keyed in the server process
+    _in_thread(monkeypatch, pool)
+    in_thread = run(cmdb.deduplicate_ci(fuzzy=True))
+    assert pooled["clusters"] == in_thread["clusters"]
+    duplicates = {member["sys_id"] for cluster in pooled["clusters"] for member in cluster["members"]}
+    assert {f"dup{n}" for n in range(len(rows))} <= duplicates
+
+def test_coroutine_functions_are_refused(run, pool):
+    with pytest.raises(ValueError):
+        run(cpupool.run(analytics.predict_incident_trends))
+    assert pool.stats()["started"] == 0
+
+def test_timeout_stops_the_worker(run, pool):
+    assert run(cpupool.run(os.getpid)) != os.getpid()
+    with pytest.raises(TimeoutError):
+        run(cpupool.run(time.sleep, 30, timeout=0.5))
+    stats = pool.stats()
+    assert stats["timeouts"] == 1 and stats["killed"] == 1 and stats["busy"] == 0
+    assert run(cpupool.run(sum, [1, 2, 3])) == 6
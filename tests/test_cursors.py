@@ -0,0 +1,73 @@
+# tests/test_cursors.py
+import pytest
+from server import cmdb
+from servicenow_client import cursors, sn_async, sn_client
+
+QUERIES = ["active=true", "ORDERBYDESCpriority^ORDERBYnumber", "ORDERBYcategory", "priority=1^NQpriority=2^ORDERBYDESCopened_at"]
+
+def _walk(page, limit: int, query: str, cursor: str = None, **options) -> list:
+    rows = []
+    while True:
+        result = page("incident", query, limit, cursor, **options)
+        rows.extend(result["result"])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            return rows
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_cursor_pages_cover_the_query_once(emulator, store, query):
+    rows = _walk(sn_client.query_page, 17, query, fields=["number"])
+    ids = [row["sys_id"] for row in rows]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {row["sys_id"] for row in store.select("incident", query)}
+    assert set(rows[0]) >= {"number", "sys_id"}  # sort keys and sys_id are added to the projection
+
+def test_async_cursor_pages_match_sync(emulator, run):
+    query = "ORDERBYDESCpriority^ORDERBYnumber"
+
+    async def walk():
+        rows, cursor = [], None
+        while True:
+            result = await sn_async.query_page("incident", query, 23, cursor)
+            rows.extend(result["result"])
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return rows
+
+    assert [row["sys_id"] for row in run(walk())] == [row["sys_id"] for row in _walk(sn_client.query_page, 23, query)]
+
+def test_rows_inserted_before_the_cursor_do_not_shift_later_pages(emulator, store):
+    query = "ORDERBYnumber"
+    first = sn_client.query_page("incident", query, 50)
+    seen = [row["sys_id"] for row in first["result"]]
+    template = store.select("incident", "", limit=1)[0]
+    store.insert_many("incident", [{**template, "sys_id": f"early{n}", "number": f"INB000000{n}"} for n in range(5)])
+    rest = _walk(sn_client.query_page, 50, query, first["next_cursor"])
+    ids = seen + [row["sys_id"] for row in rest]
+    assert len(ids) == len(set(ids))
+    assert not any(sys_id.startswith("early") for sys_id in ids)
+    assert len(ids) == len(store.select("incident", "")) - 5
+
+def test_tampered_foreign_and_expired_cursors_are_refused(emulator):
+    token = sn_client.query_page("incident", "ORDERBYnumber", 5)["next_cursor"]
+    payload, signature = token.split(".")
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        sn_client.query_page("incident", "", 5, f"{payload[:-2]}AA.{signature}")
+    with pytest.raises(ValueError, match="issued for incident"):
+        sn_client.query_page("change_request", "", 5, token)
+    cursor = cursors.decode(token, "default", "incident")
+    with pytest.raises(ValueError, match="expired"):
+        sn_client.query_page("incident", "", 5, cursors.encode(cursor, ttl=-1))
+
+@pytest.mark.parametrize("query, clause", [
+    ("RLQUERYtask_sla.task,>=1^ENDRLQUERY^active=true", "RLQUERY"),
+    ("RLQUERYtask_sla.task,>=1^ENDRLQUERY^ORDERBYnumber", "RLQUERY"),
+    ("sys_idINSUBQUERYtask^active=true^ENDSUBQUERY^ORDERBYDESCpriority", "SUBQUERY"),
+])
+def test_positional_queries_are_refused_by_name(emulator, run, query, clause):
+    before = emulator.stats()["requests"]
+    with pytest.raises(ValueError, match=f"does not support {clause} clauses"):
+        sn_client.query_page("incident", query, 10)
+    with pytest.raises(ValueError, match=f"does not support {clause} clauses"):
+        run(cmdb.query_ci(query, 10))
+    assert emulator.stats()["requests"] == before
@@ -0,0 +1,42 @@
+# tests/test_dedup.py
+import asyncio
+from server import dedup
+
+async def _records(cis: list):
+    for ci in cis:
+        yield ci
+
+def _cluster(run_result: dict, sys_id: str) -> dict:
+    return next(cluster for cluster in run_result["clusters"] if sys_id in {m["sys_id"] for m in cluster["members"]})
+
+def test_generic_exact_keys_are_skipped():
+    cis = [{"sys_id": f"lh{i}", "name": "localhost", "ci_type": "server", "serial_number": f"lh-serial-{i}"}
+           for i in range(30)]
+    cis += [{"sys_id": "a1", "name": "web01", "ci_type": "server"},
+            {"sys_id": "a2", "name": "WEB01.corp.example.com", "ci_type": "server"},
+            {"sys_id": "b1", "name": "db01", "ci_type": "server", "serial_number": "SN-42"},
+            {"sys_id": "b2", "name": "db-one", "ci_type": "server", "serial_number": "sn42"}]
+    result = asyncio.run(dedup.find_duplicate_clusters(_records(cis), max_bucket=10))
+    assert result["stats"]["skipped_keys"] == 1
+    assert result["stats"]["clusters"] == 2
+    assert {m["sys_id"] for m in _cluster(result, "a1")["members"]} == {"a1", "a2"}
+    assert _cluster(result, "b1")["matched_on"] == ["serial_number"]
+    assert all(not member["sys_id"].startswith("lh") for cluster in result["clusters"] for member in cluster["members"])
+
+def test_chained_cluster_larger_than_one_lookup():
+    # CI i shares its name with i-1 or i+1 and its serial with the other, chaining 1200 records into one cluster.
+    cis = [{"sys_id": f"c{i}", "name": f"host{i // 2}", "ci_type": "server", "serial_number": f"serial{(i + 1) // 2}"}
+           for i in range(1200)]
+    result = asyncio.run(dedup.find_duplicate_clusters(_records(cis)))
+    assert result["stats"]["clusters"] == 1
+    members = result["clusters"][0]["members"]
+    assert [m["sys_id"] for m in members] == [f"c{i}" for i in range(1200)]
+    assert result["clusters"][0]["matched_on"] == ["name", "serial_number"]
+
+def test_fuzzy_names_are_confirmed_by_similarity():
+    cis = [{"sys_id": "f1", "name": "payroll-app-prod", "ci_type": "app"},
+           {"sys_id": "f2", "name": "payroll-app-prd", "ci_type": "app"},
+           {"sys_id": "f3", "name": "billing", "ci_type": "app"}]
+    result = asyncio.run(dedup.find_duplicate_clusters(_records(cis), fuzzy=True, similarity=0.6))
+    assert [sorted(m["sys_id"] for m in c["members"]) for c in result["clusters"]] == [["f1", "f2"]]
+    assert result["clusters"][0]["matched_on"] == ["fuzzy_name"]
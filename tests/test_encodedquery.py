@@ -0,0 +1,60 @@
+# tests/test_encodedquery.py
+import pytest
+from servicenow_client import instances, sn_client
+from servicenow_client.encodedquery import Query, Condition, Raw, canonical, and_, ids_in
+
+ROUND_TRIPS = [
+    "active=true^priority=1",
+    "priority=1^ORpriority=2^state!=7",
+    "priority=1^NQcategory=network^ORDERBYDESCopened_at^ORDERBYnumber",
+    "short_descriptionLIKEa^^b^active=true",
+    "sys_idINa,b,c^assigned_toISEMPTY",
+    "opened_at>=javascript:gs.daysAgoStart(7)",
+    "RLQUERYtask_sla.task,>=1^ENDRLQUERY^active=true",
+]
+
+@pytest.mark.parametrize("text", ROUND_TRIPS)
+def test_parse_encode_round_trip(text):
+    query = Query.parse(text)
+    assert query.encode() == text
+    assert Query.parse(query.encode()).encode() == text
+    assert canonical(canonical(text)) == canonical(text)
+
+def test_values_with_caret_cannot_break_the_clause_structure():
+    query = Query().where("short_description", "LIKE", "disk^NQactive=false")
+    assert query.encode() == "short_descriptionLIKEdisk^^NQactive=false"
+    assert Query.parse(query.encode()).groups == [[(Condition("short_description", "LIKE", "disk^NQactive=false"),)]]
+
+def test_canonical_form_ignores_clause_order_whitespace_and_duplicates():
+    assert canonical("priority=1 ^ active=true") == canonical("active=true^priority=1^active=true")
+    assert canonical("sys_idINc,a,b^ORnumber=1") == canonical("number=1^ORsys_idINb,a,c")
+    assert canonical("a=1^NQb=2") == canonical("b=2^NQa=1")
+    assert canonical("ORDERBYnumber^ORDERBYpriority") != canonical("ORDERBYpriority^ORDERBYnumber")
+    assert isinstance(Query.parse("x=javascript:gs.now()").groups[0][0][0], Raw)
+
+def test_and_combines_every_group_and_keeps_positional_queries_verbatim():
+    assert and_("a=1^NQb=2", "c=3") == "a=1^c=3^NQb=2^c=3"
+    assert and_("", None, "a=1") == "a=1"
+    assert and_("RLQUERYx.y,>=1^ENDRLQUERY", "a=1") == "RLQUERYx.y,>=1^ENDRLQUERY^a=1"
+    with pytest.raises(ValueError):
+        Query.parse("RLQUERYx.y,>=1^ENDRLQUERY").and_("a=1^NQb=2")
+    assert ids_in(["b", "a", "b", None]) == "sys_idINa,b"
+
+@pytest.mark.parametrize("text", [
+    "active=true^priority=1^ORpriority=2",
+    "priority=1^NQcategory=network^active=false",
+    "sys_idINx,y^ORpriority=3",
+])
+def test_canonical_query_returns_the_same_rows(emulator, store, text):
+    expected = {row["sys_id"] for row in store.select("incident", text)}
+    assert expected
+    rows = sn_client.query_records("incident", canonical(text), 1000, use_cache=False)["result"]
+    assert {row["sys_id"] for row in rows} == expected
+
+def test_equivalent_queries_share_one_cache_entry(emulator):
+    instances.current().cache.enabled = True
+    before = emulator.stats()["requests"]
+    first = sn_client.query_records("incident", "active=true ^ priority=1", 10)
+    second = sn_client.query_records("incident", "priority=1^active=true", 10)
+    assert first == second
+    assert emulator.stats()["requests"] - before == 1
@@ -0,0 +1,67 @@
+# tests/test_oauth.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from benchmarks import emulator as em
+from servicenow_client import instances, sn_async, sn_client
+
+@pytest.fixture
+def oauth(store):
+    server = em.Emulator(store)
+    instance = instances.register("default", server.start(), auth_method="oauth", client_id="client", client_secret="secret")
+    instance.cache.enabled = False
+    yield server, instance
+    instance.close_session()
+    server.stop()
+
+def _revoke(server: em.Emulator, refresh_tokens: bool = False) -> None:
+    with server._lock:
+        server._tokens.clear()
+        if refresh_tokens:
+            server._refresh_tokens.clear()
+
+def test_concurrent_callers_share_one_token_request(oauth):
+    server, instance = oauth
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda n: sn_client.query_records("incident", f"number!=INC{n}", 1), range(8)))
+    assert all(result["result"] for result in results)
+    assert server.stats()["tokens_issued"] == 1 and server.stats()["unauthorized"] == 0
+    assert instance.tokens.stats()["refreshes"] == 1
+
+def test_token_is_refreshed_in_the_background_before_expiry(oauth, run):
+    server, instance = oauth
+    server.token_ttl = 2  # shorter than the margin: refreshed after half its lifetime
+    sn_client.query_records("incident", "", 1)
+    assert run(sn_async.query_records("incident", "priority=3", 1))["result"]
+    assert instance.tokens.stats()["proactive_refreshes"] == 0
+    time.sleep(1.1)
+    assert run(sn_async.query_records("incident", "priority=1", 1))["result"]  # served with the current token
+    deadline = time.time() + 5
+    while instance.tokens.stats()["refreshes"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    stats = instance.tokens.stats()
+    assert stats["proactive_refreshes"] == 1 and stats["refresh_token_grants"] == 1
+    assert server.stats()["tokens_issued"] == 2 and server.stats()["unauthorized"] == 0
+
+def test_rejected_token_is_replaced_and_the_request_retried(oauth, run):
+    server, instance = oauth
+    sn_client.query_records("incident", "", 1)
+    _revoke(server)
+    assert sn_client.query_records("incident", "priority=1", 1)["result"]
+    assert instance.tokens.stats()["invalidations"] == 1 and instance.tokens.stats()["refresh_token_grants"] == 1
+
+    _revoke(server, refresh_tokens=True)
+    assert run(sn_async.query_records("incident", "priority=2", 1))["result"]
+    stats = instance.tokens.stats()
+    assert stats["refresh_token_rejected"] == 1 and stats["refreshes"] == 3
+    assert server.stats()["unauthorized"] == 2
+
+def test_async_waiters_share_one_refresh(oauth, run):
+    server, _ = oauth
+
+    async def scenario():
+        return await asyncio.gather(*(sn_async.query_records("incident", f"number!=INC{n}", 1) for n in range(10)))
+
+    assert all(result["result"] for result in run(scenario()))
+    assert server.stats()["tokens_issued"] == 1
@@ -0,0 +1,37 @@
+# tests/test_paging.py
+import pytest
+from servicenow_client import sn_client, sn_async
+from servicenow_client.sn_client import _keyset_query
+
+QUERIES = ["active=true^ORDERBYnumber", "priority=1^ORDERBYDESCopened_at", "priority=1^NQpriority=2^ORDERBYnumber"]
+
+def _expected(store, query: str) -> set:
+    return {row["sys_id"] for row in store.select("incident", query)}
+
+def test_keyset_query_drops_caller_order():
+    assert _keyset_query("active=true^ORDERBYnumber", "abc") == "active=true^sys_id>abc^ORDERBYsys_id"
+    assert _keyset_query("priority=1^NQpriority=2^ORDERBYDESCnumber", "abc") == \
+        "priority=1^sys_id>abc^NQpriority=2^sys_id>abc^ORDERBYsys_id"
+
+def test_keyset_query_drops_order_of_positional_query():
+    query = _keyset_query("active=true^RLQUERYtask_sla.task,>=1^ENDRLQUERY^ORDERBYnumber", "abc")
+    assert "ORDERBYnumber" not in query and query.endswith("^sys_id>abc^ORDERBYsys_id")
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_iter_records_keyset_returns_every_row_once(emulator, store, query):
+    ids = [record["sys_id"] for record in sn_client.iter_records("incident", query, page_size=25, fields=["number"])]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == _expected(store, query)
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_aiter_records_keyset_returns_every_row_once(emulator, store, run, query):
+    async def scan(stream: bool):
+        return [record["sys_id"] async for record in
+                sn_async.aiter_records("incident", query, page_size=25, fields=["number"], stream=stream)]
+    for stream in (False, True):
+        ids = run(scan(stream))
+        assert len(ids) == len(set(ids))
+        assert set(ids) == _expected(store, query)
+
+def test_iter_records_max_records(emulator):
+    assert len(list(sn_client.iter_records("incident", "ORDERBYnumber", page_size=20, max_records=45))) == 45
@@ -0,0 +1,89 @@
+# tests/test_readbatch.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+import requests
+from benchmarks import emulator as em
+from servicenow_client import instances, sn_async, sn_client
+
+MISSING = "0" * 32
+
+@pytest.fixture
+def slow(store):
+    # Every response takes 100 ms, so a batch stays in flight long enough for others to queue behind it.
+    server = em.Emulator(store, latency_ms=100)
+    instance = instances.register("default", server.start(), username="test", password="test")
+    instance.cache.enabled = False
+    yield server
+    instance.close_session()
+    server.stop()
+
+def _ids(store, count: int) -> list:
+    return [row["sys_id"] for row in store.select("incident", "", limit=count)]
+
+def test_gathered_reads_share_one_query_and_missing_id_gets_404(emulator, store, run):
+    ids = _ids(store, 3)
+
+    async def scenario():
+        return await asyncio.gather(*(sn_async.read_record("incident", sys_id) for sys_id in ids + [MISSING, ids[0]]),
+                                    return_exceptions=True)
+
+    before = emulator.stats()["requests"]
+    results = run(scenario())
+    assert emulator.stats()["requests"] - before == 1
+    assert [result["result"]["sys_id"] for result in results[:3]] == ids
+    assert isinstance(results[3], httpx.HTTPStatusError) and results[3].response.status_code == 404
+    assert results[4] == results[0] and results[4] is not results[0]
+
+def test_lone_read_is_not_delayed_by_the_window(emulator, store, run, monkeypatch):
+    monkeypatch.setattr(sn_async.read_batcher, "window", 5.0)
+    monkeypatch.setattr(sn_client.read_batcher, "window", 5.0)
+    sys_id = _ids(store, 1)[0]
+    started = time.perf_counter()
+    assert run(sn_async.read_record("incident", sys_id))["result"]["sys_id"] == sys_id
+    assert sn_client.read_record("incident", sys_id)["result"]["sys_id"] == sys_id
+    assert time.perf_counter() - started < 2.0
+    with pytest.raises(requests.HTTPError) as raised:
+        sn_client.read_record("incident", MISSING)
+    assert raised.value.response.status_code == 404
+
+def test_reads_queued_behind_an_in_flight_batch_wait_for_the_window(slow, store, run, monkeypatch):
+    monkeypatch.setattr(sn_async.read_batcher, "window", 0.05)
+    ids = _ids(store, 5)
+
+    async def scenario():
+        first = asyncio.ensure_future(sn_async.read_record("incident", ids[0]))
+        await asyncio.sleep(0.01)
+        later = []
+        for sys_id in ids[1:] + [MISSING]:
+            later.append(asyncio.ensure_future(sn_async.read_record("incident", sys_id)))
+            await asyncio.sleep(0.005)  # separate loop iterations, all inside the window
+        return await first, await asyncio.gather(*later, return_exceptions=True)
+
+    before = slow.stats()["requests"]
+    first, later = run(scenario())
+    assert slow.stats()["requests"] - before == 2
+    assert first["result"]["sys_id"] == ids[0]
+    assert [result["result"]["sys_id"] for result in later[:-1]] == ids[1:]
+    assert isinstance(later[-1], httpx.HTTPStatusError) and later[-1].response.status_code == 404
+
+def test_threaded_reads_batch_behind_an_in_flight_read(slow, store, monkeypatch):
+    monkeypatch.setattr(sn_client.read_batcher, "window", 0.05)
+    ids = _ids(store, 5)
+
+    def read(sys_id):
+        try:
+            return sn_client.read_record("incident", sys_id)
+        except requests.HTTPError as e:
+            return e
+
+    with ThreadPoolExecutor(6) as pool:
+        first = pool.submit(read, ids[0])
+        time.sleep(0.01)
+        later = [pool.submit(read, sys_id) for sys_id in ids[1:] + [MISSING]]
+        results = [first.result()] + [future.result() for future in later]
+    assert slow.stats()["requests"] == 2
+    assert [result["result"]["sys_id"] for result in results[:-1]] == ids
+    assert results[-1].response.status_code == 404
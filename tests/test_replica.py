@@ -0,0 +1,71 @@
+# tests/test_replica.py
+import threading
+import pytest
+from servicenow_client import replica
+from servicenow_client.replica import Replica
+
+@pytest.fixture
+def local(emulator, tmp_path, monkeypatch):
+    store = Replica(path=str(tmp_path / "replica.sqlite"), tables=["incident"], enabled=True)
+    store.sync(full=True)
+    monkeypatch.setattr(replica, "replica_store", store)
+    return store
+
+def test_aiter_records_reads_the_replica_in_worker_threads(local, store, emulator, run, monkeypatch):
+    threads = set()
+    select_batches = local.select_batches
+    def tracked(*args, **kwargs):
+        batches = select_batches(*args, **kwargs)
+        def wrapped():
+            for batch in batches:
+                threads.add(threading.get_ident())
+                yield batch
+        return wrapped()
+    monkeypatch.setattr(local, "select_batches", tracked)
+    requests = emulator.stats()["requests"]
+
+    async def scan():
+        return [record async for record in replica.aiter_records("incident", "priority=1^ORDERBYnumber", fields=["number"])]
+    records = run(scan())
+    assert emulator.stats()["requests"] == requests
+    assert sorted(record["number"] for record in records) == sorted(row["number"] for row in store.select("incident", "priority=1"))
+    assert threads and threading.get_ident() not in threads
+
+def test_aiter_records_stops_early_and_limits(local, run):
+    async def first(limit: int, take: int):
+        taken = []
+        async for record in replica.aiter_records("incident", "", max_records=limit):
+            taken.append(record)
+            if len(taken) == take:
+                break
+        return taken
+    assert len(run(first(None, 5))) == 5
+    assert len(run(first(7, 100))) == 7
+
+def test_count_runs_in_a_thread_and_matches(local, store, run):
+    counts = run(replica.count("incident", "active=true", "priority"))
+    expected = {}
+    for row in store.select("incident", "active=true"):
+        expected[row["priority"]] = expected.get(row["priority"], 0) + 1
+    assert counts == expected
+
+def test_display_value_reads_go_to_the_instance(local, emulator, run):
+    requests = emulator.stats()["requests"]
+    async def scan():
+        return [record async for record in replica.aiter_records("incident", "priority=1", display_value="true")]
+    assert run(scan())
+    assert emulator.stats()["requests"] > requests
+
+def test_freshness_is_read_once_and_off_the_event_loop(local, run, monkeypatch):
+    threads = []
+    state = local._state
+    monkeypatch.setattr(local, "_state", lambda table: threads.append(threading.get_ident()) or state(table))
+    local._synced_at.clear()
+
+    async def check():
+        return [await replica.covers("incident") for _ in range(20)], threading.get_ident()
+
+    covered, loop_thread = run(check())
+    assert all(covered) and len(threads) == 1 and loop_thread not in threads
+    local.max_lag = 0
+    assert not run(replica.covers("incident"))
@@ -0,0 +1,37 @@
+# tests/test_reporting.py
+import asyncio
+import pytest
+from servicenow_client import sn_async
+from server import reporting
+from config import SN_REPORT_AGGREGATE_CONCURRENCY
+
+@pytest.fixture
+def in_flight(monkeypatch):
+    counts = {"now": 0, "max": 0, "calls": 0}
+    aggregate_records = sn_async.aggregate_records
+    async def tracked(*args, **kwargs):
+        counts["now"] += 1
+        counts["calls"] += 1
+        counts["max"] = max(counts["max"], counts["now"])
+        try:
+            await asyncio.sleep(0.01)
+            return await aggregate_records(*args, **kwargs)
+        finally:
+            counts["now"] -= 1
+    monkeypatch.setattr(sn_async, "aggregate_records", tracked)
+    return counts
+
+def test_trend_counts_with_bounded_concurrency(emulator, store, run, in_flight):
+    report = run(reporting.generate_incident_report("active=true", trend_interval="day", trend_buckets=30))
+    buckets = reporting.trend_buckets("day", 30)
+    assert in_flight["calls"] == 3 + len(buckets)
+    assert in_flight["max"] <= SN_REPORT_AGGREGATE_CONCURRENCY
+    assert report["source"] == "aggregate"
+    assert report["total"] == len(store.select("incident", "active=true"))
+    for label, start, end in buckets:
+        expected = len(store.select("incident", f"active=true^opened_at>={start}^opened_at<{end}"))
+        assert report["trend"]["counts"][label] == expected
+
+def test_trend_bucket_cap(emulator, run):
+    with pytest.raises(ValueError, match="between 1 and"):
+        run(reporting.generate_incident_report(trend_interval="day", trend_buckets=reporting.MAX_TREND_BUCKETS + 1))
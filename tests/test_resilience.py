@@ -0,0 +1,129 @@
+# tests/test_resilience.py
+import asyncio
+import time
+from urllib.parse import urlsplit
+import pytest
+import requests
+from benchmarks import emulator as em
+from servicenow_client import instances, resilience, sn_async, sn_client
+from servicenow_client.resilience import CircuitOpenError, TokenBucket
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(resilience, "SN_RETRY_BASE_DELAY", 0.001)
+
+@pytest.fixture
+def throttling(store):
+    # Three requests in ten are answered 429 with "Retry-After: 0".
+    server = em.Emulator(store, throttle=0.3, retry_after=0, seed=1)
+    instance = instances.register("default", server.start(), username="test", password="test")
+    instance.cache.enabled = False
+    yield server
+    instance.close_session()
+    server.stop()
+
+def _guard():
+    instance = instances.current()
+    return resilience.guard_for(instance.url, instance.principal)
+
+def test_token_bucket_paces_requests_past_the_burst():
+    bucket = TokenBucket(rate=100, burst=5)
+    waits = [bucket.reserve() for _ in range(10)]
+    assert waits[:5] == [0.0] * 5
+    assert waits[5:] == sorted(waits[5:]) and waits[-1] == pytest.approx(0.05, abs=0.01)
+    bucket.throttled()
+    bucket.throttled()  # the same throttle event: one decrease
+    assert bucket.rate == 50
+
+def test_requests_are_paced_to_the_rate_limit(emulator):
+    guard = _guard()
+    guard.limiter = TokenBucket(rate=20, burst=2)
+    started = time.monotonic()
+    for n in range(10):
+        sn_client.query_records("incident", f"number!=INC{n}", 1)
+    assert time.monotonic() - started >= 0.35  # 8 requests past the burst at 20/s
+
+def test_throttled_calls_are_retried_and_slow_the_rate(throttling, store):
+    for n in range(20):
+        assert sn_client.query_records("incident", f"number!=INC{n}", 1)["result"]
+    created = [sn_client.create_record("change_request", {"short_description": f"throttled {n}"}) for n in range(10)]
+    stats = _guard().stats()
+    assert throttling.stats()["throttled"] > 0 and stats["throttled"] == throttling.stats()["throttled"]
+    assert stats["rate"] < stats["max_rate"]
+    # A 429 was not processed, so retried creates do not duplicate records.
+    assert len(store.select("change_request", "short_descriptionSTARTSWITHthrottled")) == len(created)
+
+def test_breaker_opens_fails_fast_and_recovers(emulator, monkeypatch):
+    port = urlsplit(instances.current().url).port
+    guard = _guard()
+    monkeypatch.setattr(guard.breaker, "reset_timeout", 0.2)
+    emulator.stop()
+    with pytest.raises((requests.ConnectionError, CircuitOpenError)):
+        sn_client.query_records("incident", "", 1)
+    assert guard.breaker.state == "open"
+    before = guard.stats()["rejected"]
+    with pytest.raises(CircuitOpenError):
+        sn_client.query_records("incident", "priority=1", 1)
+    assert guard.stats()["rejected"] == before + 1
+
+    emulator.start(port=port)
+    time.sleep(0.25)
+    assert sn_client.query_records("incident", "priority=2", 1)["result"]  # the half-open trial succeeds
+    assert guard.breaker.state == "closed" and guard.breaker.opened == 1
+
+def _half_open(guard, monkeypatch):
+    # Open the breaker with no reset delay: the next request is the half-open trial.
+    monkeypatch.setattr(guard.breaker, "reset_timeout", 0)
+    for _ in range(guard.breaker.failure_threshold):
+        guard.breaker.failure()
+    assert guard.breaker.state == "open"
+
+def test_reauthenticated_trial_keeps_its_admission(store, monkeypatch):
+    server = em.Emulator(store)
+    instance = instances.register("default", server.start(), auth_method="oauth", client_id="client", client_secret="secret")
+    instance.cache.enabled = False
+    try:
+        sn_client.query_records("incident", "", 1)
+        with server._lock:
+            server._tokens.clear()  # the trial is answered 401
+        guard = _guard()
+        _half_open(guard, monkeypatch)
+        assert sn_client.query_records("incident", "priority=1", 1)["result"]
+        assert guard.breaker.state == "closed" and guard.stats()["rejected"] == 0
+    finally:
+        instance.close_session()
+        server.stop()
+
+def test_trial_that_fails_before_sending_is_released(emulator, monkeypatch):
+    guard = _guard()
+    _half_open(guard, monkeypatch)
+
+    def broken(instance):
+        raise RuntimeError("no credentials")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sn_client, "_auth_kwargs", broken)
+        with pytest.raises(RuntimeError):
+            sn_client.query_records("incident", "", 1)
+    assert sn_client.query_records("incident", "priority=1", 1)["result"]
+    assert guard.breaker.state == "closed"
+
+def test_cancelled_trial_is_released(store, monkeypatch, run):
+    server = em.Emulator(store, latency_ms=500)
+    instance = instances.register("default", server.start(), username="test", password="test")
+    instance.cache.enabled = False
+    try:
+        guard = _guard()
+        _half_open(guard, monkeypatch)
+
+        async def scenario():
+            with pytest.raises(asyncio.TimeoutError):  # a write: not shared with other callers, so really cancelled
+                await asyncio.wait_for(sn_async.create_record("change_request", {"short_description": "cancelled"}), 0.1)
+            server.latency = 0
+            return await sn_async.query_records("incident", "priority=1", 1)
+
+        assert run(scenario())["result"]
+        assert guard.breaker.state == "closed"
+    finally:
+        instance.close_session()
+        server.stop()
@@ -0,0 +1,22 @@
+# tests/test_tool_results.py
+import json
+import main
+from servicenow_client import telemetry
+
+def _observed(histogram, **labels) -> tuple:
+    for series_labels, _, total, count, _ in histogram.series():
+        if series_labels == labels:
+            return total, count
+    return 0.0, 0
+
+def test_call_tool_serializes_result_once_and_records_its_size(emulator, store, run, monkeypatch):
+    sys_id = store.select("incident", "", limit=1)[0]["sys_id"]
+    dumps = []
+    real_dumps = json.dumps
+    monkeypatch.setattr(json, "dumps", lambda *args, **kwargs: dumps.append(args[0]) or real_dumps(*args, **kwargs))
+    total, count = _observed(telemetry.TOOL_RESULT_BYTES, tool="itsm_read_incident")
+    content, structured = run(main.call_tool("itsm_read_incident", {"sys_id": sys_id}))
+    assert json.loads(content[0].text) == structured
+    assert structured["result"]["result"]["sys_id"] == sys_id
+    assert sum(value is structured for value in dumps) == 1
+    assert _observed(telemetry.TOOL_RESULT_BYTES, tool="itsm_read_incident") == (total + len(content[0].text), count + 1)
@@ -0,0 +1,70 @@
+# tests/test_workflow.py
+import pytest
+from server import workflow
+
+@pytest.fixture
+def provisioning(emulator, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(workflow.checkpoints, "path", str(tmp_path / "workflows.sqlite"))
+    monkeypatch.setattr(workflow.checkpoints, "_ready", False)
+    async def identify_groups(roles):  # the emulator does not evaluate dot-walked fields (role.name)
+        return ["g1", "g2"] if roles else []
+    monkeypatch.setattr(workflow, "identify_groups", identify_groups)
+    store.insert_many("sc_req_item", [{"sys_id": "ritm1", "u_requested_roles": "itil, admin", "state": "1"}])
+    store.insert_many("sys_user", [{"sys_id": "user1", "user_name": "jdoe", "active": "true"}])
+    store.insert_many("sys_user_group", [{"sys_id": "g1", "manager": "m1"}, {"sys_id": "g2", "manager": "m2"}])
+    return store
+
+def _approve(store, state: str, approver: str = None) -> None:
+    for approval in store.select("sysapproval_approver", "sysapproval=ritm1"):
+        if approver in (None, approval["approver"]):
+            store.update("sysapproval_approver", approval["sys_id"], {"state": state})
+
+def test_groups_are_only_assigned_after_every_approval(provisioning, run):
+    with pytest.raises(ValueError, match="Waiting for approval of groups \\['g1', 'g2'\\]"):
+        run(workflow.process_access_provisioning("ritm1", "user1"))
+    assert sorted(a["approver"] for a in provisioning.select("sysapproval_approver", "sysapproval=ritm1")) == ["m1", "m2"]
+    assert provisioning.select("sys_user_grmember", "user=user1") == []
+
+    _approve(provisioning, "approved", "m1")
+    with pytest.raises(ValueError, match="Waiting for approval of groups \\['g2'\\]"):
+        run(workflow.process_access_provisioning("ritm1", "user1"))
+    assert provisioning.select("sys_user_grmember", "user=user1") == []
+
+    _approve(provisioning, "approved")
+    result = run(workflow.process_access_provisioning("ritm1", "user1"))
+    assert result["groups_added"] == ["g1", "g2"]
+    assert result["steps"]["request_approvals"]["status"] == "resumed"
+    assert sorted(m["group"] for m in provisioning.select("sys_user_grmember", "user=user1")) == ["g1", "g2"]
+    assert provisioning.get("sc_req_item", "ritm1")["state"] == "3"
+    assert len(provisioning.select("sysapproval_approver", "sysapproval=ritm1")) == 2
+
+def test_rejection_grants_nothing(provisioning, run):
+    with pytest.raises(ValueError):
+        run(workflow.process_access_provisioning("ritm1", "user1"))
+    _approve(provisioning, "approved", "m1")
+    _approve(provisioning, "rejected", "m2")
+    with pytest.raises(ValueError, match="rejected"):
+        run(workflow.process_access_provisioning("ritm1", "user1"))
+    assert provisioning.select("sys_user_grmember", "user=user1") == []
+    assert provisioning.get("sc_req_item", "ritm1")["state"] == "1"
+
+def test_retry_after_a_partial_assignment_adds_no_duplicates(provisioning, run, monkeypatch):
+    with pytest.raises(ValueError):
+        run(workflow.process_access_provisioning("ritm1", "user1"))
+    _approve(provisioning, "approved")
+    create_record = workflow.sn_async.create_record
+
+    async def failing(table, data, *args, **kwargs):
+        if table == "sys_user_grmember" and data["group"] == "g2":
+            raise RuntimeError("instance unavailable")
+        return await create_record(table, data, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(workflow.sn_async, "create_record", failing)
+        with pytest.raises(RuntimeError):
+            run(workflow.process_access_provisioning("ritm1", "user1"))
+    assert [m["group"] for m in provisioning.select("sys_user_grmember", "user=user1")] == ["g1"]
+
+    result = run(workflow.process_access_provisioning("ritm1", "user1"))
+    assert result["groups_added"] == ["g2"]
+    assert sorted(m["group"] for m in provisioning.select("sys_user_grmember", "user=user1")) == ["g1", "g2"]